@@ -0,0 +1,258 @@
+"""
+What the Flask app and the ASGI service share to answer /api/providers:
+reading which page of which filters is asked for and building that page of
+ranked providers as JSON.
+
+The page after the last one sent is asked for by passing back its signed cursor,
+which carries the filters and the offset of the next page along with the token of
+the ranking of the first page, kept in a RankingCache, so every page of a query is
+read from the same order however the returned counts move in between.
+Asking with explain=true adds how the filter ran, see ProviderList.explain().
+Asking with match=true ranks providers by how close they come to the skills, rating and
+birth date asked for instead of only keeping those meeting all of them, see ProviderList.match().
+"""
+
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Mapping, NamedTuple, Optional, Tuple
+import numpy as np
+from itsdangerous import BadSignature, URLSafeSerializer
+from helpers import build_filter_option_from_args, build_filter_option_from_json
+from providers_types import Filter_Options
+from constants import PAGE_SIZE, API_MAX_LIMIT
+
+DEFAULT_RANKING_ENTRIES = 256
+# positions held across every kept ranking, 64 MB of int64 positions
+DEFAULT_RANKING_ROWS = 2 ** 23
+
+class ApiError(ValueError):
+    """A request the API cannot answer, sent back as <status> with an error <message>"""
+
+    def __init__(self, message: str, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+class PageRequest(NamedTuple):
+    """Which page of the providers kept by <filters> is asked for"""
+    filters: Filter_Options
+    limit: int
+    offset: int
+    # providers are only counted as returned for the first page of a query
+    count_returned: bool
+    # whether to add how the filter ran to the page
+    explain: bool = False
+    # whether to rank by relevance to the filters instead of filtering by them
+    match: bool = False
+    # token in the RankingCache of the order of the first page, for later pages
+    ranking: Optional[str] = None
+
+class RankingCache:
+    """
+    Thread safe LRU cache of the ranked positions of queries being paged through,
+    keyed by the token their cursors carry, so the later pages of a query are read
+    from the order its first page was ranked in instead of being ranked again.
+    Every entry is tied to the version of the store it was ranked on and is
+    dropped once the store has changed.
+
+    Holds at most <max_entries> rankings and <max_rows> positions in total,
+    evicting the least recently used rankings first.
+    """
+
+    def __init__(self, max_entries=DEFAULT_RANKING_ENTRIES, max_rows=DEFAULT_RANKING_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[str, Tuple[int, np.ndarray]]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<RankingCache with {len(self)} rankings of {self._rows} positions>"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token: str, version: int) -> Optional[np.ndarray]:
+        """Returns the positions ranked for <token> on the store <version>, None if there are none"""
+
+        with self._lock:
+            entry = self._entries.get(token)
+
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(token)
+                return None
+
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def put(self, version: int, rows: np.ndarray) -> Optional[str]:
+        """
+        Keeps the ranked positions in <rows> of the store <version> and returns
+        their token, None if there are too many to keep
+        """
+
+        if len(rows) > self.max_rows:
+            return None
+
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._entries[token] = (version, rows)
+            self._rows += len(rows)
+
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+
+        return token
+
+    def _remove(self, token: str):
+        """Internal method to drop the ranking for <token>, with the lock held"""
+
+        (_, rows) = self._entries.pop(token)
+        self._rows -= len(rows)
+
+def cursor_serializer(secret_key: str) -> URLSafeSerializer:
+    """Signs cursors with <secret_key> so clients cannot forge their filters"""
+
+    return URLSafeSerializer(secret_key, salt="api-providers-cursor")
+
+def _flag(body: Mapping, name: str, from_json: bool) -> bool:
+    """Internal function reading the true or false param <name> of <body>, false if missing"""
+
+    value = body.get(name, False)
+    if not from_json and isinstance(value, str):
+        value = value.lower() == "true"
+    if not isinstance(value, bool):
+        raise ApiError(f"{name} should be true or false")
+    return value
+
+def read_page_request(body: Mapping, cursors: URLSafeSerializer, from_json=False) -> PageRequest:
+    """
+    Reads the page asked for by <body>, the query params of a GET or, if <from_json>,
+    the JSON object body of a POST. Raises ApiError if it cannot be answered.
+    """
+
+    if not isinstance(body, Mapping):
+        raise ApiError("expected a JSON object body")
+
+    cursor = body.get("cursor")
+    limit = body.get("limit", PAGE_SIZE)
+    explain = _flag(body, "explain", from_json)
+    match = _flag(body, "match", from_json)
+
+    try:
+        limit = int(limit)
+        if not 0 < limit <= API_MAX_LIMIT:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ApiError(f"limit should be a number from 1 to {API_MAX_LIMIT}")
+
+    if cursor is not None:
+        try:
+            (filters, offset, *rest) = cursors.loads(cursor)
+            # cursors carry the mode of the query and the token of its ranking
+            (mode, ranking) = (rest + [None, None])[:2]
+            if ranking is not None and not isinstance(ranking, str):
+                raise ValueError
+            return PageRequest(build_filter_option_from_json(filters), limit, int(offset), False,
+                               explain, mode == "match", ranking)
+        except (BadSignature, TypeError, ValueError):
+            raise ApiError("cursor is not valid")
+
+    try:
+        if from_json:
+            filters = build_filter_option_from_json(body.get("filters", {}))
+        else:
+            filters = build_filter_option_from_args(body)
+    except ValueError as error:
+        raise ApiError(str(error))
+
+    return PageRequest(filters, limit, 0, True, explain, match)
+
+def providers_page(providers, page: PageRequest, cursors: URLSafeSerializer,
+                   rankings: RankingCache) -> Tuple[object, bytes]:
+    """
+    Filters and ranks a view of the ProviderList <providers> for <page> and returns
+    the view along with the JSON body holding the page of providers, the total
+    number of providers kept and the cursor of the next page, null on the last page.
+    If the page asks to explain the filter the body also holds its QueryExplanation,
+    which relevance ranked pages leave out as they run no QueryPlan of every filter.
+
+    A query with more than one page is ranked in full and its order kept in <rankings>
+    for the cursors of its later pages, so no provider is sent twice or skipped while
+    the returned counts move. A later page whose ranking is no longer kept, as once the
+    store has changed or when it is asked of another process, is ranked again.
+    """
+
+    view = providers.view()
+    tail = {}
+    rows = None if page.ranking is None else rankings.get(page.ranking, providers.store.version)
+
+    if rows is not None:
+        view._rows = rows
+        if page.explain and not page.match:
+            tail["explain"] = providers.view().explain(page.filters, count_returned=False,
+                                                       trace_allocations=False).to_dict()
+    elif page.match:
+        # put in order in full, as whether there is a next page is only known afterwards
+        view.match(page.filters, count_returned=page.count_returned)
+    else:
+        if page.explain:
+            # never traces allocations, which would slow down every request of the process
+            tail["explain"] = view.explain(page.filters, count_returned=page.count_returned,
+                                           trace_allocations=False).to_dict()
+        else:
+            view.filter(page.filters, count_returned=page.count_returned)
+        # only a query with later pages to read from the same order is ranked in full
+        end = page.offset + page.limit
+        view.rank(None if end < len(view) else end)
+
+    total = len(view)
+    next_cursor = None
+    if page.offset + page.limit < total:
+        ranking = page.ranking if rows is not None else rankings.put(providers.store.version,
+                                                                     view._rows)
+        next_cursor = cursors.dumps([page.filters, page.offset + page.limit,
+                                     "match" if page.match else "filter", ranking])
+
+    providers_json = view.to_json(with_returned=True, limit=page.limit, offset=page.offset)
+    tail = json.dumps({"total": total, "next_cursor": next_cursor, **tail})
+
+    return (view, b'{"providers":' + providers_json + b"," + tail[1:].encode())
+
+def similar_page(providers, args: Mapping) -> bytes:
+    """
+    Returns the JSON body of the providers most similar to the skills of the query
+    params <args>, e.g. skills=Unix,Java&limit=20, or to the provider with the id in
+    provider=7, from most to least similar. Raises ApiError if it cannot be answered.
+    """
+
+    try:
+        limit = int(args.get("limit", PAGE_SIZE))
+        if not 0 < limit <= API_MAX_LIMIT:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ApiError(f"limit should be a number from 1 to {API_MAX_LIMIT}")
+
+    view = providers.view()
+    skills = [skill.strip() for values in args.getlist("skills")
+              for skill in values.split(",") if skill.strip()]
+
+    if args.get("provider"):
+        try:
+            view.similar_to_provider(int(args.get("provider")), limit)
+        except ValueError:
+            raise ApiError("provider should be the id of a provider")
+        except KeyError as error:
+            raise ApiError(error.args[0], 404)
+    elif skills:
+        view.similar_to_skills(skills, limit)
+    else:
+        raise ApiError("expected skills or a provider to find similar providers to")
+
+    return b'{"providers":' + view.to_json(with_returned=True) + b"}"
+
+def error_body(message: str) -> bytes:
+    return json.dumps({"error": message}).encode()
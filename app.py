@@ -1,49 +1,120 @@
-from flask import Flask, request, render_template, redirect, flash, session
+import os
+import time
+from flask import Flask, request, render_template, redirect, flash, session, g
 from flask_debugtoolbar import DebugToolbarExtension
-from helpers import build_filter_option_from_form
+from helpers import build_filter_option_from_form, build_filter_option_from_args
+from api import (ApiError, RankingCache, cursor_serializer, read_page_request, providers_page,
+                 similar_page, error_body)
 from providers import ProviderList
+from deltas import DeltaWatcher
+from metrics import REGISTRY, REQUEST_SECONDS, METRICS_CONTENT_TYPE
 from constants import ( PROVIDER_JSON,
+                        PROVIDER_SNAPSHOT,
+                        PROVIDER_DELTAS,
+                        RETURNED_COUNTS_FILE,
                         FILTER_OPTIONS,
                         STR_TRAITS,
-                        TRAITS,
+                        FORM_TRAITS,
                         SEXES,
-                        DEFAULT_COLUMNS,
-                        DEFAULT_ORDER )
+                        PAGE_SIZE,
+                        FACET_LIMIT,
+                        SECRET_KEY )
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = "never-tell!"
+app.config['SECRET_KEY'] = SECRET_KEY
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 
-debug = DebugToolbarExtension(app)
-
-providers = ProviderList(PROVIDER_JSON)
+# the toolbar slows every page down and shows the app's internals, so it only runs
+# in debug mode, e.g. with FLASK_ENV=development, and never in production
+if app.debug:
+    DebugToolbarExtension(app)
+
+# cursor tokens of /api/providers are signed so clients cannot forge their filters
+cursors = cursor_serializer(app.config['SECRET_KEY'])
+# orders of the queries being paged through, for the cursors of their later pages
+rankings = RankingCache()
+
+# returned counts are kept in a file so they last between restarts
+# and are shared by every worker process. A snapshot built with
+# `python snapshot.py providers.json providers.snapshot` is mapped into memory
+# instead of parsing the json, sharing its pages between workers
+if os.path.isdir(PROVIDER_SNAPSHOT):
+    providers = ProviderList.load_snapshot(PROVIDER_SNAPSHOT, counter_path=RETURNED_COUNTS_FILE)
+else:
+    providers = ProviderList(PROVIDER_JSON, counter_path=RETURNED_COUNTS_FILE)
+
+# changes appended to the delta file are applied to the providers without a restart
+delta_watcher = DeltaWatcher(providers, PROVIDER_DELTAS).start()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    """times every request by its route, so unknown paths do not each add a route"""
+
+    if "request_start" in g:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                (route, request.method, str(response.status_code)))
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """request latencies, filter timings and sizes, returned counts, query cache
+    lookups and load times in the Prometheus text format"""
+
+    return app.response_class(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route("/")
 def root():
-    """base case, show all the data."""
+    """base case, show all the data one page at a time."""
 
-    providers.reset()
-    providers_list = providers.sort(DEFAULT_COLUMNS, DEFAULT_ORDER).list()
+    page = max(request.args.get("page", 1, type=int), 1)
 
-    print(providers.list())
+    view = providers.view().rank()
+    providers_list = view.list(with_returned=True,
+                               limit=PAGE_SIZE,
+                               offset=(page - 1) * PAGE_SIZE)
+    has_next = page * PAGE_SIZE < len(view)
 
     return render_template("provider_list.html",
                             title = "List of Providers",
-                            providers = providers_list)
+                            providers = providers_list,
+                            page = page,
+                            has_next = has_next)
 
 @app.route("/filter", methods = ["POST", "GET"])
 def filter():
-    """provide a form to filter data by for get request
+    """provide a form to filter data by for get request, with how many
+    providers have each sex, country, language, company and skill,
     otherwise, take form data and save it to filter options in session
     and redirect user to search with their filter options"""
 
     if request.method == "GET":
+        # counts shown next to the choices are of the providers kept by the filters
+        # in the query params, if any, e.g. /filter?country=China
+        try:
+            filters = build_filter_option_from_args(request.args)
+        except ValueError as error:
+            flash(str(error))
+            filters = {}
+
+        view = providers.view().filter(filters, count_returned=False)
+
         return render_template("filter.html",
-                                traits=TRAITS,
+                                traits=FORM_TRAITS,
                                 sexes=SEXES,
-                                str_traits=STR_TRAITS)
+                                str_traits=STR_TRAITS,
+                                total=len(view),
+                                facets=view.facets(FACET_LIMIT))
 
-    filters = build_filter_option_from_form(request.form)
+    try:
+        filters = build_filter_option_from_form(request.form)
+    except ValueError as error:
+        flash(str(error))
+        return redirect("/filter")
 
     session[FILTER_OPTIONS] = filters
 
@@ -55,19 +126,55 @@ def filtered():
     otherwise show all data"""
 
     filter_options = session.get(FILTER_OPTIONS)
-    providers_list = []
+    # every request works on its own view so the shared providers are never changed
+    view = providers.view()
 
     if filter_options is not None:
-        providers_list = providers.filter(filter_options).sort(DEFAULT_COLUMNS, DEFAULT_ORDER).list()
-        providers.reset()
+        view.filter(filter_options)
         session[FILTER_OPTIONS] = None
-    else:
-        providers_list = providers.sort(DEFAULT_COLUMNS, DEFAULT_ORDER).list()
+
+    providers_list = view.rank().list(with_returned=True)
 
     return render_template("provider_list.html",
                             title = "List of Filtered Providers",
                             providers = providers_list)
 
+def json_response(body: bytes, status=200):
+    return app.response_class(body, status=status, mimetype="application/json")
+
+@app.route("/api/providers", methods = ["GET", "POST"])
+def api_providers():
+    """JSON API of the ranked providers one page at a time.
+    Filters come from the query params of a GET, e.g.
+    /api/providers?rating=gt:5&primary_skills=Java,SQL&limit=50
+    or from the JSON body of a POST, e.g.
+    {"filters": {"rating": ["gt", 5]}, "limit": 50}
+    The response holds the page of providers, the total number of providers
+    kept and a next_cursor token to pass back as cursor for the next page.
+    A cursor carries its filters along, so no filters are sent with one."""
+
+    try:
+        if request.method == "POST":
+            page = read_page_request(request.get_json(silent=True), cursors, from_json=True)
+        else:
+            page = read_page_request(request.args, cursors)
+    except ApiError as error:
+        return json_response(error_body(error.message), error.status)
+
+    (_, body) = providers_page(providers, page, cursors, rankings)
+    return json_response(body)
+
+@app.route("/api/providers/similar")
+def api_similar_providers():
+    """JSON of the providers with skills most like the skills given, e.g.
+    /api/providers/similar?skills=Unix,Java&limit=20
+    or like the skills of the provider with the given id, e.g.
+    /api/providers/similar?provider=7"""
+
+    try:
+        return json_response(similar_page(providers, request.args))
+    except ApiError as error:
+        return json_response(error_body(error.message), error.status)
 
 @app.errorhandler(404)
 def not_found(err):
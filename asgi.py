@@ -0,0 +1,229 @@
+"""
+Asyncio serving mode of /api/providers, a plain ASGI app to run alongside the Flask one
+under any ASGI server, e.g.
+
+    uvicorn --factory asgi:create_app
+
+The event loop only reads requests and writes responses. Filtering and ranking run
+on a pool of worker threads, where numpy does most of the work without holding the GIL.
+Identical requests that arrive while the first of them is still being worked out
+wait for its result instead of working it out again, and once <max_pending>
+computations are queued or running new ones are turned away with a 503 and
+Retry-After, so a burst cannot grow the queue, and the latency of every request in it,
+without bound.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, Optional
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
+from api import (ApiError, PageRequest, RankingCache, cursor_serializer, read_page_request,
+                 providers_page, error_body)
+from providers import ProviderList
+from deltas import DeltaWatcher
+from query_cache import canonical_filter
+from metrics import REGISTRY, REQUEST_SECONDS, METRICS_CONTENT_TYPE
+from constants import PROVIDER_JSON, PROVIDER_SNAPSHOT, PROVIDER_DELTAS, RETURNED_COUNTS_FILE, SECRET_KEY
+
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 8)
+# computations queued or running past which requests are turned away
+DEFAULT_MAX_PENDING = 64
+# largest POST body read, in bytes
+MAX_BODY = 1 << 20
+RETRY_AFTER = 1
+# methods every route answers, sent back in the Allow header of a 405
+ALLOWED_METHODS = {"/api/providers": ("GET", "POST"), "/metrics": ("GET",)}
+
+logger = logging.getLogger(__name__)
+
+class _InFlight:
+    """A computation of a page in the worker pool and how many other requests joined it"""
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.joined = 0
+
+class MatchingService:
+    """
+    ASGI app serving /api/providers from the ProviderList <providers> with a pool of
+    <workers> threads, coalescing identical requests in flight and turning requests
+    away once <max_pending> computations are queued or running.
+    If <delta_path> is given the changes appended to it are applied while serving.
+    """
+
+    def __init__(self, providers, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 delta_path: Optional[str] = None, secret_key=SECRET_KEY):
+        self.providers = providers
+        self.workers = workers
+        self.max_pending = max_pending
+        self.delta_path = delta_path
+        self.cursors = cursor_serializer(secret_key)
+        self.rankings = RankingCache()
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="matching")
+        self.delta_watcher = None
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        # pages worked out, requests that joined one already in flight and requests turned away
+        self.computed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def __repr__(self):
+        return (f"<MatchingService with {self.workers} workers, "
+                f"{len(self._in_flight)} of {self.max_pending} computations pending>")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                if self.delta_path is not None:
+                    self.delta_watcher = DeltaWatcher(self.providers, self.delta_path).start()
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                if self.delta_watcher is not None:
+                    self.delta_watcher.stop()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        route = scope["path"] if scope["path"] in ("/api/providers", "/metrics") else "unmatched"
+        # left as is if the request fails without a response
+        status = 500
+
+        try:
+            allowed = ALLOWED_METHODS.get(scope["path"])
+            if allowed is None:
+                raise ApiError("not found", 404)
+            if scope["method"] not in allowed:
+                raise ApiError(f"only {' and '.join(allowed)} are allowed", 405)
+
+            if scope["path"] == "/metrics":
+                status = await self._respond(send, 200, REGISTRY.render(),
+                                             content_type=METRICS_CONTENT_TYPE.encode())
+                return
+
+            if scope["method"] == "POST":
+                body = await self._read_json(receive)
+                page = read_page_request(body, self.cursors, from_json=True)
+            elif scope["method"] == "GET":
+                args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"),
+                                           keep_blank_values=True))
+                page = read_page_request(args, self.cursors)
+
+            body = await self.page(page)
+            status = await self._respond(send, 200, body)
+
+        except ApiError as error:
+            headers = []
+            if error.status == 503:
+                headers.append((b"retry-after", str(RETRY_AFTER).encode()))
+            elif error.status == 405:
+                headers.append((b"allow", ", ".join(ALLOWED_METHODS[scope["path"]]).encode()))
+            status = await self._respond(send, error.status, error_body(error.message), headers)
+
+        except Exception:
+            # a bug in working out the page still answers the client instead of leaving it waiting
+            logger.exception("failed to answer %s %s", scope["method"], scope["path"])
+            status = await self._respond(send, 500, error_body("internal server error"))
+
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, (route, scope["method"], str(status)))
+
+    async def _read_json(self, receive):
+        chunks = []
+        size = 0
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ApiError("client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY:
+                raise ApiError(f"body should be at most {MAX_BODY} bytes", 413)
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+
+        try:
+            return json.loads(b"".join(chunks))
+        except ValueError:
+            raise ApiError("expected a JSON object body")
+
+    async def _respond(self, send, status: int, body: bytes, headers=(),
+                       content_type=b"application/json") -> int:
+        await send({"type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", content_type),
+                                (b"content-length", str(len(body)).encode()),
+                                *headers]})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+    async def page(self, page: PageRequest) -> bytes:
+        """
+        Returns the JSON body for <page>, joining the computation of an identical
+        page already in flight if there is one. Raises ApiError with a 503 if
+        <max_pending> computations are already queued or running.
+        """
+
+        filters = canonical_filter(page.filters)
+        # pages with filters that cannot be made canonical are never joined, a key of
+        # their own still counts them as pending
+        key = object() if filters is None else (filters, page.limit, page.offset,
+                                                 page.count_returned, page.explain, page.match,
+                                                 page.ranking)
+
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            flight.joined += 1
+            self.coalesced += 1
+            (_, body) = await asyncio.shield(flight.future)
+            return body
+
+        if len(self._in_flight) >= self.max_pending:
+            self.rejected += 1
+            raise ApiError("too many requests in flight, try again shortly", 503)
+
+        loop = asyncio.get_running_loop()
+        flight = _InFlight(loop.run_in_executor(self.executor, providers_page,
+                                                self.providers, page, self.cursors,
+                                                self.rankings))
+        self._in_flight[key] = flight
+        self.computed += 1
+
+        try:
+            # a client going away does not cancel the page others are waiting on
+            (view, body) = await asyncio.shield(flight.future)
+        finally:
+            del self._in_flight[key]
+
+        # every request that joined was sent the same providers
+        if flight.joined and page.count_returned:
+            await loop.run_in_executor(self.executor, view.mark_returned, flight.joined)
+
+        return body
+
+def create_app(**options) -> MatchingService:
+    """Loads the providers the same way as app.py and returns the ASGI app serving them"""
+
+    if os.path.isdir(PROVIDER_SNAPSHOT):
+        providers = ProviderList.load_snapshot(PROVIDER_SNAPSHOT, counter_path=RETURNED_COUNTS_FILE)
+    else:
+        providers = ProviderList(PROVIDER_JSON, counter_path=RETURNED_COUNTS_FILE)
+
+    return MatchingService(providers, delta_path=PROVIDER_DELTAS, **options)
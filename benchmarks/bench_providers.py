@@ -0,0 +1,207 @@
+"""
+Times ProviderList at production sizes on synthetic providers from benchmarks.generate:
+loading, every filter_by_* method, combined filter, sort, rank, list() and the Flask
+routes. Results are saved as JSON tagged with the commit they were run on, so runs on
+two commits can be compared case by case.
+
+Run from the root of the project with
+
+    python -m benchmarks.bench_providers [--sizes 10000 100000 1000000] [--repeats 5]
+                                         [--output results.json] [--compare baseline.json]
+
+Without --output results go to benchmarks/results/<commit>.json.
+Generated providers are kept in benchmarks/data so later runs skip generating them.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from providers import ProviderList
+from benchmarks.generate import DEFAULT_SEED, load_pools, write_ndjson
+from constants import PAGE_SIZE
+
+SIZES = [10_000, 100_000, 1_000_000]
+REPEATS = 5
+DATA_DIRECTORY = os.path.join("benchmarks", "data")
+RESULTS_DIRECTORY = os.path.join("benchmarks", "results")
+
+def timings(function: Callable, repeats=REPEATS, setup: Optional[Callable] = None) -> List[float]:
+    """returns the seconds each of <repeats> runs of <function> took, calling <setup> untimed before each"""
+
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def commit() -> Optional[str]:
+    """returns the commit the working tree is on, None outside of a git checkout"""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def dataset(size: int, seed=DEFAULT_SEED) -> str:
+    """returns the path of <size> synthetic providers as NDJSON, generating them the first time"""
+
+    os.makedirs(DATA_DIRECTORY, exist_ok=True)
+    path = os.path.join(DATA_DIRECTORY, f"providers_{size}_{seed}.ndjson")
+
+    if not os.path.exists(path):
+        write_ndjson(path, size, seed)
+
+    return path
+
+def provider_cases(providers: ProviderList, skill: str) -> Dict[str, Callable]:
+    """returns the ProviderList operations to time, each on a new view of <providers>"""
+
+    size = len(providers)
+    combined = {"rating": ("gt", 5), "sex": "Female", "birth_date": ("before", "1990-01-01"),
+                "primary_skills": [skill], "active": True}
+    batch = [{**combined, "rating": ("gt", rating)} for rating in np.arange(0, 10, 0.5)]
+
+    return {
+        "filter_by_str": lambda: providers.view().filter_by_str("country", "Peru"),
+        "filter_by_sex": lambda: providers.view().filter_by_sex("Female"),
+        "filter_by_date": lambda: providers.view().filter_by_date("before", "1970-01-01"),
+        "filter_by_date between": lambda: providers.view().filter_by_date(
+            "between", ("1980-01-01", "1980-12-31")),
+        "filter_by_num rating": lambda: providers.view().filter_by_num("rating", "gt", 8),
+        "filter_by_num id": lambda: providers.view().filter_by_num("id", "eq", size // 2),
+        "filter_active": lambda: providers.view().filter_active(),
+        "filter_by_skills": lambda: providers.view().filter_by_skills([skill]),
+        "filter": lambda: providers.view().filter(combined),
+        "filter_many 20": lambda: providers.filter_many(batch, limit=PAGE_SIZE),
+        "sort": lambda: providers.view().sort(["country", "rating"], [True, False]),
+        "rank": lambda: providers.view().rank(),
+        "rank top 100": lambda: providers.view().filter_active().rank(PAGE_SIZE),
+        "list page": lambda: providers.view().rank().list(with_returned=True, limit=PAGE_SIZE),
+        "list filtered": lambda: providers.view().filter(combined).list(with_returned=True),
+    }
+
+def route_cases(providers: ProviderList, skill: str) -> Dict[str, Callable]:
+    """returns requests to the Flask app to time, served from <providers>"""
+
+    import app as flask_app
+
+    # serve the benchmark providers instead of providers.json and leave them unchanged
+    flask_app.delta_watcher.stop()
+    flask_app.providers = providers
+    client = flask_app.app.test_client()
+    form = {"rating_option": "gt", "rating_val": "5", "sex": "Female", "primary_skills": skill}
+
+    def filtered():
+        client.post("/filter", data=form)
+        client.get("/filtered")
+
+    return {
+        "GET /": lambda: client.get("/"),
+        "GET /?page=10": lambda: client.get("/?page=10"),
+        "POST /filter, GET /filtered": filtered,
+        "GET /api/providers": lambda: client.get(
+            f"/api/providers?rating=gt:5&sex=Female&primary_skills={skill}&limit={PAGE_SIZE}"),
+    }
+
+def result(size: int, case: str, times: List[float]) -> dict:
+    return {"size": size, "case": case, "repeats": len(times),
+            "best_ms": min(times) * 1e3, "median_ms": statistics.median(times) * 1e3}
+
+def run(sizes: List[int], repeats=REPEATS) -> List[dict]:
+    """times every case on every size of dataset, printing each result as it goes"""
+
+    results = []
+    skill = load_pools()["skills"][0]
+
+    def record(size: int, case: str, times: List[float]):
+        results.append(result(size, case, times))
+        print(f"{size:>10} {case:<30} {results[-1]['best_ms']:>10.2f} {results[-1]['median_ms']:>10.2f}")
+
+    print(f"{'providers':>10} {'case':<30} {'best ms':>10} {'median ms':>10}")
+
+    for size in sizes:
+        path = dataset(size)
+
+        # loading is slow enough at millions of providers that it is only timed once
+        start = time.perf_counter()
+        providers = ProviderList(path)
+        record(size, "load", [time.perf_counter() - start])
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = os.path.join(directory, "providers.snapshot")
+            providers.save_snapshot(snapshot)
+            record(size, "load_snapshot",
+                   timings(lambda: ProviderList.load_snapshot(snapshot), repeats))
+
+        # filters are timed without the query cache, which would answer every repeat
+        for case, function in provider_cases(providers, skill).items():
+            record(size, case, timings(function, repeats, providers.query_cache.clear))
+
+        for case, function in route_cases(providers, skill).items():
+            record(size, case, timings(function, repeats, providers.query_cache.clear))
+
+    return results
+
+def compare(results: List[dict], baseline: List[dict]):
+    """prints how the best time of every case in <results> changed since <baseline>"""
+
+    before = {(entry["size"], entry["case"]): entry["best_ms"] for entry in baseline}
+
+    print(f"{'providers':>10} {'case':<30} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for entry in results:
+        key = (entry["size"], entry["case"])
+        if key in before:
+            change = entry["best_ms"] / before[key] - 1 if before[key] else 0.0
+            print(f"{entry['size']:>10} {entry['case']:<30} {before[key]:>10.2f} "
+                  f"{entry['best_ms']:>10.2f} {change:>+8.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ProviderList on synthetic providers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    arguments = parser.parse_args()
+
+    results = run(arguments.sizes, arguments.repeats)
+    revision = commit()
+    report = {
+        "commit": revision,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+
+    output = arguments.output
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = os.path.join(RESULTS_DIRECTORY, f"{revision or 'results'}.json")
+
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"saved results to {output}")
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            compare(results, json.load(baseline_file)["results"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Times ProviderList scoring on synthetic candidate sets of growing size to show
+that it scales linearly: the time per row should stay about the same.
+
+Run from the root of the project with
+
+    python -m benchmarks.bench_scoring
+"""
+
+import time
+import numpy as np
+from scoring import BlendedScorer, top_scores
+
+SIZES = [10_000, 100_000, 1_000_000, 2_000_000, 5_000_000]
+REPEATS = 5
+TOP_K = 100
+
+def best_time(function, repeats=REPEATS) -> float:
+    """returns the fastest of <repeats> runs of <function> in seconds"""
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+def main():
+    generator = np.random.default_rng(0)
+    scorer = BlendedScorer()
+
+    print(f"{'rows':>10} {'score ms':>10} {'top k ms':>10} {'ns/row':>8}")
+
+    for size in SIZES:
+        rating = np.round(generator.uniform(0, 10, size), 1)
+        returned = generator.poisson(3, size).astype(np.float64)
+
+        score_time = best_time(lambda: scorer(rating, returned))
+        scores = scorer(rating, returned)
+        top_time = best_time(lambda: top_scores(scores, TOP_K))
+        per_row = (score_time + top_time) / size * 1e9
+
+        print(f"{size:>10} {score_time * 1e3:>10.2f} {top_time * 1e3:>10.2f} {per_row:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Deterministic generator of synthetic providers shaped like providers.json,
+for benchmarking ProviderList at production sizes.
+
+Names, companies, skills and languages are drawn from the values in providers.json,
+with popularity falling off like real data (a few countries, languages and skills
+are far more common than the rest). The same size and seed always give the same providers.
+
+Run from the root of the project with
+
+    python -m benchmarks.generate 100000 providers_100k.json
+
+or, for millions of providers, as NDJSON with
+
+    python -m benchmarks.generate 5000000 providers_5m.ndjson
+"""
+
+import json
+import sys
+from typing import Dict, List
+import numpy as np
+from constants import PROVIDER_JSON, SEXES
+from providers_types import Provider
+
+DEFAULT_SEED = 0
+COUNTRIES = ["China", "India", "United States", "Indonesia", "Brazil", "Russia",
+             "Mexico", "Japan", "Philippines", "Vietnam", "Germany", "France",
+             "United Kingdom", "South Korea", "Canada", "Ukraine", "Poland", "Peru",
+             "Portugal", "Sweden", "Greece", "Czech Republic", "Argentina", "Nigeria",
+             "Colombia", "Armenia", "Thailand", "South Africa", "Egypt", "Norway"]
+# share of providers of each sex, in the order of SEXES
+SEX_WEIGHTS = [0.47, 0.47, 0.02, 0.02, 0.02]
+COMPANY_PATTERNS = ["{}-{}", "{} and Sons", "{} LLC", "{}, {} and {}", "{} Inc", "{} Group"]
+COMPANIES = 5_000
+MIN_BIRTH_DATE = np.datetime64("1930-01-01")
+MAX_BIRTH_DATE = np.datetime64("2003-12-31")
+MAX_SKILLS = 5
+
+def zipf_weights(count: int, exponent=1.1) -> np.ndarray:
+    """returns probabilities for <count> values where the i-th value is drawn about 1/i times as often"""
+
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+def load_pools(providers_json=PROVIDER_JSON) -> Dict[str, list]:
+    """returns the distinct names, skills and languages found in <providers_json>"""
+
+    with open(providers_json) as json_file:
+        providers: List[Provider] = json.load(json_file)
+
+    def distinct(values):
+        return sorted(set(values))
+
+    return {
+        "first_name": distinct(provider["first_name"] for provider in providers),
+        "last_name": distinct(provider["last_name"] for provider in providers),
+        "language": distinct(provider["language"] for provider in providers),
+        "skills": distinct(skill for provider in providers
+                           for skills in (provider["primary_skills"], provider["secondary_skill"])
+                           for skill in skills),
+    }
+
+def make_companies(generator: np.random.Generator, last_names: List[str]) -> List[str]:
+    """returns COMPANIES distinct company names made from <last_names>"""
+
+    companies = set()
+    while len(companies) < COMPANIES:
+        pattern = COMPANY_PATTERNS[generator.integers(len(COMPANY_PATTERNS))]
+        names = generator.choice(last_names, size=pattern.count("{}"), replace=False)
+        companies.add(pattern.format(*names))
+
+    return sorted(companies)
+
+def draw_skills(generator: np.random.Generator, skills: List[str], size: int) -> List[List[str]]:
+    """returns <size> lists of 1 to MAX_SKILLS distinct skills, popular skills drawn more often"""
+
+    weights = zipf_weights(len(skills), exponent=0.8)
+    order = generator.permutation(len(skills))
+    counts = generator.integers(1, MAX_SKILLS + 1, size)
+    drawn = generator.choice(len(skills), size=(size, MAX_SKILLS), p=weights)
+    skill_names = np.array(skills, dtype=object)[order]
+
+    return [list(dict.fromkeys(skill_names[row[:count]]))
+            for row, count in zip(drawn, counts)]
+
+def generate_columns(size: int, seed=DEFAULT_SEED) -> Dict[str, list]:
+    """
+    returns the columns of <size> synthetic providers as a dict of lists,
+    keyed by the same traits as providers.json
+    """
+
+    generator = np.random.default_rng(seed)
+    pools = load_pools()
+    companies = make_companies(generator, pools["last_name"])
+    days = int((MAX_BIRTH_DATE - MIN_BIRTH_DATE) / np.timedelta64(1, "D"))
+    birth_dates = MIN_BIRTH_DATE + generator.integers(0, days, size).astype("timedelta64[D]")
+
+    def pick(values: list, weights=None) -> list:
+        return list(np.array(values, dtype=object)[
+            generator.choice(len(values), size=size, p=weights)])
+
+    return {
+        "id": list(range(1, size + 1)),
+        "first_name": pick(pools["first_name"]),
+        "last_name": pick(pools["last_name"]),
+        "sex": pick(SEXES, SEX_WEIGHTS),
+        "birth_date": [str(date) for date in birth_dates],
+        "rating": np.round(generator.uniform(0, 10, size), 1).tolist(),
+        "primary_skills": draw_skills(generator, pools["skills"], size),
+        "secondary_skill": draw_skills(generator, pools["skills"], size),
+        "company": pick(companies, zipf_weights(len(companies), exponent=0.6)),
+        "active": (generator.random(size) < 0.5).tolist(),
+        "country": pick(COUNTRIES, zipf_weights(len(COUNTRIES))),
+        "language": pick(pools["language"], zipf_weights(len(pools["language"]))),
+    }
+
+def generate_providers(size: int, seed=DEFAULT_SEED) -> List[Provider]:
+    """returns a list of <size> synthetic providers"""
+
+    columns = generate_columns(size, seed)
+    traits = list(columns)
+
+    return [dict(zip(traits, values)) for values in zip(*columns.values())]
+
+def write_providers(path: str, size: int, seed=DEFAULT_SEED):
+    """writes <size> synthetic providers to <path> as a json array like providers.json"""
+
+    with open(path, "w") as json_file:
+        json.dump(generate_providers(size, seed), json_file)
+
+def write_ndjson(path: str, size: int, seed=DEFAULT_SEED):
+    """
+    writes <size> synthetic providers to <path> as NDJSON, one provider per line,
+    without building every provider as a dict at once
+    """
+
+    columns = generate_columns(size, seed)
+    traits = list(columns)
+
+    with open(path, "w") as ndjson_file:
+        for values in zip(*columns.values()):
+            ndjson_file.write(json.dumps(dict(zip(traits, values))) + "\n")
+
+if __name__ == "__main__":
+    if sys.argv[2].endswith(".ndjson"):
+        write_ndjson(sys.argv[2], int(sys.argv[1]))
+    else:
+        write_providers(sys.argv[2], int(sys.argv[1]))
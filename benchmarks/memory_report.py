@@ -0,0 +1,41 @@
+"""
+Reports how much memory dictionary encoding the CATEGORY_TRAITS columns saves,
+on a synthetic dataset of 1 million providers by default.
+
+Run from the root of the project with
+
+    python -m benchmarks.memory_report [size]
+"""
+
+import sys
+import pandas as pd
+from constants import CATEGORY_TRAITS
+from providers import ProviderList
+from benchmarks.generate import generate_columns
+
+DEFAULT_SIZE = 1_000_000
+MEGABYTE = 1024 ** 2
+
+def column_memory(df: pd.DataFrame) -> pd.Series:
+    """returns the bytes taken by each column of <df>, counting the strings in it"""
+
+    return df.memory_usage(deep=True, index=False)
+
+def main(size=DEFAULT_SIZE):
+    df = pd.DataFrame(generate_columns(size))
+    before = column_memory(df)
+    after = column_memory(ProviderList.encode_categories(df))
+
+    print(f"{size} providers")
+    print(f"{'column':>10} {'object MB':>10} {'encoded MB':>11} {'saved':>7}")
+
+    for trait in CATEGORY_TRAITS:
+        saved = 1 - after[trait] / before[trait]
+        print(f"{trait:>10} {before[trait] / MEGABYTE:>10.1f} "
+              f"{after[trait] / MEGABYTE:>11.1f} {saved:>7.1%}")
+
+    print(f"{'all':>10} {before.sum() / MEGABYTE:>10.1f} "
+          f"{after.sum() / MEGABYTE:>11.1f} {1 - after.sum() / before.sum():>7.1%}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
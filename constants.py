@@ -1,8 +1,19 @@
 PROVIDER_JSON = "providers.json"
+PROVIDER_SNAPSHOT = "providers.snapshot"
+PROVIDER_DELTAS = "providers.deltas.ndjson"
 TEST_JSON = "./test_resource/test_providers.json"
+RETURNED_COUNTS_FILE = "returned_counts.bin"
 FILTER_OPTIONS = "filter_options"
+SECRET_KEY = "never-tell!"
 DEFAULT_COLUMNS = ["returned", "rating"]
 DEFAULT_ORDER = [True, False]
+PAGE_SIZE = 100
+# most providers a single /api/providers page can hold
+API_MAX_LIMIT = 1000
+# most values of each trait the filter form shows a count for
+FACET_LIMIT = 20
+# share of tombstoned providers in the store past which it is compacted
+COMPACT_FRACTION = 0.25
 TRAITS = [ "id", 
             "first_name",
             "last_name",
@@ -15,5 +26,12 @@ TRAITS = [ "id",
             "active",
             "country",
             "language"]
+# inputs of the filter form, with the skill traits named as Filter_Options names them
+FORM_TRAITS = ["secondary_skills" if trait == "secondary_skill" else trait for trait in TRAITS]
 STR_TRAITS = {"first_name", "last_name", "company", "country", "language"}
-SEXES = ["Male", "Female", "Genderqueer", "Agender", "Polygender"]
\ No newline at end of file
+# low-cardinality columns that are dictionary encoded when loaded
+CATEGORY_TRAITS = ["sex", "country", "language", "company"]
+SEXES = ["Male", "Female", "Genderqueer", "Agender", "Polygender"]
+# between takes a (low, high) pair and includes both ends
+NUM_OPERATORS = ("eq", "gt", "lt", "between")
+DATE_OPERATORS = ("at", "after", "before", "between")
\ No newline at end of file
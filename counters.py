@@ -0,0 +1,429 @@
+import atexit
+import fcntl
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Union
+import numpy as np
+from metrics import RETURNED_INCREMENTS, RETURNED_PROVIDERS
+
+DEFAULT_STRIPES = 16
+MAX_STRIPES = 2 ** 16
+# seconds between write-behind flushes and between syncs to disk
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_CHECKPOINT_INTERVAL = 30.0
+COUNT_BYTES = np.dtype(np.int64).itemsize
+# the counts file starts with one int64 that is bumped whenever its counts change
+HEADER_COUNTS = 1
+# decayed counts are rescaled before their weights get close to overflowing
+MAX_DECAY_HALF_LIVES = 256
+
+class ReturnedCounter:
+    """
+    Thread safe count of how many times each provider came back from a filter,
+    kept in one NumPy int64 array indexed by the provider's position in the store.
+
+    The positions are split into contiguous stripes each guarded by its own lock,
+    so increments from concurrent requests only wait on each other when they
+    touch the same stripe. Reads of single counts never need a lock.
+
+    The version changes after every change to the counts, so anything
+    worked out from them can be cached until it does.
+
+    If a <half_life> in seconds is given, a decayed count is kept next to every
+    count where each increment loses half its weight every <half_life> seconds.
+    Rather than decaying every count as time goes by, increments are added with a
+    weight that doubles every <half_life> since a start time, and the sum is
+    scaled back down when read, so increments still only touch their own positions.
+    """
+
+    def __init__(self, size: int, stripes=DEFAULT_STRIPES, half_life: Optional[float] = None):
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.half_life = half_life
+        self.weighted = None if half_life is None else np.zeros(size, dtype=np.float64)
+        self._decay_start = time.monotonic()
+        self.stripes = max(min(stripes, size, MAX_STRIPES), 1)
+        # ceiling division so every position falls into a stripe
+        self.stripe_size = max(-(-size // self.stripes), 1)
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+        # next() on itertools.count is atomic, so concurrent changes never share a version
+        self._versions = itertools.count(1)
+        self._version = 0
+
+    def __repr__(self):
+        return f"<ReturnedCounter for {len(self)} providers over {self.stripes} stripes>"
+
+    @property
+    def version(self):
+        return self._version
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return self.counts[rows]
+
+    def increment(self, indices: np.ndarray, amount: Union[int, np.ndarray] = 1):
+        """
+        Adds <amount> to the count of every position in <indices>, which should not
+        repeat. <amount> can also be an array with an amount for each position.
+        """
+
+        indices = np.asarray(indices)
+
+        if len(indices) == 0:
+            return self
+
+        RETURNED_INCREMENTS.inc()
+        RETURNED_PROVIDERS.inc(np.sum(amount) if np.ndim(amount) else amount * len(indices))
+
+        # stripe numbers fit in 16 bits, where a stable argsort is a linear radix sort.
+        # positions added by grow() past the last stripe fall into the last stripe
+        stripe_of = np.minimum(indices // self.stripe_size, self.stripes - 1).astype(np.uint16)
+        order = np.argsort(stripe_of, kind="stable")
+        indices = indices[order]
+        if np.ndim(amount):
+            amount = np.asarray(amount)[order]
+
+        # where each stripe's positions start and end in the grouped indices
+        bounds = np.searchsorted(stripe_of[order], np.arange(self.stripes + 1))
+
+        if self.half_life is not None:
+            weight = self._decay_weight()
+
+        for stripe in range(self.stripes):
+            start, end = bounds[stripe], bounds[stripe + 1]
+            if start == end:
+                continue
+
+            stripe_amount = amount[start:end] if np.ndim(amount) else amount
+            with self._locks[stripe]:
+                self.counts[indices[start:end]] += stripe_amount
+                if self.half_life is not None:
+                    self.weighted[indices[start:end]] += stripe_amount * weight
+
+        self._version = next(self._versions)
+        return self
+
+    def _decay_weight(self) -> float:
+        """
+        Internal method for the weight of an increment made now,
+        rescaling the decayed counts first if the weight is getting too large
+        """
+
+        half_lives = (time.monotonic() - self._decay_start) / self.half_life
+
+        if half_lives > MAX_DECAY_HALF_LIVES:
+            with self._all_stripes():
+                now = time.monotonic()
+                self.weighted *= 2.0 ** (-(now - self._decay_start) / self.half_life)
+                self._decay_start = now
+            half_lives = 0.0
+
+        return 2.0 ** half_lives
+
+    def decayed(self, rows=slice(None)) -> np.ndarray:
+        """
+        Returns the decayed counts at the positions in <rows>, every position by default.
+        Without a half life these are the plain counts.
+        """
+
+        if self.half_life is None:
+            return self[rows].astype(np.float64)
+
+        scale = 2.0 ** (-(time.monotonic() - self._decay_start) / self.half_life)
+        return self.weighted[rows] * scale
+
+    @contextmanager
+    def _all_stripes(self):
+        """Internal context manager holding every stripe's lock, always taken in the same order"""
+
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def snapshot(self) -> np.ndarray:
+        """
+        Returns a copy of every count, taken while holding every stripe
+        so no increment is only partly included.
+        """
+
+        with self._all_stripes():
+            return self.counts.copy()
+
+    def reset(self):
+        """Sets every count back to 0"""
+
+        with self._all_stripes():
+            self.counts[:] = 0
+            if self.half_life is not None:
+                self.weighted[:] = 0
+
+        self._version = next(self._versions)
+        return self
+
+    def grow(self, size: int):
+        """Adds zeroed counts for new positions up to <size>, keeping every count there is"""
+
+        with self._all_stripes():
+            if size > len(self.counts):
+                self.counts = np.concatenate(
+                    (self.counts, np.zeros(size - len(self.counts), dtype=np.int64)))
+                if self.half_life is not None:
+                    self.weighted = np.concatenate(
+                        (self.weighted, np.zeros(size - len(self.weighted), dtype=np.float64)))
+
+        return self
+
+    def move(self, old: np.ndarray, new: np.ndarray):
+        """
+        Moves the counts at the positions in <old> onto the positions in <new>,
+        for providers that were replaced by a new position in the store
+        """
+
+        with self._all_stripes():
+            self.counts[new] += self.counts[old]
+            self.counts[old] = 0
+            if self.half_life is not None:
+                self.weighted[new] += self.weighted[old]
+                self.weighted[old] = 0
+
+        self._version = next(self._versions)
+        return self
+
+    def compacted(self, keep: np.ndarray):
+        """
+        Returns a new counter where position i holds the counts at position keep[i]
+        of this one, for when the store is compacted down to the positions in <keep>
+        """
+
+        counter = ReturnedCounter(len(keep), self.stripes, self.half_life)
+
+        with self._all_stripes():
+            counter.counts[:] = self.counts[keep]
+            if self.half_life is not None:
+                counter.weighted[:] = self.weighted[keep]
+                counter._decay_start = self._decay_start
+
+        return counter
+
+class PersistentReturnedCounter(ReturnedCounter):
+    """
+    ReturnedCounter whose counts are kept in a memory-mapped file at <path>,
+    so they survive restarts and are shared by every worker process on the host
+    that opens the same file. Position i in the file is position i in the store,
+    so the file should only be reused with the same providers file.
+
+    Increments are written behind: they add up in this process's own array and
+    are only added into the file by flush(), at most every <flush_interval>
+    seconds, under an exclusive lock on the file. Every <checkpoint_interval>
+    seconds a flush also syncs the mapped pages to disk, so a crash loses at most
+    the last unflushed increments of the crashing process.
+
+    The file starts with a header count bumped by every flush that changes it,
+    which is part of the version so other processes' flushes change it too.
+    Decayed counts are not kept in the file, they only cover this process's
+    increments since it started.
+
+    Compacting the store moves the counts into a new file for the next
+    <generation>, <path>.1, <path>.2 and so on. Every change to the file made
+    while the store changes can be made any number of times with the same result,
+    so every process following the same changes ends up with the same counts.
+    """
+
+    def __init__(self, size: int, path: str,
+                 stripes=DEFAULT_STRIPES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 half_life: Optional[float] = None,
+                 generation=0):
+        super().__init__(size, stripes, half_life)
+        self.base_path = path
+        self.generation = generation
+        self.path = path if generation == 0 else f"{path}.{generation}"
+        self.flush_interval = flush_interval
+        self.checkpoint_interval = checkpoint_interval
+        self._lock_file = None
+        self._lock_pid = None
+        self._map(size)
+        self._flush_lock = threading.Lock()
+        self._last_flush = self._last_checkpoint = time.monotonic()
+        atexit.register(self.close)
+
+    def __repr__(self):
+        return f"<PersistentReturnedCounter for {len(self)} providers in {self.path}>"
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return np.asarray(self.shared[rows]) + self.counts[rows]
+
+    @property
+    def version(self):
+        return (self._version, int(self.header[0]))
+
+    def _map(self, size: int):
+        """Internal method to map the first <size> counts of the file, growing it if shorter"""
+
+        with open(self.path, "a+b") as counts_file, self._file_lock():
+            # grow a new or shorter file with zeroed counts
+            if os.path.getsize(self.path) < (HEADER_COUNTS + size) * COUNT_BYTES:
+                counts_file.truncate((HEADER_COUNTS + size) * COUNT_BYTES)
+
+        self._mapped = np.memmap(self.path, dtype=np.int64, mode="r+",
+                                 shape=(HEADER_COUNTS + size,))
+        self.header = self._mapped[:HEADER_COUNTS]
+        self.shared = self._mapped[HEADER_COUNTS:]
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Internal context manager holding an exclusive lock on the counts file.
+        The lock file is opened once per process, as processes forked
+        from each other would otherwise share one lock.
+        """
+
+        if self._lock_pid != os.getpid():
+            self._lock_file = open(self.path, "rb")
+            self._lock_pid = os.getpid()
+
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def increment(self, indices: np.ndarray, amount: Union[int, np.ndarray] = 1):
+        """
+        Adds <amount> to the count of every position in <indices> in this process,
+        flushing to the shared file if <flush_interval> has gone by since the last flush.
+        """
+
+        super().increment(indices, amount)
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+        return self
+
+    def flush(self):
+        """
+        Adds this process's unflushed increments into the shared file,
+        and syncs the file to disk if <checkpoint_interval> has gone by.
+        """
+
+        with self._flush_lock:
+            with self._all_stripes():
+                changed = np.flatnonzero(self.counts)
+
+                if len(changed):
+                    with self._file_lock():
+                        self.shared[changed] += self.counts[changed]
+                        self.header[0] += 1
+                    self.counts[changed] = 0
+
+            self._last_flush = time.monotonic()
+
+            if self._last_flush - self._last_checkpoint >= self.checkpoint_interval:
+                self.checkpoint()
+
+        return self
+
+    def grow(self, size: int):
+        """Adds zeroed counts for new positions up to <size>, growing the file if no process has"""
+
+        super().grow(size)
+
+        with self._all_stripes():
+            if size > len(self.shared):
+                self._map(size)
+
+        return self
+
+    def move(self, old: np.ndarray, new: np.ndarray):
+        """
+        Moves the counts at the positions in <old> onto the positions in <new>,
+        in the file too. Moving again moves nothing, as the old counts are left at 0
+        """
+
+        super().move(old, new)
+
+        with self._all_stripes(), self._file_lock():
+            self.shared[new] += self.shared[old]
+            self.shared[old] = 0
+            self.header[0] += 1
+
+        return self
+
+    def compacted(self, keep: np.ndarray):
+        """
+        Returns a counter for the next generation's file where position i holds
+        the counts at position keep[i] of this one. The first process to compact
+        writes the file, the rest map it. This counter is closed.
+        """
+
+        path = f"{self.base_path}.{self.generation + 1}"
+
+        with self._file_lock():
+            if not os.path.exists(path):
+                counts = np.zeros(HEADER_COUNTS + len(keep), dtype=np.int64)
+                counts[HEADER_COUNTS:] = self.shared[keep]
+                staging = f"{path}.{os.getpid()}.tmp"
+                counts.tofile(staging)
+                os.replace(staging, path)
+
+        counter = PersistentReturnedCounter(len(keep), self.base_path, self.stripes,
+                                            self.flush_interval, self.checkpoint_interval,
+                                            self.half_life, self.generation + 1)
+
+        # unflushed increments are carried over instead of flushed into the old file
+        with self._all_stripes():
+            counter.counts[:] = self.counts[keep]
+            self.counts[:] = 0
+            if self.half_life is not None:
+                counter.weighted[:] = self.weighted[keep]
+                counter._decay_start = self._decay_start
+
+        self.close()
+        return counter
+
+    def checkpoint(self):
+        """Syncs the mapped counts to disk"""
+
+        self._mapped.flush()
+        self._last_checkpoint = time.monotonic()
+        return self
+
+    def snapshot(self) -> np.ndarray:
+        """
+        Returns a copy of every count, the shared counts in the file
+        plus this process's unflushed increments.
+        """
+
+        with self._all_stripes():
+            return np.asarray(self.shared) + self.counts
+
+    def reset(self):
+        """Sets every count back to 0, in the shared file too"""
+
+        with self._all_stripes(), self._file_lock():
+            self.shared[:] = 0
+            self.header[0] += 1
+            self.counts[:] = 0
+            if self.half_life is not None:
+                self.weighted[:] = 0
+
+        self._version = next(self._versions)
+        self.checkpoint()
+        return self
+
+    def close(self):
+        """Flushes and syncs any unflushed increments, called on exit"""
+
+        self.flush()
+        self.checkpoint()
+        atexit.unregister(self.close)
@@ -0,0 +1,122 @@
+"""
+Follows a delta file of changes to the providers, so a running server picks them up
+without reloading.
+
+The delta file is NDJSON appended to by a providers feed. Every line is one batch,
+either a single delta or a JSON array of deltas, in the shape ProviderList.apply_deltas()
+takes:
+
+    {"op": "upsert", "provider": {"id": 101, "first_name": "Ada", ...}}
+    {"op": "update", "id": 7, "changes": {"rating": 9.1}}
+    [{"op": "deactivate", "id": 12}, {"op": "deactivate", "id": 13}]
+
+Batches are applied one line at a time whenever they were read, so every process
+following the same file makes the same changes to its store in the same order
+and shares the same returned counts file.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import List
+
+# seconds between checks of the delta file for new lines
+DEFAULT_POLL_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+class DeltaFeed:
+    """Reads the batches of deltas appended to the NDJSON file at <path> since the last read"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # bytes of the file already read
+        self.offset = 0
+
+    def __repr__(self):
+        return f"<DeltaFeed of {self.path} at byte {self.offset}>"
+
+    def read(self) -> List[List[dict]]:
+        """
+        Returns every complete line added since the last read as a batch of deltas.
+        A line still being written is left for the next read.
+        """
+
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+
+        # a shorter file was replaced by a new feed, which is read from the start
+        if size < self.offset:
+            self.offset = 0
+
+        with open(self.path, "rb") as delta_file:
+            delta_file.seek(self.offset)
+            data = delta_file.read(size - self.offset)
+
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+
+        batches = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+
+            try:
+                deltas = json.loads(line)
+            except ValueError as error:
+                logger.warning(f"skipped a line of {self.path} that is not JSON: {error}")
+                continue
+
+            batches.append(deltas if isinstance(deltas, list) else [deltas])
+
+        return batches
+
+class DeltaWatcher:
+    """
+    Checks the delta file at <path> every <interval> seconds from a daemon thread
+    and applies any new batches to <providers>, the ProviderList every request views.
+    """
+
+    def __init__(self, providers, path: str, interval=DEFAULT_POLL_INTERVAL):
+        self.providers = providers
+        self.feed = DeltaFeed(path)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f"<DeltaWatcher of {self.feed.path} every {self.interval}s>"
+
+    def poll(self) -> int:
+        """Applies the batches added to the delta file since the last poll, returns how many"""
+
+        batches = self.feed.read()
+
+        for deltas in batches:
+            try:
+                self.providers.apply_deltas(deltas)
+            except (KeyError, ValueError, TypeError) as error:
+                logger.warning(f"skipped a batch of deltas from {self.feed.path}: {error}")
+
+        return len(batches)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        """Applies what is already in the delta file, then keeps polling it in the background"""
+
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="delta-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
@@ -0,0 +1,126 @@
+"""
+Reports of how ProviderList.explain() ran a filter: which predicates ran in what order,
+how each found its providers, how long each took, how many providers went in and
+came out of it and, if allocations are traced, how much memory was allocated while
+it ran, along with any warnings such as unknown skills.
+
+Allocations are traced with tracemalloc, which traces every thread of the process:
+while it is on every request slows down, and the peak memory of a predicate counts
+whatever other threads allocated at the same time, so it is only for debugging.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import List, Optional
+from providers_types import Filter_Options
+
+# explanations tracing allocations right now, tracing stops when the last one finishes
+_tracing_lock = threading.Lock()
+_tracing = 0
+
+@contextmanager
+def tracing_allocations():
+    """Traces memory allocations for as long as any explanation in any thread needs them"""
+
+    global _tracing
+
+    with _tracing_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing = 1
+        elif _tracing > 0:
+            _tracing += 1
+
+    try:
+        yield
+    finally:
+        with _tracing_lock:
+            if _tracing > 0:
+                _tracing -= 1
+                if _tracing == 0:
+                    tracemalloc.stop()
+
+class StageReport:
+    """
+    How one predicate of a query ran: the <trait> it filtered on, how it found its
+    providers (<access>, e.g. sorted index or scan), the share of providers the
+    plan estimated would pass it, how many were left before and after it,
+    how many passed it on its own, and the seconds and bytes it took.
+    """
+
+    def __init__(self, trait: str, access: str, selectivity: float):
+        self.trait = trait
+        self.access = access
+        self.selectivity = selectivity
+        self.rows_in = 0
+        self.matched = 0
+        self.rows_out = 0
+        self.seconds = 0.0
+        # peak bytes allocated by the whole process while it ran, None if allocations
+        # were not traced
+        self.allocated: Optional[int] = None
+
+    def __repr__(self):
+        return (f"<StageReport {self.trait} by {self.access}, {self.rows_in} -> {self.rows_out} "
+                f"rows in {self.seconds * 1e3:.3f}ms>")
+
+    @contextmanager
+    def measure(self, trace_allocations: bool):
+        """
+        Times what runs inside it and, if <trace_allocations>, the peak memory the
+        process allocates meanwhile, in every thread and not only this stage's
+        """
+
+        if trace_allocations:
+            tracemalloc.reset_peak()
+            (before, _) = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        yield self
+        self.seconds = time.perf_counter() - start
+
+        if trace_allocations:
+            (_, peak) = tracemalloc.get_traced_memory()
+            self.allocated = max(peak - before, 0)
+
+    def to_dict(self) -> dict:
+        return {"trait": self.trait, "access": self.access, "selectivity": self.selectivity,
+                "rows_in": self.rows_in, "matched": self.matched, "rows_out": self.rows_out,
+                "ms": self.seconds * 1e3, "allocated": self.allocated}
+
+class QueryExplanation:
+    """
+    How a filter by <traits> ran over a view of <rows_in> providers: whether it was
+    answered from the query cache, the stages of its plan in the order they ran,
+    how many providers it kept, how long it took and the warnings it raised.
+    """
+
+    def __init__(self, traits: Filter_Options, rows_in: int, trace_allocations=False):
+        self.traits = traits
+        self.rows_in = rows_in
+        self.trace_allocations = trace_allocations
+        self.cached = False
+        self.plan_seconds = 0.0
+        self.stages: List[StageReport] = []
+        self.rows_out = rows_in
+        self.seconds = 0.0
+        self.warnings: List[str] = []
+
+    def __repr__(self):
+        source = "cache" if self.cached else f"{len(self.stages)} stages"
+        return (f"<QueryExplanation {self.rows_in} -> {self.rows_out} rows from {source} "
+                f"in {self.seconds * 1e3:.3f}ms, {len(self.warnings)} warnings>")
+
+    def stage(self, trait: str, access: str, selectivity: float) -> StageReport:
+        """Adds the report of the next stage to run"""
+
+        self.stages.append(StageReport(trait, access, selectivity))
+        return self.stages[-1]
+
+    def to_dict(self) -> dict:
+        return {"rows_in": self.rows_in, "rows_out": self.rows_out, "cached": self.cached,
+                "ms": self.seconds * 1e3, "plan_ms": self.plan_seconds * 1e3,
+                "stages": [stage.to_dict() for stage in self.stages],
+                "warnings": list(self.warnings)}
@@ -0,0 +1,50 @@
+"""
+Facet counts: how many providers of a view have each value of a trait, for showing
+next to every choice of the filter form how many providers picking it would keep.
+
+Every facet is one vectorized pass over the view. Dictionary encoded columns are
+counted with a bincount of the codes at the view's positions, and skills by marking
+the view's positions once and adding up how many of every skill's postings are marked,
+instead of running a filter for every value.
+"""
+
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from skill_index import SkillIndex
+
+def category_counts(column: pd.Categorical, rows: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Returns how many of the positions in <rows> have each code of the encoded <column>,
+    in code order. Providers without a value are not counted
+    """
+
+    codes = column.codes if rows is None else column.codes[rows]
+    return np.bincount(codes[codes >= 0], minlength=len(column.categories))
+
+def skill_counts(index: SkillIndex, rows: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Returns how many of the positions in <rows> have each skill of <index>, in code order.
+    Every position of the index counts if <rows> is None
+    """
+
+    if rows is None:
+        return np.diff(index.indptr)
+
+    in_view = np.zeros(index.size, dtype=bool)
+    in_view[rows] = True
+
+    # running total of marked postings, read at the bounds of every skill's postings
+    marked = np.zeros(len(index.indices) + 1, dtype=np.int64)
+    np.cumsum(in_view[index.indices], out=marked[1:])
+    return marked[index.indptr[1:]] - marked[index.indptr[:-1]]
+
+def top_counts(values: List[str], counts: np.ndarray, limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Returns the values with a count above zero and their counts, from most to fewest providers,
+    ties in the order of <values>. Only the first <limit> are kept if it is given
+    """
+
+    order = np.argsort(-counts, kind="stable")
+    order = order[counts[order] > 0][:limit]
+    return {values[code]: int(counts[code]) for code in order}
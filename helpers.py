@@ -1,23 +1,45 @@
+from typing import Union
+import numpy as np
+import pandas as pd
 from providers_types import Filter_Options
-from constants import STR_TRAITS
+from constants import STR_TRAITS, NUM_OPERATORS, DATE_OPERATORS
 
-def intersection(lst1: list, lst2: list):
-    """ returns list that is only unique shared values between the input lists"""
-    return list(set(lst1) & set(lst2))
+def sort_key(values: Union[np.ndarray, pd.Categorical], ascending=True) -> np.ndarray:
+    """
+    returns a key for np.lexsort that orders <values> ascending or descending.
+    numbers and dates are used as they are, Categoricals by their codes if the
+    categories are in order, anything else is ranked first
+    """
 
-def unique_union(lst1: list, lst2: list):
-    """ returns list that is all values of the two input lists with only unique values"""
-    return list(set(lst1 + lst2))
+    if isinstance(values, pd.Categorical):
+        if values.categories.is_monotonic_increasing:
+            values = values.codes.astype(np.int64)
+        else:
+            values = np.asarray(values)
+
+    if values.dtype.kind == "M":
+        values = values.view("i8")
+    elif values.dtype.kind in "bu":
+        values = values.astype(np.int64)
+    elif values.dtype.kind not in "if":
+        if ascending:
+            return values
+        values = np.unique(values, return_inverse=True)[1]
+
+    return values if ascending else -values
 
 def build_filter_option_from_form(form:dict):
+    """
+    Takes in the filter form and returns the Filter_Options it asks for, between ranges
+    given as a comma separated low and high value. Raises ValueError for values that cannot filter.
+    """
+
     filters : Filter_Options = {}
 
     for trait in form.keys():
 
         if trait == "id_val" and form[trait] != "":
-            id_option = form.get("id_option")
-            id_val = int(form.get("id_val"))
-            filters["id"] = (id_option, id_val)
+            filters["id"] = _filter_value("id", (form.get("id_option"), form.get("id_val")))
 
         if trait in STR_TRAITS and form[trait] != "":
             filters[trait] = form.get(trait).capitalize()
@@ -26,17 +48,160 @@ def build_filter_option_from_form(form:dict):
             filters[trait] = form.get("sex")
 
         if trait == "date_val" and form[trait] != "":
-            date_option = form.get("date_option")
-            date_val = form.get("date_val")
-            filters["birth_date"] = (date_option, date_val)
+            filters["birth_date"] = _filter_value("birth_date",
+                                                  (form.get("date_option"), form.get("date_val")))
 
         if trait == "rating_val" and form[trait] != "":
-            rating_option = form.get("rating_option")
-            rating_val = float(form.get("rating_val"))
-            filters["rating"] = (rating_option, rating_val)
+            filters["rating"] = _filter_value("rating",
+                                              (form.get("rating_option"), form.get("rating_val")))
 
         if (trait == "primary_skills" or trait == "secondary_skills") and form[trait] != "":
             skills = form.get(trait).split(",")
             filters[trait] = skills
 
-    return filters
\ No newline at end of file
+    return filters
+
+# traits a Filter_Options can filter by
+FILTER_TRAITS = set(Filter_Options.__annotations__)
+
+def _range_pair(trait: str, value) -> tuple:
+    """
+    Internal function returning the low and high end of a between range, given as
+    a pair or as a comma separated string. Raises ValueError if it is neither.
+    """
+
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(",")]
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{trait} between should be given a low and a high value")
+    return tuple(value)
+
+def _operator_value(trait: str, value) -> tuple:
+    """Internal function returning the operator and value in <value>, raises ValueError if it is not a pair"""
+
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{trait} should be given an operator and a value")
+    return tuple(value)
+
+def _number(trait: str, number):
+    """
+    Internal function returning <number>, or the number in a string, as a whole number
+    for id and a float otherwise. Raises ValueError if it is not one.
+    """
+
+    if isinstance(number, bool):
+        raise ValueError(f"{trait} should be compared to a number")
+
+    if trait == "id":
+        if isinstance(number, float) and number.is_integer():
+            number = int(number)
+        elif isinstance(number, str):
+            try:
+                number = int(number)
+            except ValueError:
+                pass
+        if not isinstance(number, int):
+            raise ValueError("id should be compared to a whole number")
+        return number
+
+    try:
+        return float(number)
+    except (TypeError, ValueError):
+        raise ValueError(f"{trait} should be compared to a number")
+
+def _filter_value(trait: str, value):
+    """
+    Internal function to check the <value> to filter <trait> by and return it
+    the way ProviderList.filter() takes it. Raises ValueError if it cannot filter,
+    with a message that can be sent back to API clients.
+    """
+
+    if trait == "id" or trait == "rating":
+        operator, number = _operator_value(trait, value)
+        if operator not in NUM_OPERATORS:
+            raise ValueError(f"{trait} operator should be one of {', '.join(NUM_OPERATORS)}")
+        numbers = _range_pair(trait, number) if operator == "between" else (number,)
+        numbers = tuple(_number(trait, number) for number in numbers)
+        return (operator, numbers if operator == "between" else numbers[0])
+
+    if trait == "birth_date":
+        operator, date = _operator_value(trait, value)
+        if operator not in DATE_OPERATORS:
+            raise ValueError(f"birth_date operator should be one of {', '.join(DATE_OPERATORS)}")
+        dates = _range_pair(trait, date) if operator == "between" else (date,)
+        for date in dates:
+            if not isinstance(date, str):
+                raise ValueError("birth_date should be compared to a YYYY-MM-DD string")
+            try:
+                pd.Timestamp(date)
+            except ValueError:
+                raise ValueError(f"birth_date should be compared to a YYYY-MM-DD date, not {date!r}")
+        return (operator, tuple(dates) if operator == "between" else dates[0])
+
+    if trait == "primary_skills" or trait == "secondary_skills":
+        if isinstance(value, str) or not all(isinstance(skill, str) for skill in value):
+            raise ValueError(f"{trait} should be a list of skills")
+        return list(value)
+
+    if trait == "active":
+        if not isinstance(value, bool):
+            raise ValueError("active should be true or false")
+        return value
+
+    if not isinstance(value, str):
+        raise ValueError(f"{trait} should be a string")
+    return value
+
+def build_filter_option_from_args(args) -> Filter_Options:
+    """
+    Takes in the query params of an API request and returns the Filter_Options they ask for.
+    Operators come before their value after a colon, as in rating=gt:4.5,
+    birth_date=before:1990-01-01 or rating=between:3,7, skills are comma separated or
+    repeated and active is true or false. Other params are left out. Raises ValueError
+    for values that cannot filter.
+    """
+
+    filters: Filter_Options = {}
+
+    for trait in FILTER_TRAITS & set(args.keys()):
+        value = args.get(trait)
+        if value == "":
+            continue
+
+        if trait in ("id", "rating", "birth_date"):
+            operator, _, value = value.partition(":")
+            value = (operator, value)
+        elif trait == "primary_skills" or trait == "secondary_skills":
+            value = [skill.strip() for values in args.getlist(trait)
+                     for skill in values.split(",") if skill.strip()]
+        elif trait == "active":
+            if value.lower() not in ("true", "false"):
+                raise ValueError("active should be true or false")
+            value = value.lower() == "true"
+
+        filters[trait] = _filter_value(trait, value)
+
+    return filters
+
+def build_filter_option_from_json(body: dict) -> Filter_Options:
+    """
+    Takes in the "filters" object of an API request's JSON body, shaped like
+    Filter_Options with operators and values as two item lists, and returns the
+    Filter_Options it asks for. Raises ValueError for unknown traits or values that cannot filter.
+    """
+
+    if not isinstance(body, dict):
+        raise ValueError("filters should be an object")
+
+    unknown = set(body) - FILTER_TRAITS
+    if unknown:
+        raise ValueError(f"cannot filter by {', '.join(sorted(unknown))}")
+
+    filters: Filter_Options = {}
+    for trait, value in body.items():
+        try:
+            filters[trait] = _filter_value(trait, value)
+        except TypeError:
+            raise ValueError(f"{trait} has the wrong shape of value")
+
+    return filters
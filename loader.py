@@ -0,0 +1,219 @@
+import gc
+import json
+import resource
+import sys
+import time
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+import pandas as pd
+from constants import CATEGORY_TRAITS
+from providers_types import Provider
+
+# providers parsed and turned into typed columns at a time
+DEFAULT_CHUNK_SIZE = 50_000
+# characters read from the file at a time
+READ_SIZE = 1 << 20
+INT_TRAITS = {"id"}
+FLOAT_TRAITS = {"rating"}
+BOOL_TRAITS = {"active"}
+DATE_TRAITS = {"birth_date"}
+
+class LoadReport:
+    """How many providers a load read, in how many chunks, how long it took and the peak RSS"""
+
+    def __init__(self, rows: int, chunks: int, seconds: float, peak_rss: int):
+        self.rows = rows
+        self.chunks = chunks
+        self.seconds = seconds
+        # bytes, the most memory the process has held so far
+        self.peak_rss = peak_rss
+
+    def __repr__(self):
+        return (f"<LoadReport {self.rows} providers in {self.chunks} chunks, "
+                f"{self.seconds:.2f}s, peak RSS {self.peak_rss / 1024 ** 2:.1f} MB>")
+
+def peak_rss() -> int:
+    """returns the peak resident set size of this process in bytes"""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _skip_whitespace(buffer: str, index: int) -> int:
+    while index < len(buffer) and buffer[index] in " \t\r\n,":
+        index += 1
+    return index
+
+def iter_json_array(json_file, read_size=READ_SIZE) -> Iterator[Provider]:
+    """
+    Yields the providers of a JSON array one at a time, reading <read_size>
+    characters from <json_file> at a time instead of the whole file
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = json_file.read(read_size).lstrip()
+
+    if not buffer.startswith("["):
+        raise ValueError("providers file should be a JSON array or NDJSON")
+
+    index = 1
+    finished_reading = False
+
+    while True:
+        index = _skip_whitespace(buffer, index)
+
+        if index < len(buffer) and buffer[index] == "]":
+            return
+
+        try:
+            provider, end = decoder.raw_decode(buffer, index)
+        except json.JSONDecodeError:
+            if finished_reading:
+                raise
+            # the next provider is cut off at the end of the buffer, read more
+            more = json_file.read(read_size)
+            finished_reading = not more
+            buffer = buffer[index:] + more
+            index = 0
+            continue
+
+        yield provider
+        index = end
+
+def iter_ndjson(json_file) -> Iterator[Provider]:
+    """Yields the providers of a newline delimited JSON file, one provider per line"""
+
+    for line in json_file:
+        if line.strip():
+            yield json.loads(line)
+
+def iter_providers(providers_json: str) -> Iterator[Provider]:
+    """
+    Yields the providers in <providers_json> one at a time,
+    which can either be a JSON array like providers.json or NDJSON
+    """
+
+    with open(providers_json) as json_file:
+        first = json_file.read(1)
+        while first.isspace():
+            first = json_file.read(1)
+        json_file.seek(0)
+
+        if first == "[":
+            yield from iter_json_array(json_file)
+        else:
+            yield from iter_ndjson(json_file)
+
+def iter_chunks(providers_json: str, chunk_size=DEFAULT_CHUNK_SIZE) -> Iterator[List[Provider]]:
+    """Yields lists of up to <chunk_size> providers from <providers_json>"""
+
+    chunk = []
+    for provider in iter_providers(providers_json):
+        chunk.append(provider)
+
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+class ColumnBuilder:
+    """
+    Builds typed columns chunk by chunk, so only one chunk of providers
+    is ever held as dicts. Low-cardinality CATEGORY_TRAITS are encoded into
+    integer codes as they are read, with one vocabulary per column.
+    """
+
+    def __init__(self):
+        self.traits: List[str] = []
+        self.chunks: Dict[str, List[np.ndarray]] = {}
+        self.vocabularies: Dict[str, Dict[str, int]] = {trait: {} for trait in CATEGORY_TRAITS}
+        self.rows = 0
+
+    def add(self, providers: List[Provider]):
+        """Adds the typed columns of a chunk of <providers>"""
+
+        if not self.traits:
+            self.traits = list(providers[0])
+            self.chunks = {trait: [] for trait in self.traits}
+
+        for trait in self.traits:
+            values = [provider.get(trait) for provider in providers]
+            self.chunks[trait].append(self._typed(trait, values))
+
+        self.rows += len(providers)
+
+    def _typed(self, trait: str, values: list) -> np.ndarray:
+        """Internal method to turn the <values> of one chunk's <trait> into a typed array"""
+
+        if trait in INT_TRAITS:
+            return np.array(values, dtype=np.int64)
+        if trait in FLOAT_TRAITS:
+            return np.array(values, dtype=np.float64)
+        if trait in BOOL_TRAITS:
+            return np.array(values, dtype=bool)
+        if trait in DATE_TRAITS:
+            return pd.to_datetime(values, format="%Y-%m-%d").values
+        if trait in self.vocabularies:
+            vocabulary = self.vocabularies[trait]
+            return np.array([-1 if value is None else vocabulary.setdefault(value, len(vocabulary))
+                             for value in values], dtype=np.int32)
+
+        # through pandas, as NumPy would turn a list of equally long skill lists into 2-D
+        return pd.Series(values, dtype=object).to_numpy()
+
+    def _categorical(self, trait: str, codes: np.ndarray) -> pd.Categorical:
+        """Internal method to turn codes in reading order into a Categorical with sorted categories"""
+
+        vocabulary = np.array(list(self.vocabularies[trait]), dtype=object)
+        order = np.argsort(vocabulary, kind="stable")
+        new_codes = np.empty(len(vocabulary) + 1, dtype=np.int32)
+        new_codes[order] = np.arange(len(vocabulary))
+        # keep -1 for missing values, which indexes the extra last slot
+        new_codes[-1] = -1
+
+        return pd.Categorical.from_codes(new_codes[codes], categories=vocabulary[order])
+
+    def frame(self) -> pd.DataFrame:
+        """Returns a dataframe of every column added so far"""
+
+        columns = {}
+        for trait in self.traits:
+            column = np.concatenate(self.chunks.pop(trait))
+            if trait in self.vocabularies:
+                column = self._categorical(trait, column)
+            columns[trait] = column
+
+        return pd.DataFrame(columns)
+
+def load_providers(providers_json: str,
+                   chunk_size=DEFAULT_CHUNK_SIZE) -> Tuple[pd.DataFrame, LoadReport]:
+    """
+    Streams the providers in <providers_json>, a JSON array or NDJSON file,
+    into a dataframe typed the same way as ProviderList.get_providers(),
+    without ever holding every provider as a dict. Returns the dataframe
+    along with a LoadReport of the load.
+    """
+
+    start = time.perf_counter()
+    builder = ColumnBuilder()
+    chunks = 0
+    # loading only makes acyclic dicts and lists, so the cyclic garbage collector
+    # repeatedly walking every skill list kept so far would be wasted work
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for chunk in iter_chunks(providers_json, chunk_size):
+            builder.add(chunk)
+            chunks += 1
+
+        providers_df = builder.frame()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    report = LoadReport(builder.rows, chunks, time.perf_counter() - start, peak_rss())
+
+    return (providers_df, report)
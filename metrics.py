@@ -0,0 +1,261 @@
+"""
+Instrumentation of the matching service, served at /metrics in the Prometheus text format.
+
+Every counter and histogram keeps a separate set of values for each thread that records
+into it, only ever written by that thread, so recording takes no lock and threads never
+wait on each other however busy the service is. The values of every thread are added
+up when /metrics is scraped. The values of threads that have finished are folded into
+one shared total, so counters never go down and a server starting a thread per request
+only keeps a set of values for each thread still running.
+"""
+
+import abc
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# upper bounds of the latency buckets in seconds, from half a millisecond to ten seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# upper bounds of the buckets of how many providers a filter kept
+SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Sequence[str], values: Sequence[str], extra="") -> str:
+    """Internal function formatting label <names> and <values> as {name="value",...}"""
+
+    pairs = [f'{name}="{_escape(value)}"' for (name, value) in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _ThreadMetric(abc.ABC):
+    """
+    Internal base of the metrics recorded per thread, holding the <name>, <help>
+    text and label names of the metric and a dictionary of values for each thread,
+    keyed by the label values they were recorded with
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        # the values of every running thread that has recorded, along with the thread
+        self._shards: List[Tuple[threading.Thread, dict]] = []
+        # the values of every thread that has finished, added up
+        self._finished: dict = {}
+        # only taken the first time a thread records into the metric and when read
+        self._shards_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+    def _shard(self) -> dict:
+        """Internal method returning the values of the calling thread"""
+
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._fold_finished()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _fold_finished(self):
+        """
+        Internal method adding the values of finished threads into the shared total
+        and dropping them, with the lock held. A finished thread never records again,
+        so its values are read without it changing them
+        """
+
+        running = []
+        for (thread, shard) in self._shards:
+            if thread.is_alive():
+                running.append((thread, shard))
+            else:
+                for (labels, value) in shard.items():
+                    self._finished[labels] = self._add(self._finished.get(labels), value)
+        self._shards = running
+
+    @abc.abstractmethod
+    def _add(self, total, value):
+        """Internal method returning the value <total>, None if there is none, plus <value>"""
+
+    def _snapshots(self) -> List[dict]:
+        with self._shards_lock:
+            self._fold_finished()
+            shards = [shard for (_, shard) in self._shards]
+            finished = {labels: self._add(None, value) for (labels, value) in self._finished.items()}
+        # copied so a thread recording while it is read cannot change its size
+        return [finished] + [dict(shard) for shard in shards]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_ThreadMetric):
+    """A count that only goes up, such as requests served or providers returned"""
+
+    kind = "counter"
+
+    def _add(self, total, value):
+        return value if total is None else total + value
+
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def value(self, labels: Tuple[str, ...] = ()) -> float:
+        """Returns the count recorded with <labels> across every thread"""
+
+        return sum(shard.get(labels, 0) for shard in self._snapshots())
+
+    def render(self) -> List[str]:
+        totals: Dict[tuple, float] = {}
+        for shard in self._snapshots():
+            for (labels, amount) in shard.items():
+                totals[labels] = totals.get(labels, 0) + amount
+
+        return super().render() + [f"{self.name}{_labels(self.labels, labels)} {_number(amount)}"
+                                   for (labels, amount) in sorted(totals.items())]
+
+class Histogram(_ThreadMetric):
+    """
+    How many observations, such as request latencies, fell at or under each of the
+    upper bounds in <buckets>, along with their count and sum
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _add(self, total, value):
+        if total is None:
+            return list(value)
+        for (bucket, count) in enumerate(value):
+            total[bucket] += count
+        return total
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # one count for each bucket, one for past the last bucket, then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def count(self, labels: Tuple[str, ...] = ()) -> int:
+        """Returns how many values were observed with <labels> across every thread"""
+
+        return sum(sum(shard[labels][:-1]) for shard in self._snapshots() if labels in shard)
+
+    def render(self) -> List[str]:
+        totals: Dict[tuple, List[float]] = {}
+        for shard in self._snapshots():
+            for (labels, counts) in shard.items():
+                total = totals.setdefault(labels, [0] * len(counts))
+                for (bucket, count) in enumerate(list(counts)):
+                    total[bucket] += count
+
+        lines = super().render()
+        for (labels, counts) in sorted(totals.items()):
+            cumulative = 0
+            for (bound, count) in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = _labels(self.labels, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {cumulative}")
+
+        return lines
+
+class Gauge:
+    """A value that is set rather than added to, such as how long the providers took to load"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+
+    def __repr__(self):
+        return f"<Gauge {self.name}>"
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()):
+        self._values[labels] = value
+
+    def value(self, labels: Tuple[str, ...] = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return ([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] +
+                [f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+                 for (labels, value) in sorted(dict(self._values).items())])
+
+class Registry:
+    """The metrics served together at /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def __repr__(self):
+        return f"<Registry of {len(self.metrics)} metrics>"
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        self.metrics.append(Counter(name, help, labels))
+        return self.metrics[-1]
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        self.metrics.append(Histogram(name, help, labels, buckets))
+        return self.metrics[-1]
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        self.metrics.append(Gauge(name, help, labels))
+        return self.metrics[-1]
+
+    def render(self) -> bytes:
+        """Returns every metric in the Prometheus text format"""
+
+        return ("\n".join(line for metric in self.metrics for line in metric.render()) + "\n").encode()
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "matching_request_duration_seconds", "Seconds taken to answer a request",
+    ("route", "method", "status"))
+FILTER_SECONDS = REGISTRY.histogram(
+    "matching_filter_duration_seconds", "Seconds taken by ProviderList.filter and filter_many",
+    ("method",))
+PREDICATE_SECONDS = REGISTRY.histogram(
+    "matching_predicate_duration_seconds", "Seconds taken by one predicate of a filter",
+    ("trait", "access"))
+FILTER_RESULTS = REGISTRY.histogram(
+    "matching_filter_results", "Providers kept by a filter", buckets=SIZE_BUCKETS)
+RETURNED_INCREMENTS = REGISTRY.counter(
+    "matching_returned_increments_total", "Increments of the returned counter")
+RETURNED_PROVIDERS = REGISTRY.counter(
+    "matching_returned_providers_total", "Providers counted as returned")
+CACHE_LOOKUPS = REGISTRY.counter(
+    "matching_query_cache_lookups_total", "Lookups of filters in the query cache", ("result",))
+LOAD_SECONDS = REGISTRY.gauge(
+    "matching_load_seconds", "Seconds the providers took to load", ("source",))
+LOADED_PROVIDERS = REGISTRY.gauge(
+    "matching_loaded_providers", "Providers read by the last load", ("source",))
@@ -0,0 +1,268 @@
+import itertools
+from typing import Dict, List, Optional, Union
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from constants import STR_TRAITS
+from skill_index import SkillIndex
+from search_index import StringIndex
+from range_index import SortedIndex
+from similarity import SkillSimilarity
+
+# code that no provider has, -1 is already the code of missing values
+MISSING_CODE = -2
+# every store made gets the next version, so results worked out on one can be told apart
+_versions = itertools.count(1)
+
+def _append_column(column, values: np.ndarray):
+    """Returns a new column of the values in <column> followed by <values>"""
+
+    if isinstance(column, pd.Categorical):
+        # categories only the new values have go after the existing ones,
+        # so the codes of the existing values stay the same
+        return union_categoricals([column, pd.Categorical(values)])
+
+    if isinstance(column, np.ndarray):
+        return np.concatenate((column, np.asarray(values)))
+
+    # dictionary encoded columns of a snapshot
+    return column.append(values)
+
+class ProviderStore:
+    """
+    Immutable, load-once columnar copy of the providers.
+
+    Every column is a read-only NumPy array where position i is the same provider
+    across columns, skill indexes and the returned counter. Filtering and sorting
+    never touch the store, they only work out which positions to keep and in what
+    order, so any number of ProviderList views can share one store safely.
+
+    Columns loaded as pandas Categoricals stay dictionary encoded: each has a
+    vocabulary from value to integer code, shared with its string index, so
+    equality filters compare small integer codes instead of strings.
+
+    Changing providers never changes a store either. append() returns a new store
+    with the new providers after the existing ones, which keep their positions,
+    and providers that were replaced are tombstoned: left in place but false in
+    the <live> mask, so they are not part of any new view. compact() returns
+    a new store of only the live providers once enough are tombstoned.
+    """
+
+    def __init__(self, columns: Dict[str, Union[np.ndarray, pd.Categorical]],
+                 primary_skills: SkillIndex,
+                 secondary_skills: SkillIndex,
+                 birth_dates: np.ndarray,
+                 string_indexes: Dict[str, StringIndex],
+                 live: Optional[np.ndarray] = None,
+                 skill_similarity: Optional[SkillSimilarity] = None):
+        self.columns = columns
+        self.version = next(_versions)
+        self.primary_skills = primary_skills
+        self.secondary_skills = secondary_skills
+        # substring search indexes for the STR_TRAITS columns
+        self.string_indexes = string_indexes
+        # birth dates formatted once so listing providers never converts dates again
+        self.birth_dates = birth_dates
+        # number of positions, tombstoned providers included
+        self.size = len(birth_dates)
+        # false at the positions of tombstoned providers, None if there are none
+        self.live = live
+        # shared starting rows for every view, so resetting a view is O(1)
+        self.all_rows = np.arange(self.size) if live is None else np.flatnonzero(live)
+        self.tombstones = self.size - len(self.all_rows)
+        # live positions ordered by id, worked out the first time an id is looked up
+        self._by_id: Optional[np.ndarray] = None
+        # sorted indexes of the range filtered columns, each built the first time it is used
+        self._sorted_indexes: Dict[str, SortedIndex] = {}
+        # TF-IDF matrix of skill tokens, built the first time similar providers are searched for
+        # unless it was loaded from a snapshot
+        self._skill_similarity = skill_similarity
+
+        # value to code, and number of providers with each code, of every encoded column
+        self.vocabularies: Dict[str, Dict[str, int]] = {}
+        self.category_counts: Dict[str, np.ndarray] = {}
+
+        for name, column in columns.items():
+            if isinstance(column, pd.Categorical):
+                codes = column.codes if live is None else column.codes[self.all_rows]
+                self.vocabularies[name] = {value: code
+                                           for code, value in enumerate(column.categories)}
+                self.category_counts[name] = np.bincount(codes[codes >= 0],
+                                                         minlength=len(column.categories))
+
+        for array in (*columns.values(), birth_dates, self.all_rows, live):
+            # the codes of Categoricals are already read-only
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+
+    def __repr__(self):
+        return f"<ProviderStore with {len(self)} providers, {self.tombstones} tombstoned>"
+
+    def __len__(self):
+        return len(self.all_rows)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """
+        Takes in a dataframe shaped like ProviderList.get_providers() returns
+        and builds the store columns, skill indexes and formatted birth dates from it.
+        The "returned" column is left out as counts live outside of the store.
+        """
+
+        columns = {column: df[column].values.copy() if df[column].dtype == "category"
+                   else df[column].to_numpy(copy=True)
+                   for column in df.columns if column != "returned"}
+        primary_skills = SkillIndex.from_column(df["primary_skills"])
+        secondary_skills = SkillIndex.from_column(df["secondary_skill"])
+        birth_dates = df["birth_date"].dt.strftime("%Y-%m-%d").to_numpy(dtype=object)
+        string_indexes = {}
+        for trait in sorted(STR_TRAITS):
+            if isinstance(columns.get(trait), pd.Categorical):
+                string_indexes[trait] = StringIndex.from_categorical(columns[trait])
+            elif trait in columns:
+                string_indexes[trait] = StringIndex.from_column(columns[trait])
+
+        return cls(columns, primary_skills, secondary_skills, birth_dates, string_indexes)
+
+    def append(self, df: pd.DataFrame, replaced=np.zeros(0, dtype=np.int64)):
+        """
+        Returns a new store of these providers followed by the providers in <df>,
+        typed like load_providers() returns, with the providers at the positions
+        in <replaced> tombstoned. Only the new providers are indexed, the indexes
+        of these providers are merged with theirs.
+        """
+
+        added = len(df)
+        columns = {name: _append_column(column, df[name].values)
+                   for name, column in self.columns.items()}
+        birth_dates = _append_column(self.birth_dates,
+                                     df["birth_date"].dt.strftime("%Y-%m-%d").to_numpy(dtype=object))
+        primary_skills = self.primary_skills.append(df["primary_skills"])
+        secondary_skills = self.secondary_skills.append(df["secondary_skill"])
+
+        string_indexes = {}
+        for trait, index in self.string_indexes.items():
+            if isinstance(columns[trait], pd.Categorical):
+                string_indexes[trait] = StringIndex.from_categorical(columns[trait], index)
+            else:
+                string_indexes[trait] = index.append(df[trait])
+
+        live = np.ones(self.size + added, dtype=bool)
+        if self.live is not None:
+            live[:self.size] = self.live
+        live[replaced] = False
+
+        store = ProviderStore(columns, primary_skills, secondary_skills, birth_dates,
+                              string_indexes, live)
+
+        if self._by_id is not None:
+            # drop the replaced providers from the id order and merge the new ones in
+            by_id = self._by_id[live[self._by_id]]
+            new_rows = np.arange(self.size, self.size + added)
+            new_ids = store.columns["id"][new_rows]
+            order = np.argsort(new_ids, kind="stable")
+            places = np.searchsorted(store.columns["id"][by_id], new_ids[order])
+            store._by_id = np.insert(by_id, places, new_rows[order])
+
+        return store
+
+    def compact(self):
+        """
+        Returns a new store of only the live providers, in the same order,
+        with their columns and indexes rebuilt without the tombstoned providers
+        """
+
+        return self.subset(self.all_rows)
+
+    def subset(self, rows: np.ndarray):
+        """
+        Returns a new store of only the providers at the positions in <rows>, in that order,
+        with their columns and indexes rebuilt for just those providers
+        """
+
+        df = self.frame(rows).reset_index(drop=True)
+        for name in self.vocabularies:
+            # values only the providers left out had are dropped and the rest sorted again
+            categories = df[name].cat.remove_unused_categories().cat.categories
+            df[name] = df[name].cat.set_categories(sorted(categories))
+
+        return ProviderStore.from_frame(df)
+
+    def positions_of(self, ids) -> np.ndarray:
+        """
+        Returns the position of the live provider with each id in <ids>,
+        or -1 for ids no live provider has
+        """
+
+        if self._by_id is None:
+            self._by_id = self.all_rows[np.argsort(self.columns["id"][self.all_rows],
+                                                   kind="stable")]
+
+        ids = np.asarray(ids)
+        sorted_ids = self.columns["id"][self._by_id]
+
+        if len(sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+
+        places = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[places] == ids, self._by_id[places], -1)
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, name: str) -> Union[np.ndarray, pd.Categorical]:
+        return self.columns[name]
+
+    def sorted_index(self, name: str) -> SortedIndex:
+        """
+        Returns the SortedIndex of the numeric or date column <name>,
+        sorting the column the first time it is asked for
+        """
+
+        index = self._sorted_indexes.get(name)
+        if index is None:
+            index = self._sorted_indexes[name] = SortedIndex(self.columns[name])
+        return index
+
+    def skill_similarity(self) -> SkillSimilarity:
+        """
+        Returns the SkillSimilarity matrix of the skills of every provider,
+        building it from the skill indexes the first time it is asked for
+        """
+
+        if self._skill_similarity is None:
+            self._skill_similarity = SkillSimilarity.from_indexes(self.primary_skills,
+                                                                  self.secondary_skills)
+        return self._skill_similarity
+
+    def code_of(self, name: str, value) -> int:
+        """
+        Returns the code of <value> in the encoded column <name>,
+        or MISSING_CODE which no provider has if no provider has <value>
+        """
+
+        return self.vocabularies[name].get(value, MISSING_CODE)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Returns how many bytes each column takes up, counting the strings in it"""
+
+        usage = {}
+        for name, column in self.columns.items():
+            if isinstance(column, pd.Categorical):
+                usage[name] = column.memory_usage(deep=True)
+            elif isinstance(column, np.ndarray) and column.dtype == object:
+                usage[name] = int(pd.Series(column).memory_usage(deep=True, index=False))
+            else:
+                usage[name] = column.nbytes
+
+        return usage
+
+    def frame(self, rows: np.ndarray) -> pd.DataFrame:
+        """
+        Builds a dataframe of the providers at the positions in <rows>,
+        indexed by those positions.
+        """
+
+        return pd.DataFrame({name: column[rows] for name, column in self.columns.items()},
+                            index=rows)
@@ -1,33 +1,257 @@
+import copy
 import json
-from typing import List, Union
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import numpy as np
 import pandas as pd
-from helpers import intersection, unique_union
 from providers_types import Filter_Options, Provider
-from constants import STR_TRAITS
-
-# I am not chaining assignment and am just rewriting in the internal increment method
-pd.options.mode.chained_assignment = None
+from constants import DATE_OPERATORS, NUM_OPERATORS, CATEGORY_TRAITS, COMPACT_FRACTION, PAGE_SIZE
+from helpers import sort_key
+from skill_index import SkillIndex
+from provider_store import ProviderStore
+from counters import ReturnedCounter, PersistentReturnedCounter
+from ranking import Ranker
+from scoring import BlendedScorer, ScoringFunction, top_scores
+from query_plan import BatchPlan, QueryPlan
+from facets import category_counts, skill_counts, top_counts
+from relevance import SoftMatcher
+from range_index import INDEX_FRACTION
+from explain import QueryExplanation, tracing_allocations
+from metrics import FILTER_RESULTS, FILTER_SECONDS, LOAD_SECONDS, LOADED_PROVIDERS
+from query_cache import QueryCache, canonical_filter
+from loader import ColumnBuilder, LoadReport, load_providers, peak_rss
+from snapshot import load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
 
 class ProviderList:
-    def __init__(self, providers_json):
+    def __init__(self, providers_json, counter_path: Optional[str] = None,
+                 half_life: Optional[float] = None):
         """
-        Create list and dataframe attribute from provided json file.
-        Also creates primary_skills and secondary_skills attributes which are used
-        for filtering providers by skill.
+        Load the providers in the provided json file into an immutable ProviderStore
+        and start a view over all of them. The store also holds the primary_skills
+        and secondary_skills inverted skill indexes used for filtering providers by skill.
+        If <counter_path> is given the returned counts are kept in that file,
+        so they last between runs and are shared with other processes using it.
+        If <half_life> is given in seconds, the counter also keeps decayed returned
+        counts which rank_by_score() uses instead of the plain counts.
+        The file can be a JSON array or NDJSON and is streamed in chunks,
+        see load_report for how long it took and how much memory it used.
         """
 
-        (self.providers, self.df) = ProviderList.get_providers(providers_json)
-        (self.primary_skills, self.secondary_skills) = ProviderList.get_skills_dict(self.df)
+        (providers_df, self.load_report) = load_providers(providers_json)
+        self._start(ProviderStore.from_frame(providers_df), counter_path, half_life)
+        LOAD_SECONDS.set(self.load_report.seconds, ("json",))
+        LOADED_PROVIDERS.set(self.load_report.rows, ("json",))
+
+    def _start(self, store: ProviderStore, counter_path: Optional[str],
+               half_life: Optional[float], rating_rank: Optional[np.ndarray] = None):
+        """Internal method to set up the counter, ranker and a view over all of <store>"""
+
+        self.store = store
         # counter for each row that will be incremented for each time came back from a filter
-        self.returned = self.df["returned"]
+        if counter_path is None:
+            self.counter = ReturnedCounter(self.store.size, half_life=half_life)
+        else:
+            self.counter = PersistentReturnedCounter(self.store.size, counter_path,
+                                                     half_life=half_life)
+        self.ranker = Ranker(self.store.column("rating"), rating_rank, self.store.live)
+        # held while the providers are changed, shared with every view
+        self._update_lock = threading.RLock()
+        # providers kept by recent filters over every provider, shared with every view
+        self.query_cache = QueryCache()
+        # scoring function used by rank_by_score, can be swapped for any ScoringFunction
+        self.scorer: ScoringFunction = BlendedScorer()
+        # scores how well providers meet the traits given to match()
+        self.matcher = SoftMatcher()
+        # positions in the store of the providers in this view, in order
+        self._rows = self.store.all_rows
+        # warnings raised while explaining a query of this view, see explain()
+        self._warnings: Optional[List[str]] = None
+
+    @classmethod
+    def load_snapshot(cls, path: str, counter_path: Optional[str] = None,
+                      half_life: Optional[float] = None):
+        """
+        Start a ProviderList from a snapshot directory written by save_snapshot(),
+        mapping its columns and indexes into memory instead of parsing any json,
+        so processes loading the same snapshot share its pages.
+        <counter_path> and <half_life> work the same as when loading json.
+        """
+
+        start = time.perf_counter()
+        (store, rating_rank) = load_snapshot(path)
+        providers = cls.__new__(cls)
+        providers._start(store, counter_path, half_life, rating_rank)
+        providers.load_report = LoadReport(len(store), 0, time.perf_counter() - start, peak_rss())
+        LOAD_SECONDS.set(providers.load_report.seconds, ("snapshot",))
+        LOADED_PROVIDERS.set(len(store), ("snapshot",))
+
+        return providers
+
+    def save_snapshot(self, path: str):
+        """
+        Save every provider in the store, with its skill and search indexes,
+        as a binary columnar snapshot directory at <path> for load_snapshot().
+        Returned counts are not part of the snapshot.
+        """
+
+        save_snapshot(path, self.store, self.ranker.rating_rank)
+        return self
+
+    def add_providers(self, providers: List[Provider]):
+        """
+        Add new <providers> after the existing ones without reloading, only indexing
+        the new providers. Raises ValueError if any of their ids is already taken.
+        """
+
+        ids = [provider["id"] for provider in providers]
+        taken = sorted({provider_id for provider_id, position
+                        in zip(ids, self.store.positions_of(ids)) if position >= 0})
+        if taken or len(set(ids)) < len(ids):
+            raise ValueError(f"provider ids should be new and unique, {taken} are taken")
+
+        return self.apply_deltas([{"op": "upsert", "provider": provider}
+                                  for provider in providers])
+
+    def update_provider(self, provider_id: int, changes: Dict):
+        """
+        Change the traits in <changes> of the provider with <provider_id>.
+        The provider is tombstoned and added again with the changes, keeping its
+        returned count. Raises KeyError if no provider has <provider_id>.
+        """
+
+        return self.apply_deltas([{"op": "update", "id": provider_id, "changes": changes}])
+
+    def deactivate_provider(self, provider_id: int):
+        """
+        Set the provider with <provider_id> as no longer active, the same as
+        update_provider(provider_id, {"active": False})
+        """
+
+        return self.apply_deltas([{"op": "deactivate", "id": provider_id}])
+
+    def _provider(self, provider_id: int) -> Provider:
+        """Internal method to get the live provider with <provider_id> as a dict"""
+
+        position = self.store.positions_of([provider_id])[0]
+        if position < 0:
+            raise KeyError(f"no provider has the id {provider_id}")
+
+        view = self.view()
+        view._rows = np.array([position])
+        return view.list()[0]
+
+    def apply_deltas(self, deltas: Iterable[Dict]):
+        """
+        Apply a batch of <deltas> in order as one change to the store, where each is
+          - {"op": "upsert", "provider": {...}} to add a provider or replace the one with its id
+          - {"op": "update", "id": id, "changes": {...}} to change some traits of a provider
+          - {"op": "deactivate", "id": id} to set a provider as no longer active
+        Replaced providers are tombstoned and keep their returned count at their new position.
+        The store is compacted once more than COMPACT_FRACTION of it is tombstoned.
+        Views taken before keep seeing the providers as they were.
+        """
+
+        with self._update_lock:
+            pending: Dict[int, Provider] = {}
+
+            for delta in deltas:
+                op = delta.get("op")
+
+                if op == "upsert":
+                    provider = dict(delta["provider"])
+                elif op == "update" or op == "deactivate":
+                    provider_id = delta["id"]
+                    changes = delta.get("changes", {}) if op == "update" else {"active": False}
+                    if changes.get("id", provider_id) != provider_id:
+                        raise ValueError("the id of a provider cannot be changed")
+
+                    current = pending.get(provider_id) or self._provider(provider_id)
+                    provider = {**current, **changes}
+                else:
+                    raise ValueError(f"unknown delta op {op}, use upsert, update or deactivate")
+
+                pending[provider["id"]] = provider
+
+            if pending:
+                self._append(list(pending.values()))
+
+        return self
+
+    def _append(self, providers: List[Provider]):
+        """
+        Internal method to add <providers> to a new store generation,
+        tombstoning the live providers with the same ids
+        """
+
+        missing = set(self.store.column_names) - set().union(*providers)
+        if missing:
+            raise ValueError(f"providers are missing the traits {sorted(missing)}")
+
+        builder = ColumnBuilder()
+        builder.add([{trait: provider.get(trait) for trait in self.store.column_names}
+                     for provider in providers])
+        df = builder.frame()
+
+        positions = self.store.positions_of(df["id"].to_numpy())
+        replaced = positions >= 0
+        store = self.store.append(df, positions[replaced])
+
+        self.counter.grow(store.size)
+        self.counter.move(positions[replaced], self.store.size + np.flatnonzero(replaced))
+        ranker = self.ranker.append(store.column("rating"), store.live)
+
+        if self._rows is self.store.all_rows:
+            rows = store.all_rows
+        else:
+            rows = self._rows[store.live[self._rows]]
+
+        # a single dict update, so a view() taken meanwhile copies either
+        # every attribute before the change or every attribute after it
+        self.__dict__.update({"store": store, "ranker": ranker, "_rows": rows})
+        self.query_cache.clear()
+
+        if store.tombstones > COMPACT_FRACTION * store.size:
+            self.compact()
+
+    def compact(self):
+        """
+        Rebuild the store with only the live providers, dropping every tombstone.
+        Returned counts move along with their providers.
+        """
+
+        with self._update_lock:
+            keep = self.store.all_rows
+            store = self.store.compact()
+            counter = self.counter.compacted(keep)
+            ranker = Ranker(store.column("rating"))
+
+            if self._rows is self.store.all_rows:
+                rows = store.all_rows
+            else:
+                # new position of every old position that is kept
+                new_positions = np.cumsum(self.store.live) - 1
+                rows = new_positions[self._rows]
+
+            self.__dict__.update({"store": store, "counter": counter,
+                                  "ranker": ranker, "_rows": rows})
+            self.query_cache.clear()
+
+        return self
 
     def __repr__(self):
         """
-        Show Representation of how many rows and columns along with current dataframe.
+        Show Representation of how many providers are in the store and the current view.
         """
 
-        return f"""<Provider_list object with {len(self.providers)} providers.>
-        {len(self.df.index)} in current filtered dataFrame"""
+        return f"""<Provider_list object with {len(self.store)} providers.>
+        {len(self)} in current filtered dataFrame"""
+
+    def __len__(self):
+        return len(self._rows)
 
     @staticmethod
     def get_providers(providers_json):
@@ -42,84 +266,160 @@ class ProviderList:
             # Convert column to datetime64
             providers_df["birth_date"] = pd.to_datetime(providers_df["birth_date"],
                                                         format="%Y-%m-%d")
+            ProviderList.encode_categories(providers_df)
             providers_df["returned"] = 0
 
         return (providers_list, providers_df)
 
     @staticmethod
-    def get_skills_dict(df: pd.DataFrame):
+    def encode_categories(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Dictionary encodes the low-cardinality CATEGORY_TRAITS columns
+        of <df> in place into pandas Categoricals and returns <df>
+        """
+
+        for trait in CATEGORY_TRAITS:
+            if trait in df.columns:
+                df[trait] = df[trait].astype("category")
+
+        return df
+
+    @staticmethod
+    def get_skills_index(df: pd.DataFrame):
         """
         Takes in a dataframe with a primary_skills and secondary_skill column
-        and returns a tuple with dicts of the skills as the keys and
-        a list of the indexes for the rows of the df which has those skills as the value
+        and returns a tuple of SkillIndex objects with the lowercased skills as keys
+        and a sorted array of the positions of the rows which have those skills
 
-        The returned list of index value used for df.iloc() method to return
-        only providers with those skills
+        The positions line up with df.iloc() so a skill lookup can be turned
+        into a boolean mask over the whole dataframe
         """
-        primary_skills: dict[str, list] = {}
-        secondary_skills: dict[str, list] = {}
 
-        for index, row in df[["primary_skills", "secondary_skill"]].iterrows():
+        primary_skills = SkillIndex.from_column(df["primary_skills"])
+        secondary_skills = SkillIndex.from_column(df["secondary_skill"])
 
-            skill:str
-            for skill in row["primary_skills"]:
-                skill=skill.lower()
-                if skill not in primary_skills:
-                    primary_skills[skill] = []
+        return (primary_skills, secondary_skills)
 
-                primary_skills[skill].append(index)
+    @property
+    def primary_skills(self) -> SkillIndex:
+        return self.store.primary_skills
 
-            for skill in row["secondary_skill"]:
-                skill=skill.lower()
-                if skill not in secondary_skills:
-                    secondary_skills[skill] = []
+    @property
+    def secondary_skills(self) -> SkillIndex:
+        return self.store.secondary_skills
 
-                secondary_skills[skill].append(index)
+    @property
+    def providers(self) -> List[Provider]:
+        """
+        The source list of providers without the returned column,
+        built from the store when asked for.
+        """
 
-        return (primary_skills, secondary_skills)
+        return self.view().reset().list()
+
+    @property
+    def returned(self) -> pd.Series:
+        """Snapshot of the returned counter as a series indexed by position in the store"""
+
+        return pd.Series(self.counter.snapshot())
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """
+        Dataframe of the providers in the current view along with their returned column,
+        indexed by their position in the store. Built from the store when asked for.
+        """
+
+        df = self.store.frame(self._rows)
+        df["returned"] = self.counter[self._rows]
+        return df
+
+    @df.setter
+    def df(self, df: pd.DataFrame):
+        """Narrow or reorder the current view to the rows of <df>, which came from this view."""
+
+        self._rows = df.index.to_numpy()
+
+    def view(self):
+        """
+        Return a new ProviderList starting from the same rows as this one,
+        which shares the store and returned counter but filters and sorts
+        without changing this one. Cheap enough to make one for every request.
+        """
+
+        view = copy.copy(self)
+        view._rows = self._rows
+        view._warnings = None
+        return view
+
+    def _column(self, name: str) -> np.ndarray:
+        """Internal method to get the values of column <name> for the rows in the current view"""
+
+        if name == "returned":
+            return self.counter[self._rows]
+
+        return self.store.column(name)[self._rows]
 
     def _increment_returned_counter(self):
         """
-        Internal method to increment both the returned attribute
-        and the returned column in the current dataframe
+        Internal method to increment the returned counter
+        for the rows in the current view
         """
 
-        filtered_index = self.df.index
-        self.df["returned"] = self.df["returned"] + 1
-        self.returned.iloc[filtered_index] = self.returned.iloc[filtered_index] + 1
+        self.counter.increment(self._rows)
         return self
 
-    def list(self, with_returned=False) -> List[Provider]:
+    def mark_returned(self, times=1):
+        """
+        Counts every provider in the current view as returned <times> more times,
+        for when the same results were sent to more than one client
+        """
+
+        self.counter.increment(self._rows, times)
+        return self
+
+    def list(self, with_returned=False, limit: Optional[int] = None, offset=0) -> List[Provider]:
         """
         Return a list representation of the current filtered dataframe.
         Can choose to return the "returned" column in the dataframe.
+        Only the page of <limit> rows starting at <offset> is built,
+        by default every row from <offset> onward.
         """
 
-        #this method of copying without returned col not working as it messes with column order
+        stop = None if limit is None else offset + limit
+        page = self._rows[offset:stop]
+        columns = self.store.column_names
 
-        # if with_returned:
-        #     df_copy = self.df.copy()
-        # else:
-        #     df_copy = self.df[self.df.columns.difference(["returned"])].copy()
+        # build whole columns of python values at once and zip them into
+        # rows instead of converting the dataframe row by row
+        values = []
+        for column in columns:
+            if column == "birth_date":
+                values.append(self.store.birth_dates[page].tolist())
+            else:
+                values.append(self.store.column(column)[page].tolist())
 
-        df_copy = self.df.copy()
+        if with_returned:
+            columns = [*columns, "returned"]
+            values.append(self.counter[page].tolist())
 
-        # Convert datetime column into a string column
-        df_copy["birth_date"] = df_copy["birth_date"].astype(str)
-        filtered_provider_list = []
+        return [dict(zip(columns, row)) for row in zip(*values)]
 
-        for index, row in df_copy.iterrows():
-            filtered_provider_list.append(row.to_dict())
+    def to_json(self, with_returned=False, limit: Optional[int] = None, offset=0) -> bytes:
+        """
+        Return the same page of providers as list() already encoded as JSON bytes,
+        ready to be sent to API clients.
+        """
 
-        return filtered_provider_list
+        providers_list = self.list(with_returned=with_returned, limit=limit, offset=offset)
+        return json.dumps(providers_list, separators=(",", ":")).encode()
 
     def sort_rating(self, ascending = False):
         """
         Sort the current dataframe by rating, by default descending order.
         """
 
-        self.df = self.df.sort_values(by=['rating'], ascending=ascending)
-        return self
+        return self.sort(["rating"], [ascending])
 
     def sort(self, columns: List[str], ascending: List[bool]):
         """
@@ -127,8 +427,41 @@ class ProviderList:
         are determined by a list of <columns>. Whether those columns are ascending
         or descending is determined by the <ascending> list of booleans for the respective column
         """
-        
-        self.df = self.df.sort_values(by=columns, ascending=ascending)
+
+        # np.lexsort sorts by the last key first and keeps ties in their current order
+        keys = [sort_key(self._column(column), column_ascending)
+                for column, column_ascending in zip(reversed(columns), reversed(ascending))]
+        self._rows = self._rows[np.lexsort(keys)]
+        return self
+
+    def rank(self, limit: Optional[int] = None):
+        """
+        Order the current view by returned ascending and then rating descending,
+        the same order as sort(DEFAULT_COLUMNS, DEFAULT_ORDER) with ties kept in store order.
+        If <limit> is given only the first <limit> rows are put in order,
+        the rest follow in no particular order.
+        A view of every provider reuses the ranking cached by the ranker.
+        """
+
+        if self._rows is self.store.all_rows:
+            self._rows = self.ranker.ranked_all(self.counter)
+        else:
+            self._rows = self.ranker.top_k(self._rows, self.counter[self._rows], limit)
+
+        return self
+
+    def rank_by_score(self, scorer: Optional[ScoringFunction] = None,
+                      limit: Optional[int] = None):
+        """
+        Order the current view by a score from highest to lowest, worked out in one
+        vectorized pass from the rating and the decayed returned count of every provider.
+        Uses the <scorer> scoring function if given, otherwise the scorer attribute.
+        If <limit> is given only the first <limit> rows are put in order.
+        """
+
+        scorer = scorer or self.scorer
+        scores = scorer(self._column("rating"), self.counter.decayed(self._rows))
+        self._rows = self._rows[top_scores(scores, limit)]
         return self
 
     def reset(self, counter_reset=False):
@@ -138,12 +471,153 @@ class ProviderList:
         """
 
         if counter_reset:
-            self.returned[:] = 0
-        
-        self.df = pd.DataFrame(self.providers)
-        self.df["returned"] = self.returned
+            self.counter.reset()
+
+        self._rows = self.store.all_rows
         return self
 
+    def _apply_mask(self, mask: np.ndarray, count_returned=True):
+        """
+        Internal method to keep only the rows of the current dataframe where
+        <mask> is true and, unless <count_returned> is false, count them as returned
+        """
+
+        self._rows = self._rows[mask]
+        if count_returned:
+            self._increment_returned_counter()
+        return self
+
+    def _str_mask(self, trait: str, value: str) -> np.ndarray:
+        """
+        Mask of rows in the current dataframe where the column <trait>
+        contains the substring <value>, ignoring case.
+        Uses the store's search index for the column if it has one
+        """
+
+        if trait in self.store.string_indexes:
+            return self.store.string_indexes[trait].mask(value, self._rows)
+
+        values = pd.Series(self._column(trait))
+        return values.str.contains(value, case=False, regex=False).to_numpy(dtype=bool)
+
+    def _sex_mask(self, sex: str) -> np.ndarray:
+        """Mask of rows in the current dataframe where the provider is <sex>"""
+
+        return self._equal_mask("sex", sex)
+
+    def _equal_mask(self, trait: str, value) -> np.ndarray:
+        """
+        Mask of rows in the current dataframe where the column <trait> is <value>,
+        comparing integer codes if the column is dictionary encoded
+        """
+
+        column = self.store.column(trait)
+
+        if isinstance(column, pd.Categorical):
+            return column.codes[self._rows] == self.store.code_of(trait, value)
+
+        return column[self._rows] == value
+
+    def _range_mask(self, trait: str, operator: str, value) -> np.ndarray:
+        """
+        Internal method for the mask of rows in the current dataframe where the numeric
+        or date column <trait> is <operator> <value>, with any dates already parsed.
+        Ranges narrow enough are read from the store's sorted index of the column,
+        wider ones compare every row.
+        """
+
+        index = self.store.sorted_index(trait)
+        (start, end) = index.bounds(operator, value)
+        # a view of every position in store order needs no gathering
+        whole_store = self._rows is self.store.all_rows and self.store.live is None
+
+        if self._reads_sorted_index(end - start):
+            mask = np.zeros(self.store.size, dtype=bool)
+            mask[index.order[start:end]] = True
+            return mask if whole_store else mask[self._rows]
+
+        column = self.store.column(trait) if whole_store else self._column(trait)
+
+        if operator == "between":
+            (low, high) = value
+            return (column >= low) & (column <= high)
+        elif operator == "eq" or operator == "at":
+            return column == value
+        elif operator == "gt" or operator == "after":
+            return column > value
+        else:
+            return column < value
+
+    def _reads_sorted_index(self, count: int) -> bool:
+        """Internal method for whether a range matching <count> rows is read from its sorted index"""
+
+        return count <= INDEX_FRACTION * len(self._rows)
+
+    def _warn(self, message: str):
+        """
+        Internal method to report a problem with a filter, such as an unknown skill,
+        which is logged and added to the warnings of the query being explained
+        """
+
+        logger.warning(message)
+        if self._warnings is not None:
+            self._warnings.append(message)
+
+    def _date_mask(self, operator: str, date: Union[str, Tuple[str, str]]) -> Optional[np.ndarray]:
+        """
+        Mask of rows in the current dataframe where the birthday is at, after,
+        or before <date>, or between a (low, high) pair of dates. None if <operator> is not used
+        """
+
+        dates = date if operator == "between" else (date,)
+        if isinstance(dates, str) or any(type(date) is not str for date in dates):
+            raise TypeError("date param should be a string")
+
+        if operator not in DATE_OPERATORS:
+            self._warn("That operation is not used. use at, after, before, or between instead")
+            return None
+
+        # parse the dates once instead of once per row compared
+        parsed = [pd.Timestamp(date).to_datetime64() for date in dates]
+        return self._range_mask("birth_date", operator,
+                                tuple(parsed) if operator == "between" else parsed[0])
+
+    def _num_mask(self, trait: str, operator: str,
+                  value: Union[int, float, Tuple[float, float]]) -> Optional[np.ndarray]:
+        """
+        Mask of rows in the current dataframe where the column <trait> is equal to,
+        greater than, or less than <value>, or between a (low, high) pair.
+        None if <operator> is not used
+        """
+
+        if operator not in NUM_OPERATORS:
+            self._warn("That operation is not used. use eq, gt, lt, or between instead")
+            return None
+
+        return self._range_mask(trait, operator, value)
+
+    def _active_mask(self, active: bool) -> np.ndarray:
+        """Mask of rows in the current dataframe where the provider's active is <active>"""
+
+        return self._column("active") == active
+
+    def _skills_mask(self, skills: List[str], primary=True, match_all=False) -> np.ndarray:
+        """
+        Mask of rows in the current dataframe where the provider has any,
+        or all if <match_all>, of the <skills>
+        """
+
+        skills_index = self.primary_skills if primary else self.secondary_skills
+        kind = "primary" if primary else "secondary"
+
+        for skill in skills:
+            if skill.lower() not in skills_index:
+                self._warn(f"{skill.lower()} is not in list of {kind} skills")
+
+        # bitmap over the whole store, so gather it at the rows in the current view
+        has_skills = skills_index.mask(skills, match_all=match_all)
+        return has_skills[self._rows]
+
     def filter_by_str(self, trait:str, value: str):
         """
         Filters out rows of data from current dataframe
@@ -151,9 +625,7 @@ class ProviderList:
         in the column/trait of <trait>.
         """
 
-        self.df = self.df[self.df[trait].str.contains(value, case=False)]
-        self._increment_returned_counter()
-        return self
+        return self._apply_mask(self._str_mask(trait, value))
 
     def filter_by_sex(self, sex: str):
         """
@@ -161,11 +633,9 @@ class ProviderList:
         by what sex the provider is
         """
 
-        self.df = self.df[self.df["sex"] == sex]
-        self._increment_returned_counter()
-        return self
+        return self._apply_mask(self._sex_mask(sex))
 
-    def filter_by_date(self, operator: str, date: str):
+    def filter_by_date(self, operator: str, date: Union[str, Tuple[str, str]]):
         """ 
         Filters out rows of data from current dataframe
         by whether the row has a birthday that is
@@ -174,27 +644,19 @@ class ProviderList:
         <date> should be in "YYYY-MM-DD" format
         
         Which operation is determined by the <operator> which can be the following:
-        'at' for equal, 'after' for greater than, or 'before' for less than.
+        'at' for equal, 'after' for greater than, or 'before' for less than,
+        or 'between' with a (low, high) pair of dates for <date>, both included.
         """
 
-        if type(date) is not str:
-            raise TypeError("date param should be a string")
+        mask = self._date_mask(operator, date)
 
-        if operator == "at":
-            self.df = self.df.loc[self.df["birth_date"] == date]
-            self._increment_returned_counter()
-        elif operator == "after":
-            self.df = self.df.loc[self.df["birth_date"] > date]
-            self._increment_returned_counter()
-        elif operator == "before":
-            self.df = self.df.loc[self.df["birth_date"] < date]
-            self._increment_returned_counter()
-        else:
-            print("That operation is not used. use at, after, or before instead")
+        if mask is not None:
+            self._apply_mask(mask)
 
         return self
 
-    def filter_by_num(self, trait: str, operator: str, value: Union[int,float]):
+    def filter_by_num(self, trait: str, operator: str,
+                      value: Union[int, float, Tuple[float, float]]):
         """
         Filters out rows of data from current dataframe
         whether the row contains a number with
@@ -202,20 +664,15 @@ class ProviderList:
         in the column/trait of <trait> parameter.
         
         which operation is determined by the <operator> which can be the following:
-        'eq' for equal, 'gt' for greater than, or 'lt' for less than.
+        'eq' for equal, 'gt' for greater than, or 'lt' for less than,
+        or 'between' with a (low, high) pair for <value>, both included.
         """
 
-        if operator == "eq":
-            self.df = self.df[self.df[trait] == value]
-            self._increment_returned_counter()
-        elif operator == "gt":
-            self.df = self.df[self.df[trait] > value]
-            self._increment_returned_counter()
-        elif operator == "lt":
-            self.df = self.df[self.df[trait] < value]
-            self._increment_returned_counter()
-        else:
-            print("That operation is not used. use eq, gt, or lt instead")
+        mask = self._num_mask(trait, operator, value)
+
+        if mask is not None:
+            self._apply_mask(mask)
+
         return self
 
     def filter_active(self, active = True):
@@ -225,60 +682,220 @@ class ProviderList:
         by default selects active
         """
 
-        self.df = self.df.loc[self.df['active'] == active]
-        self._increment_returned_counter()
-        return self
+        return self._apply_mask(self._active_mask(active))
 
-    def filter_by_skills(self, skills: List[str], primary=True):
+    def filter_by_skills(self, skills: List[str], primary=True, match_all=False):
         """ 
         Filters out rows of data from current dataframe by
         whether that provider has the skills in the <skills> list. 
         By default checks skills in primary_skills,
-        will check secondary_skills if <primary> is false
+        will check secondary_skills if <primary> is false.
+        By default a provider needs any of the skills,
+        if <match_all> is true a provider needs all of them
         """
 
-        providers_index = []
+        return self._apply_mask(self._skills_mask(skills, primary, match_all))
 
-        for skill in skills:
+    def plan(self, traits: Filter_Options) -> QueryPlan:
+        """
+        Compiles the dictionary <traits> into a QueryPlan of predicates
+        over the current dataframe, ordered by estimated selectivity
+        """
 
-            skill = skill.lower()
-            skills_intersection = []
-
-            if primary:
-                if skill in self.primary_skills:
-                    # Get the intersection of providers with relevant skill
-                    # and providers that are in current dataframe otherwise
-                    # there will be an out of bounds access error for trying to
-                    # access a provider with a skill that has been previously
-                    # filtered out through a different method
-                    skills_intersection = intersection( self.df.index,
-                                                        self.primary_skills[skill])
-                else:
-                    print(f"{skill} is not in list of primary skills")
+        return QueryPlan.compile(self, traits)
 
-            else:
-                if skill in self.secondary_skills:
-                    skills_intersection = intersection( self.df.index,
-                                                        self.secondary_skills[skill])
-                else:
-                    print(f"{skill} is not in list of secondary skills")
-            
-            # prevent duplicates by getting uniques instead of just adding to list
-            providers_index = unique_union(providers_index, skills_intersection)
-
-        # mapping through indexes to prevent out of bounds access error
-        mapped_indexes=[]
-        for idx, val in enumerate(list(self.df.index)):
-            for provider_with_skill_idx in providers_index:
-                if val == provider_with_skill_idx:
-                    mapped_indexes.append(idx)
-        
-        # gets rows of providers based on list of indexes by which indexes have skills
-        self.df = self.df.iloc[mapped_indexes]
-        self._increment_returned_counter()
+    def match(self, traits: Filter_Options, limit: Optional[int] = None,
+              matcher: Optional[SoftMatcher] = None, count_returned=True):
+        """
+        Relevance mode of filter(): instead of only keeping the providers that meet
+        every trait, keeps the providers of the current dataframe that come close to
+        any of the skills, rating and birth date in <traits>, ordered from most to least
+        relevant, so providers having some but not all of the skills asked for are still
+        found. Every other trait, such as sex or country, still has to be met.
+        If <limit> is given only the first <limit> rows are put in order,
+        the rest follow in no particular order.
+
+        Uses the <matcher> SoftMatcher if given, otherwise the matcher attribute.
+        Relevance goes from 0 to 1 and is blended with the ranking of the scorer attribute,
+        so providers of about the same relevance are listed by returned count and rating.
+        The providers kept are counted as returned like filter() unless <count_returned> is false.
+        """
+
+        matcher = matcher or self.matcher
+        hard = matcher.hard_traits(traits)
+        if hard:
+            self.filter(hard, count_returned=False)
+
+        (relevance, scored) = matcher.relevance(self, traits)
+        rows = self._rows
+        if scored:
+            kept = relevance > 0
+            (rows, relevance) = (rows[kept], relevance[kept])
+
+        scores = relevance + matcher.ranking_scores(self, rows, self.scorer)
+        self._rows = rows[top_scores(scores, limit)]
+
+        if count_returned:
+            self._increment_returned_counter()
         return self
 
-    def filter(self, traits: Filter_Options):
+    def similar_to_skills(self, skills: List[str], k: Optional[int] = PAGE_SIZE,
+                          secondary_skills: List[str] = (), count_returned=True):
+        """
+        Keeps the <k> providers of the current dataframe whose skills are most similar
+        to <skills>, from most to least similar, leaving out those sharing no word with them.
+        Skills are compared by their words weighted by TF-IDF (see similarity.py), so
+        providers are found without having any of the skills exactly, e.g. "unix" finds
+        "Linux / Unix". Skills in <secondary_skills> weigh half as much.
+        Results over every provider are cached until the store changes.
+        The providers kept are counted as returned unless <count_returned> is false.
+        """
+
+        similarity = self.store.skill_similarity()
+        (vector, unknown) = similarity.query(skills, secondary_skills)
+        for token in unknown:
+            self._warn(f"no provider has a skill with the word {token}")
+
+        key = ("skills", tuple(sorted(vector.items())), k)
+        return self._similar(key, vector, k, None, count_returned)
+
+    def similar_to_provider(self, provider_id: int, k: Optional[int] = PAGE_SIZE,
+                            count_returned=True):
+        """
+        Keeps the <k> providers of the current dataframe whose skills are most similar
+        to those of the provider with <provider_id>, the same way as similar_to_skills(),
+        leaving out that provider. Raises KeyError if no live provider has <provider_id>.
+        """
+
+        position = self.store.positions_of([provider_id])[0]
+        if position < 0:
+            raise KeyError(f"no provider has the id {provider_id}")
+
+        # skill lists of snapshots are only read at arrays of positions
+        at = np.array([position])
+        (vector, _) = self.store.skill_similarity().query(
+            self.store.column("primary_skills")[at][0], self.store.column("secondary_skill")[at][0])
+
+        return self._similar(("provider", position, k), vector, k, position, count_returned)
+
+    def _similar(self, key, vector: Dict[int, float], k: Optional[int],
+                 exclude: Optional[int], count_returned: bool):
+        """
+        Internal method keeping the <k> providers of the current dataframe most similar to
+        <vector>, reading and adding to the similarity cache for views of every provider
+        """
+
+        similarity = self.store.skill_similarity()
+        result = None
+        cacheable = self._rows is self.store.all_rows
+
+        if cacheable:
+            result = similarity.cached(key)
+        if result is None:
+            rows = None if cacheable else self._rows
+            result = similarity.top(vector, rows, k, exclude, self.store.live)
+            if cacheable:
+                similarity.cache(key, result)
+
+        self._rows = result[0]
+        if count_returned:
+            self._increment_returned_counter()
+        return self
+
+    def facets(self, limit: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Counts how many providers of the current dataframe have each sex, country,
+        language and company and each lowercased primary and secondary skill.
+        Returns a dictionary of each of those traits to its values with a count above
+        zero, from most to fewest providers, only the first <limit> if it is given.
+
+        e.g. providers.view().filter({"rating": ("gt", 5)}, count_returned=False).facets()
+        gives {"sex": {"Female": 70, "Male": 64}, "country": {...}, ..., "primary_skills": {...}}
+        """
+
+        # a view of every provider reads the counts the store keeps
+        whole_store = self._rows is self.store.all_rows
+        rows = None if whole_store and self.store.live is None else self._rows
+        facets = {}
+
+        for trait in CATEGORY_TRAITS:
+            column = self.store.column(trait)
+            counts = (self.store.category_counts[trait] if whole_store
+                      else category_counts(column, rows))
+            facets[trait] = top_counts(column.categories, counts, limit)
+
+        for (trait, skills_index) in (("primary_skills", self.primary_skills),
+                                      ("secondary_skills", self.secondary_skills)):
+            facets[trait] = top_counts(skills_index.vocabulary, skill_counts(skills_index, rows), limit)
+
+        return facets
+
+    def filter_many(self, queries: List[Filter_Options], limit: Optional[int] = None,
+                    count_returned=True) -> List["ProviderList"]:
+        """
+        Filters the current dataframe by every Filter_Options in <queries> at once
+        and returns a ranked view for each query in order, as if by
+        view().filter(traits).rank(limit) for each of them.
+
+        Predicates shared by several queries are evaluated once and numeric and date
+        comparisons are broadcast across every query (see BatchPlan). Every provider
+        is counted as returned once for each query that kept it in a single increment
+        of the counter, before any query is ranked, so every result of the batch is
+        ranked by the same returned counts. Queries over every provider are answered
+        from and added to the query_cache like filter().
+        """
+
+        start = time.perf_counter()
+        keys = [canonical_filter(traits) for traits in queries]
+        cacheable = self._rows is self.store.all_rows
+        results: List[Optional[np.ndarray]] = [None] * len(queries)
+        # queries with filters to count, along with the positions they kept
+        counted = []
+
+        if cacheable:
+            for query, key in enumerate(keys):
+                if key is not None:
+                    results[query] = self.query_cache.get(key, self.store.version)
+                    if results[query] is not None:
+                        counted.append(results[query])
+
+        batched = [query for query, key in enumerate(keys)
+                   if key is not None and results[query] is None]
+        masks = BatchPlan(self, [keys[query] for query in batched]).masks()
+        planned = list(zip(batched, masks))
+
+        # filters the canonical form cannot key are planned on their own, like filter()
+        planned += [(query, self.plan(queries[query]).mask())
+                    for query, key in enumerate(keys) if key is None]
+
+        for query, mask in planned:
+            if mask is None:
+                results[query] = self._rows
+                continue
+
+            # gathering at the true positions is faster than a boolean index per query
+            results[query] = self._rows.take(np.flatnonzero(mask))
+            counted.append(results[query])
+
+            if cacheable and keys[query] is not None:
+                self.query_cache.put(keys[query], self.store.version, results[query])
+
+        if count_returned and counted:
+            times = np.bincount(np.concatenate(counted), minlength=self.store.size)
+            rows = np.flatnonzero(times)
+            self.counter.increment(rows, times[rows])
+
+        views = []
+        for rows in results:
+            view = self.view()
+            view._rows = rows
+            views.append(view.rank(limit))
+            FILTER_RESULTS.observe(len(rows))
+
+        FILTER_SECONDS.observe(time.perf_counter() - start, ("filter_many",))
+        return views
+
+    def filter(self, traits: Filter_Options, count_returned=True):
         """ takes in a dictionary <traits> with what traits to filter by as key
         and other needed options and values to filter through as the value
         to filter through multiple different traits.
@@ -293,36 +910,79 @@ class ProviderList:
         the above examlple will filter all of the providers 
         that are male, has a rating greater than 5,
         has "Estimates" as a primary skill, and a birthday before 1990
+
+        The traits are compiled into a single combined mask which is applied
+        once, so the returned counter goes up once per query. Filtering every
+        provider reuses the providers kept by the same filter from the query_cache
+        until the store changes, counting them as returned again.
+        If <count_returned> is false the providers kept are not counted as returned,
+        for going back to a query that was already counted.
         """
 
-        for trait in traits:
+        start = time.perf_counter()
+        self._filter(traits, count_returned)
+        FILTER_SECONDS.observe(time.perf_counter() - start, ("filter",))
+        FILTER_RESULTS.observe(len(self._rows))
+        return self
+
+    def _filter(self, traits: Filter_Options, count_returned=True,
+                explanation: Optional[QueryExplanation] = None):
+        """Internal method doing filter(), reporting how it ran in <explanation> if given"""
 
-            if trait == "id" or trait == "rating":
-                id_op, id_val = traits[trait]
-                self.filter_by_num(trait, id_op, id_val)
+        # filters over every provider are cached by which providers they keep
+        key = canonical_filter(traits) if self._rows is self.store.all_rows else None
 
-            if trait in STR_TRAITS:
-                search_val = traits[trait]
-                self.filter_by_str(trait, search_val)
+        if key is not None:
+            rows = self.query_cache.get(key, self.store.version)
+            if rows is not None:
+                self._rows = rows
+                if explanation is not None:
+                    explanation.cached = True
+                return self._increment_returned_counter() if count_returned else self
 
-            if trait == "sex":
-                sex = traits[trait]
-                self.filter_by_sex(sex)
+        start = time.perf_counter()
+        query_plan = self.plan(traits)
+        if explanation is not None:
+            explanation.plan_seconds = time.perf_counter() - start
 
-            if trait == "primary_skills":
-                skills = traits[trait]
-                self.filter_by_skills(skills, primary=True)
+        if query_plan:
+            self._apply_mask(query_plan.mask(explanation), count_returned)
 
-            if trait == "secondary_skills":
-                skills = traits[trait]
-                self.filter_by_skills(skills, primary=False)
+            if key is not None:
+                self.query_cache.put(key, self.store.version, self._rows)
 
-            if trait == "active":
-                active = traits[trait]
-                self.filter_active(active)
+        return self
+
+    def explain(self, traits: Filter_Options, count_returned=True,
+                trace_allocations=False) -> QueryExplanation:
+        """
+        Filters the current dataframe by <traits> the same way as filter() and
+        returns a QueryExplanation of how it ran: whether the query cache answered it,
+        how long compiling the plan took, and for every predicate in the order it ran
+        how it found its providers (sorted index, string index, scan, ...), how many
+        providers went in and came out, its wall time and, if <trace_allocations>,
+        the peak memory allocated while it ran. Problems such as unknown skills or
+        operators are collected in its warnings.
+
+        Tracing allocations turns tracemalloc on for the whole process while it runs,
+        slowing down every other thread, and the memory it reports is what the whole
+        process allocated during each predicate, not the predicate alone. It is meant
+        for debugging and benchmarks, never for serving requests.
+        """
+
+        explanation = QueryExplanation(traits, len(self._rows), trace_allocations)
+        self._warnings = explanation.warnings
+        start = time.perf_counter()
+
+        try:
+            if trace_allocations:
+                with tracing_allocations():
+                    self._filter(traits, count_returned, explanation)
+            else:
+                self._filter(traits, count_returned, explanation)
+        finally:
+            self._warnings = None
 
-            if trait == "birth_date":
-                id_op, id_val = traits[trait]
-                self.filter_by_date(id_op, id_val)
-            
-        return self
\ No newline at end of file
+        explanation.seconds = time.perf_counter() - start
+        explanation.rows_out = len(self._rows)
+        return explanation
@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+import numpy as np
+import pandas as pd
+from providers_types import Filter_Options
+from metrics import CACHE_LOOKUPS
+from constants import STR_TRAITS
+
+DEFAULT_MAX_ENTRIES = 256
+# positions held across every cached result, 64 MB of int64 positions
+DEFAULT_MAX_ROWS = 2 ** 23
+
+def canonical_filter(traits: Filter_Options) -> Optional[Tuple]:
+    """
+    Returns a hashable key for <traits> which is the same for every Filter_Options
+    that filters down to the same providers: traits in sorted order, skills
+    lowercased, deduplicated and sorted, substring values lowercased, numbers
+    as floats and dates as YYYY-MM-DD, between ranges as pairs of them. None if
+    <traits> has values that would not filter, which are left for ProviderList.filter()
+    to report.
+    """
+
+    key = []
+
+    try:
+        for trait in sorted(traits):
+            value = traits[trait]
+
+            if trait == "primary_skills" or trait == "secondary_skills":
+                value = tuple(sorted({skill.lower() for skill in value}))
+            elif trait in STR_TRAITS:
+                value = value.lower()
+            elif trait == "birth_date":
+                operator, date = value
+                if operator == "between":
+                    (low, high) = date
+                    if type(low) is not str or type(high) is not str:
+                        return None
+                    value = (operator, (pd.Timestamp(low).strftime("%Y-%m-%d"),
+                                        pd.Timestamp(high).strftime("%Y-%m-%d")))
+                else:
+                    if type(date) is not str:
+                        return None
+                    value = (operator, pd.Timestamp(date).strftime("%Y-%m-%d"))
+            elif trait == "rating" or trait == "id":
+                operator, number = value
+                if operator == "between":
+                    (low, high) = number
+                    value = (operator, (float(low), float(high)))
+                else:
+                    value = (operator, float(number))
+            elif trait == "active":
+                value = bool(value)
+
+            hash(value)
+            key.append((trait, value))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+    return tuple(key)
+
+class QueryCache:
+    """
+    Thread safe LRU cache of the positions a filter over every provider kept,
+    keyed by canonical_filter() of its Filter_Options.
+
+    Only which providers passed is cached, in store order, never their ranking,
+    so results are ranked again by their current returned counts on every hit.
+    Every entry is tied to the version of the store it was worked out on and
+    is dropped once the store has changed.
+
+    Holds at most <max_entries> results and <max_rows> positions in total,
+    evicting the least recently used results first.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_rows=DEFAULT_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[Hashable, Tuple[int, np.ndarray]]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return (f"<QueryCache with {len(self)} results, "
+                f"{self.hits} hits and {self.misses} misses>")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: int) -> Optional[np.ndarray]:
+        """Returns the positions cached for <key> on the store <version>, None if there are none"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(labels=("miss",))
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(labels=("hit",))
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, rows: np.ndarray):
+        """Caches the positions in <rows> for <key> on the store <version>"""
+
+        if len(rows) > self.max_rows:
+            return self
+
+        # the views sharing the positions never change them in place
+        rows.flags.writeable = False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (version, rows)
+            self._rows += len(rows)
+
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+
+        return self
+
+    def _remove(self, key: Hashable):
+        """Internal method to drop the result for <key>, with the lock held"""
+
+        (_, rows) = self._entries.pop(key)
+        self._rows -= len(rows)
+
+    def clear(self):
+        """Drops every cached result"""
+
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+        return self
@@ -0,0 +1,328 @@
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from providers_types import Filter_Options
+from explain import QueryExplanation
+from metrics import PREDICATE_SECONDS
+from constants import STR_TRAITS, SEXES, NUM_OPERATORS, DATE_OPERATORS
+
+# rough share of providers expected to pass each kind of predicate,
+# used to order predicates so the combined mask empties out as early as possible
+EQUALITY_SELECTIVITY = 0.05
+RANGE_SELECTIVITY = 0.5
+SUBSTRING_SELECTIVITY = 0.1
+# most cells of a 2-D comparison of one column against many values worked out at once,
+# 16 MB of booleans
+BROADCAST_CELLS = 2 ** 24
+
+def range_count(providers, trait: str, operator: str, value) -> Optional[int]:
+    """
+    How many providers have <trait> <operator> <value>, counted with the sorted index
+    of the column. None if <value> cannot be compared, which is left for the predicate to report.
+    """
+
+    try:
+        return providers.store.sorted_index(trait).count(operator, value)
+    except (TypeError, ValueError):
+        return None
+
+def range_selectivity(providers, trait: str, operator: str, value) -> float:
+    """
+    Share of providers where <trait> is <operator> <value>, counted with the sorted index
+    of the column. Falls back to a rough estimate if <value> cannot be compared.
+    """
+
+    count = range_count(providers, trait, operator, value)
+    if count is None:
+        return EQUALITY_SELECTIVITY if operator in ("eq", "at") else RANGE_SELECTIVITY
+
+    return count / max(providers.store.size, 1)
+
+def range_access(providers, trait: str, operator: str, value) -> str:
+    """How the mask of a range predicate is found, the same way ProviderList._range_mask() decides"""
+
+    count = range_count(providers, trait, operator, value)
+    return "sorted index" if count is not None and providers._reads_sorted_index(count) else "scan"
+
+class Predicate:
+    """
+    One step of a QueryPlan, the <trait> it filters on, a function
+    that returns a boolean mask over the current dataframe, the
+    estimated share of rows that pass it and how it finds them (<access>)
+    """
+
+    def __init__(self, trait: str, evaluate: Callable[[], np.ndarray], selectivity: float,
+                 access="scan"):
+        self.trait = trait
+        self.evaluate = evaluate
+        self.selectivity = selectivity
+        self.access = access
+
+    def __repr__(self):
+        return f"<Predicate {self.trait} by {self.access} selectivity={self.selectivity:.4f}>"
+
+class QueryPlan:
+    """
+    A Filter_Options dictionary compiled into predicates ordered from most to least
+    selective, which are combined into a single mask over the current dataframe
+    """
+
+    def __init__(self, predicates: List[Predicate]):
+        self.predicates = sorted(predicates, key=lambda predicate: predicate.selectivity)
+
+    def __repr__(self):
+        return f"<QueryPlan {self.predicates}>"
+
+    def __len__(self):
+        return len(self.predicates)
+
+    def __iter__(self):
+        return iter(self.predicates)
+
+    @classmethod
+    def compile(cls, providers, traits: Filter_Options):
+        """
+        Takes in a ProviderList <providers> and a dictionary <traits> with the same
+        shape as ProviderList.filter() and returns a plan of the predicates to run.
+        Traits that are not filterable and unused operators are left out of the plan.
+        """
+
+        predicates: List[Predicate] = []
+
+        for trait in traits:
+
+            if trait == "id" or trait == "rating":
+                operator, value = traits[trait]
+                if operator not in NUM_OPERATORS:
+                    providers._warn("That operation is not used. use eq, gt, lt, or between instead")
+                    continue
+
+                predicates.append(Predicate(
+                    trait,
+                    lambda trait=trait, operator=operator, value=value:
+                        providers._num_mask(trait, operator, value),
+                    range_selectivity(providers, trait, operator, value),
+                    range_access(providers, trait, operator, value)))
+
+            if trait in STR_TRAITS:
+                value = traits[trait]
+                string_index = providers.store.string_indexes.get(trait)
+                if string_index is None:
+                    selectivity = SUBSTRING_SELECTIVITY
+                    access = "scan"
+                else:
+                    selectivity = string_index.count(value) / max(string_index.size, 1)
+                    access = string_index.access(value)
+
+                predicates.append(Predicate(
+                    trait,
+                    lambda trait=trait, value=value: providers._str_mask(trait, value),
+                    selectivity, access))
+
+            if trait == "sex":
+                sex = traits[trait]
+                sex_counts = providers.store.category_counts.get("sex")
+                if sex_counts is None:
+                    selectivity = 1 / len(SEXES)
+                else:
+                    code = providers.store.code_of("sex", sex)
+                    with_sex = sex_counts[code] if code >= 0 else 0
+                    selectivity = with_sex / max(len(providers.store), 1)
+
+                predicates.append(Predicate(
+                    trait,
+                    lambda sex=sex: providers._sex_mask(sex),
+                    selectivity, "dictionary codes"))
+
+            if trait == "primary_skills" or trait == "secondary_skills":
+                skills = traits[trait]
+                primary = trait == "primary_skills"
+                skills_index = providers.primary_skills if primary else providers.secondary_skills
+                with_skills = sum(len(positions) for positions in skills_index.postings(skills))
+
+                predicates.append(Predicate(
+                    trait,
+                    lambda skills=skills, primary=primary:
+                        providers._skills_mask(skills, primary),
+                    min(with_skills / max(skills_index.size, 1), 1.0), "skill index"))
+
+            if trait == "active":
+                active = traits[trait]
+                predicates.append(Predicate(
+                    trait,
+                    lambda active=active: providers._active_mask(active),
+                    RANGE_SELECTIVITY))
+
+            if trait == "birth_date":
+                operator, date = traits[trait]
+                if operator not in DATE_OPERATORS:
+                    providers._warn("That operation is not used. use at, after, before, or between instead")
+                    continue
+
+                predicates.append(Predicate(
+                    trait,
+                    lambda operator=operator, date=date: providers._date_mask(operator, date),
+                    range_selectivity(providers, trait, operator, date),
+                    range_access(providers, trait, operator, date)))
+
+        return cls(predicates)
+
+    def mask(self, explanation: Optional[QueryExplanation] = None) -> Optional[np.ndarray]:
+        """
+        Runs the predicates in order and returns their combined mask,
+        stopping early once no rows are left. None if the plan is empty.
+        If an <explanation> is given every predicate that runs is timed
+        and reported in it as a stage
+        """
+
+        combined = None
+
+        for predicate in self.predicates:
+            if explanation is None:
+                start = time.perf_counter()
+                predicate_mask = predicate.evaluate()
+                seconds = time.perf_counter() - start
+            else:
+                stage = explanation.stage(predicate.trait, predicate.access, predicate.selectivity)
+                stage.rows_in = (explanation.rows_in if combined is None
+                                 else int(np.count_nonzero(combined)))
+                with stage.measure(explanation.trace_allocations):
+                    predicate_mask = predicate.evaluate()
+                stage.matched = int(np.count_nonzero(predicate_mask))
+                seconds = stage.seconds
+
+            PREDICATE_SECONDS.observe(seconds, (predicate.trait, predicate.access))
+
+            if combined is None:
+                combined = predicate_mask
+            else:
+                np.logical_and(combined, predicate_mask, out=combined)
+
+            if explanation is not None:
+                stage.rows_out = int(np.count_nonzero(combined))
+
+            if not combined.any():
+                break
+
+        return combined
+
+class BatchPlan:
+    """
+    Many queries, each the canonical_filter() key of a Filter_Options, compiled
+    together so that a predicate used by several queries is only evaluated once.
+    Comparisons of the same numeric or date column with the same operator are
+    worked out for every value the queries compare against in 2-D broadcasts of
+    values by rows, instead of one pass over the column per value.
+    """
+
+    def __init__(self, providers, keys: List[Tuple]):
+        self.providers = providers
+        self.keys = keys
+        # mask of every distinct predicate the queries use
+        self._masks: Dict[Tuple, np.ndarray] = {}
+
+    def __repr__(self):
+        return f"<BatchPlan of {len(self.keys)} queries, {len(self._masks)} predicates evaluated>"
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _broadcast(self, trait: str, operator: str, values: list):
+        """
+        Internal method evaluating <trait> <operator> value for every one of <values>
+        as rows of a 2-D mask, a block of values at a time
+        """
+
+        if trait == "birth_date":
+            column = self.providers._column("birth_date")
+            compared = np.array([pd.Timestamp(value).to_datetime64() for value in values])
+        else:
+            column = self.providers._column(trait)
+            compared = np.array(values, dtype=np.float64)
+
+        compare = {"eq": np.equal, "at": np.equal,
+                   "gt": np.greater, "after": np.greater,
+                   "lt": np.less, "before": np.less}[operator]
+        block = max(BROADCAST_CELLS // max(len(column), 1), 1)
+
+        for start in range(0, len(values), block):
+            masks = compare(column[np.newaxis, :], compared[start:start + block, np.newaxis])
+            for value, mask in zip(values[start:start + block], masks):
+                self._masks[(trait, (operator, value))] = mask
+
+    def _evaluate(self, predicate: Tuple) -> np.ndarray:
+        """Internal method evaluating a predicate that is not broadcast"""
+
+        (trait, value) = predicate
+        providers = self.providers
+
+        if trait == "id" or trait == "rating":
+            return providers._num_mask(trait, *value)
+        if trait == "birth_date":
+            return providers._date_mask(*value)
+        if trait in STR_TRAITS:
+            return providers._str_mask(trait, value)
+        if trait == "sex":
+            return providers._sex_mask(value)
+        if trait == "primary_skills" or trait == "secondary_skills":
+            return providers._skills_mask(list(value), trait == "primary_skills")
+        return providers._active_mask(value)
+
+    def masks(self) -> List[Optional[np.ndarray]]:
+        """
+        Evaluates every distinct predicate once and returns the combined mask of each
+        query in order, None for a query without any predicate to run.
+        Traits that are not filterable and unused operators are left out as by QueryPlan.
+        """
+
+        # predicates of every query, and the values compared per column and operator
+        query_predicates: List[List[Tuple]] = []
+        compared: Dict[Tuple[str, str], list] = {}
+
+        for key in self.keys:
+            predicates = []
+
+            for (trait, value) in key:
+                if trait == "id" or trait == "rating" or trait == "birth_date":
+                    operators = DATE_OPERATORS if trait == "birth_date" else NUM_OPERATORS
+                    if value[0] not in operators:
+                        self.providers._warn(
+                            f"That operation is not used. use {', '.join(operators)} instead")
+                        continue
+                    # ranges between two values are each evaluated on their own
+                    if value[0] != "between":
+                        values = compared.setdefault((trait, value[0]), [])
+                        if value[1] not in values:
+                            values.append(value[1])
+                elif not (trait in STR_TRAITS or trait in ("sex", "active",
+                                                          "primary_skills", "secondary_skills")):
+                    continue
+
+                predicates.append((trait, value))
+
+            query_predicates.append(predicates)
+
+        for (trait, operator), values in compared.items():
+            self._broadcast(trait, operator, values)
+
+        masks: List[Optional[np.ndarray]] = []
+
+        for predicates in query_predicates:
+            combined = None
+
+            for predicate in predicates:
+                if predicate not in self._masks:
+                    self._masks[predicate] = self._evaluate(predicate)
+
+                if combined is None:
+                    combined = self._masks[predicate].copy()
+                else:
+                    np.logical_and(combined, self._masks[predicate], out=combined)
+
+                if not combined.any():
+                    break
+
+            masks.append(combined)
+
+        return masks
@@ -0,0 +1,88 @@
+from typing import Tuple
+import numpy as np
+import pandas as pd
+
+# share of a view's rows up to which a range is read from its sorted index,
+# past it setting every position found costs more than comparing every row
+INDEX_FRACTION = 0.1
+
+class SortedIndex:
+    """
+    Positions of one numeric or date column in order of their values, so comparing
+    the column against a value is a binary search into a range of positions instead
+    of a pass over every row. Rows without a value, NaN or NaT, are left out
+    and never match.
+
+    Supports the operators of ProviderList.filter(): eq/at, gt/after and lt/before
+    against one value, and between against a (low, high) pair, both ends included.
+    """
+
+    def __init__(self, values: np.ndarray):
+        values = np.asarray(values)
+        self.size = len(values)
+        self.is_date = values.dtype.kind == "M"
+
+        if self.is_date:
+            keys = values.astype("datetime64[ns]").view(np.int64)
+            valid = ~np.isnat(values)
+        else:
+            keys = values
+            valid = ~np.isnan(values) if values.dtype.kind == "f" else np.ones(self.size, dtype=bool)
+
+        positions = np.flatnonzero(valid)
+        # positions with the same value stay in store order
+        self.order = positions[np.argsort(keys[positions], kind="stable")]
+        self.sorted_values = keys[self.order]
+
+    def __repr__(self):
+        kind = "date" if self.is_date else "numeric"
+        return f"<SortedIndex of {len(self.order)} {kind} values over {self.size} rows>"
+
+    def key(self, value):
+        """Returns <value> as it compares against the sorted values, parsing dates once"""
+
+        if self.is_date:
+            return pd.Timestamp(value).to_datetime64().astype("datetime64[ns]").view(np.int64)
+        return value
+
+    def bounds(self, operator: str, value) -> Tuple[int, int]:
+        """
+        Returns the start and end in <order> of the positions where the column
+        is <operator> <value>
+        """
+
+        if operator == "between":
+            (low, high) = value
+            return (int(np.searchsorted(self.sorted_values, self.key(low), side="left")),
+                    int(np.searchsorted(self.sorted_values, self.key(high), side="right")))
+
+        value = self.key(value)
+        left = int(np.searchsorted(self.sorted_values, value, side="left"))
+
+        if operator in ("eq", "at"):
+            return (left, int(np.searchsorted(self.sorted_values, value, side="right")))
+        if operator in ("gt", "after"):
+            return (int(np.searchsorted(self.sorted_values, value, side="right")), len(self.order))
+        if operator in ("lt", "before"):
+            return (0, left)
+
+        raise ValueError(f"{operator} is not a range operator")
+
+    def count(self, operator: str, value) -> int:
+        """Returns how many rows have a value <operator> <value>"""
+
+        (start, end) = self.bounds(operator, value)
+        return end - start
+
+    def positions(self, operator: str, value) -> np.ndarray:
+        """Returns the positions where the column is <operator> <value>, in order of value"""
+
+        (start, end) = self.bounds(operator, value)
+        return self.order[start:end]
+
+    def mask(self, operator: str, value) -> np.ndarray:
+        """Returns a boolean mask the length of the column, true where it is <operator> <value>"""
+
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.positions(operator, value)] = True
+        return mask
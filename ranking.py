@@ -0,0 +1,116 @@
+import threading
+from typing import Optional
+import numpy as np
+
+class Ranker:
+    """
+    Orders providers the way the server lists them, returned ascending and then
+    rating descending, without sorting more than it has to.
+
+    Every provider gets a unique int64 key, returned * size + rating_rank, where
+    rating_rank is the provider's place when the store is ordered by rating
+    descending and then by position. Ordering by the key is the same as a stable
+    sort by returned and rating, so the top k can be found with a partial
+    selection instead of a full sort.
+
+    The ranking of every provider is also cached and only re-sorted when the
+    returned counter has changed. As only the providers that came back from a
+    filter move, the cached order is nearly sorted and re-sorting it is cheap.
+    """
+
+    def __init__(self, rating: np.ndarray, rating_rank: Optional[np.ndarray] = None,
+                 live: Optional[np.ndarray] = None):
+        """
+        Ranks the providers by <rating>. A <rating_rank> saved from another
+        Ranker over the same ratings can be given to skip sorting them again.
+        If a <live> mask is given, ranked_all() leaves out the positions where it is false.
+        """
+
+        self.size = len(rating)
+
+        if rating_rank is None:
+            by_rating = np.lexsort((np.arange(self.size), -rating))
+            rating_rank = np.empty(self.size, dtype=np.int64)
+            rating_rank[by_rating] = np.arange(self.size)
+        else:
+            by_rating = np.empty(self.size, dtype=np.int64)
+            by_rating[rating_rank] = np.arange(self.size)
+
+        self.rating_rank = rating_rank
+        self.rating_rank.flags.writeable = False
+
+        self._lock = threading.Lock()
+        self._ranked = by_rating if live is None else by_rating[live[by_rating]]
+        self._ranked_version = None
+
+    def __repr__(self):
+        return f"<Ranker for {self.size} providers>"
+
+    def append(self, rating: np.ndarray, live: Optional[np.ndarray] = None):
+        """
+        Returns a Ranker over <rating>, the ratings of these providers followed by
+        new ones, merging the new providers into the rating order instead of sorting again
+        """
+
+        by_rating = np.empty(self.size, dtype=np.int64)
+        by_rating[self.rating_rank] = np.arange(self.size)
+
+        added = np.arange(self.size, len(rating))
+        added = added[np.lexsort((added, -rating[added]))]
+        # ties go after the old providers, which all come before the new ones in the store
+        places = np.searchsorted(-rating[by_rating], -rating[added], side="right")
+        by_rating = np.insert(by_rating, places, added)
+
+        rating_rank = np.empty(len(rating), dtype=np.int64)
+        rating_rank[by_rating] = np.arange(len(rating))
+
+        return Ranker(rating, rating_rank, live)
+
+    def keys(self, rows: np.ndarray, returned: np.ndarray) -> np.ndarray:
+        """
+        Ranking keys for the providers at the positions in <rows>,
+        where <returned> is their returned count. Lower keys rank first.
+        """
+
+        return returned.astype(np.int64) * max(self.size, 1) + self.rating_rank[rows]
+
+    def top_k(self, rows: np.ndarray, returned: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+        """
+        Returns <rows> reordered so the <k> best ranked come first in order,
+        followed by the rest in no particular order. Every row is ordered if <k> is None.
+        """
+
+        keys = self.keys(rows, returned)
+
+        if k is None or k >= len(rows):
+            return rows[np.argsort(keys, kind="stable")]
+
+        if k <= 0:
+            return rows
+
+        # only the k smallest keys are sorted, the rest are just split off
+        partitioned = np.argpartition(keys, k - 1)
+        top = partitioned[:k]
+        top = top[np.argsort(keys[top])]
+
+        return np.concatenate((rows[top], rows[partitioned[k:]]))
+
+    def ranked_all(self, counter) -> np.ndarray:
+        """
+        Returns the positions of every provider in ranked order, reusing the cached
+        order as long as the version of the returned <counter> has not changed.
+        """
+
+        with self._lock:
+            version = counter.version
+
+            if version != self._ranked_version:
+                ranked = self._ranked
+                keys = self.keys(ranked, counter[ranked])
+                # timsort, which is close to linear on the nearly sorted cached order
+                ranked = ranked[np.argsort(keys, kind="stable")]
+                ranked.flags.writeable = False
+                self._ranked = ranked
+                self._ranked_version = version
+
+            return self._ranked
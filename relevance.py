@@ -0,0 +1,189 @@
+"""
+Soft matching: instead of keeping only the providers that meet every trait of a
+Filter_Options, every provider is scored by how well it meets the skills, rating and
+birth date asked for, so a job needing five skills still finds the providers that
+have four of them. See ProviderList.match().
+
+The skill score is a sparse matrix-vector product: the provider by skill incidence
+matrix, held by the SkillIndexes in CSC form, times a vector of the weight of every
+skill asked for. Only the columns of the skills asked for are nonzero in the vector,
+so the product is a bincount of their postings weighted by their skill's weight.
+"""
+
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from providers_types import Filter_Options
+from constants import NUM_OPERATORS, DATE_OPERATORS
+
+# traits scored by how close providers come to them, every other trait still has to be met
+SOFT_TRAITS = {"primary_skills", "secondary_skills", "rating", "birth_date"}
+
+DEFAULT_SKILL_WEIGHT = 1.0
+DEFAULT_RATING_WEIGHT = 1.0
+DEFAULT_DATE_WEIGHT = 1.0
+# weight of a skill asked for in secondary_skills, against 1 for one in primary_skills
+DEFAULT_SECONDARY_WANTED = 0.5
+# share of a skill's weight given to a provider having it as a secondary skill only
+DEFAULT_SECONDARY_CREDIT = 0.5
+# how far past a bound a rating or birth date can be before it no longer scores at all,
+# the score falling linearly from the bound to there
+DEFAULT_RATING_TOLERANCE = 2.0
+DEFAULT_DATE_TOLERANCE_DAYS = 5 * 365
+# weight of the returned and rating ranking, scaled to 0-1, added to the relevance
+# of every provider, enough to order providers of the same relevance
+DEFAULT_RANKING_WEIGHT = 0.1
+
+def _closeness(values: np.ndarray, operator: str, bound, tolerance: float) -> np.ndarray:
+    """
+    Internal function scoring <values> from 1 where they are <operator> <bound>
+    down to 0 at <tolerance> or further from it, and 0 where they are missing
+    """
+
+    if operator == "between":
+        (low, high) = bound
+        distance = np.maximum(low - values, values - high)
+    elif operator in ("gt", "after"):
+        distance = bound - values
+    elif operator in ("lt", "before"):
+        distance = values - bound
+    else:
+        distance = np.abs(values - bound)
+
+    scores = 1 - np.maximum(distance, 0) / tolerance
+    return np.nan_to_num(np.clip(scores, 0, 1), nan=0.0)
+
+class SoftMatcher:
+    """
+    Scores providers from 0 to 1 by how well they meet the soft traits of a Filter_Options:
+
+        relevance = (skill_weight * skills + rating_weight * rating + date_weight * birth_date)
+                    / the weights of the traits asked for
+
+    skills is the weighted share of the skills asked for that a provider has, skills asked
+    for in secondary_skills weighing <secondary_wanted> against 1 for primary_skills, and
+    a primary skill asked for that a provider only lists as a secondary skill counting
+    <secondary_credit> of its weight.
+    rating and birth_date are 1 inside the range asked for and fall linearly to 0
+    at <rating_tolerance> points or <date_tolerance_days> days outside of it.
+    """
+
+    def __init__(self, skill_weight=DEFAULT_SKILL_WEIGHT, rating_weight=DEFAULT_RATING_WEIGHT,
+                 date_weight=DEFAULT_DATE_WEIGHT, secondary_wanted=DEFAULT_SECONDARY_WANTED,
+                 secondary_credit=DEFAULT_SECONDARY_CREDIT,
+                 rating_tolerance=DEFAULT_RATING_TOLERANCE,
+                 date_tolerance_days=DEFAULT_DATE_TOLERANCE_DAYS,
+                 ranking_weight=DEFAULT_RANKING_WEIGHT):
+        self.skill_weight = skill_weight
+        self.rating_weight = rating_weight
+        self.date_weight = date_weight
+        self.secondary_wanted = secondary_wanted
+        self.secondary_credit = secondary_credit
+        self.rating_tolerance = rating_tolerance
+        self.date_tolerance_days = date_tolerance_days
+        self.ranking_weight = ranking_weight
+
+    def __repr__(self):
+        return (f"<SoftMatcher skill_weight={self.skill_weight} rating_weight={self.rating_weight} "
+                f"date_weight={self.date_weight} ranking_weight={self.ranking_weight}>")
+
+    def wanted_skills(self, traits: Filter_Options) -> Dict[str, Tuple[float, float]]:
+        """
+        Returns the weight of every lowercased skill asked for in <traits>, along with
+        the share of it given to providers listing it as a secondary skill only
+        """
+
+        wanted = {}
+        for skill in traits.get("secondary_skills", []):
+            wanted[skill.lower()] = (self.secondary_wanted, 1.0)
+        # a skill asked for as both counts as primary
+        for skill in traits.get("primary_skills", []):
+            wanted[skill.lower()] = (1.0, self.secondary_credit)
+        return wanted
+
+    def skill_scores(self, providers, wanted: Dict[str, Tuple[float, float]]) -> np.ndarray:
+        """
+        Returns the weighted share of the <wanted> skills every provider in the store has,
+        as the product of the provider by skill incidence matrices and the skill weights
+        """
+
+        positions: List[np.ndarray] = []
+        weights: List[np.ndarray] = []
+
+        for (skill, (weight, secondary_credit)) in wanted.items():
+            primary = providers.primary_skills.get(skill, np.zeros(0, dtype=np.int32))
+            secondary = providers.secondary_skills.get(skill, np.zeros(0, dtype=np.int32))
+            # providers having the skill as both only get the primary credit
+            secondary = np.setdiff1d(secondary, primary, assume_unique=True)
+
+            positions += [primary, secondary]
+            weights += [np.full(len(primary), weight),
+                        np.full(len(secondary), weight * secondary_credit)]
+
+        credit = np.bincount(np.concatenate(positions).astype(np.int64),
+                             weights=np.concatenate(weights), minlength=providers.store.size)
+        return credit / sum(weight for (weight, _) in wanted.values())
+
+    def relevance(self, providers, traits: Filter_Options) -> Tuple[np.ndarray, bool]:
+        """
+        Returns the relevance of every provider in the current view of the ProviderList
+        <providers> to <traits>, along with whether <traits> has any soft trait to score.
+        Without any every provider is equally relevant.
+        """
+
+        scores = np.zeros(len(providers._rows))
+        total_weight = 0.0
+
+        wanted = self.wanted_skills(traits)
+        if wanted and self.skill_weight:
+            scores += self.skill_weight * self.skill_scores(providers, wanted)[providers._rows]
+            total_weight += self.skill_weight
+
+        if "rating" in traits and self.rating_weight:
+            (operator, value) = traits["rating"]
+            if operator not in NUM_OPERATORS:
+                providers._warn("That operation is not used. use eq, gt, lt, or between instead")
+            else:
+                scores += self.rating_weight * _closeness(providers._column("rating"), operator,
+                                                          value, self.rating_tolerance)
+                total_weight += self.rating_weight
+
+        if "birth_date" in traits and self.date_weight:
+            (operator, date) = traits["birth_date"]
+            if operator not in DATE_OPERATORS:
+                providers._warn("That operation is not used. use at, after, before, or between instead")
+            else:
+                # compared as days, missing dates as NaN
+                days = providers._column("birth_date").astype("datetime64[D]").astype(np.float64)
+                days[np.isnat(providers._column("birth_date"))] = np.nan
+                dates = date if operator == "between" else (date,)
+                bounds = [pd.Timestamp(date).to_datetime64().astype("datetime64[D]").astype(np.float64)
+                          for date in dates]
+                scores += self.date_weight * _closeness(days, operator,
+                                                        tuple(bounds) if operator == "between" else bounds[0],
+                                                        self.date_tolerance_days)
+                total_weight += self.date_weight
+
+        if not total_weight:
+            return (scores, False)
+
+        return (scores / total_weight, True)
+
+    def hard_traits(self, traits: Filter_Options) -> Filter_Options:
+        """Returns the traits of <traits> every matched provider still has to meet"""
+
+        return {trait: value for (trait, value) in traits.items() if trait not in SOFT_TRAITS}
+
+    def ranking_scores(self, providers, rows: np.ndarray, scorer) -> np.ndarray:
+        """
+        Returns the returned and rating ranking of the providers at <rows> by the
+        scoring function <scorer>, scaled to 0-1 and weighted by <ranking_weight>
+        """
+
+        if not self.ranking_weight or len(rows) == 0:
+            return np.zeros(len(rows))
+
+        ranking = scorer(providers.store.column("rating")[rows], providers.counter.decayed(rows))
+        ranking = np.nan_to_num(ranking, nan=np.nanmin(ranking) if np.isfinite(ranking).any() else 0)
+        span = ranking.max() - ranking.min()
+        return self.ranking_weight * ((ranking - ranking.min()) / span if span else np.zeros(len(rows)))
@@ -0,0 +1,64 @@
+from typing import Callable
+import numpy as np
+
+# a scoring function takes the ratings and returned counts of the candidates
+# and returns one score per candidate, higher scores are listed first
+ScoringFunction = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+DEFAULT_RATING_WEIGHT = 1.0
+DEFAULT_RETURNED_WEIGHT = 1.0
+
+class BlendedScorer:
+    """
+    Default scoring function balancing fairness against rating.
+
+    Ratings and returned counts are both scaled to 0-1 over the candidates,
+    then blended as
+
+        score = rating_weight * rating - returned_weight * returned
+
+    so higher rated providers stay near the top while providers that have been
+    returned less often are moved up. Raising <returned_weight> favors fairness,
+    raising <rating_weight> favors rating.
+    """
+
+    def __init__(self, rating_weight=DEFAULT_RATING_WEIGHT,
+                 returned_weight=DEFAULT_RETURNED_WEIGHT):
+        self.rating_weight = rating_weight
+        self.returned_weight = returned_weight
+
+    def __repr__(self):
+        return (f"<BlendedScorer rating_weight={self.rating_weight} "
+                f"returned_weight={self.returned_weight}>")
+
+    def __call__(self, rating: np.ndarray, returned: np.ndarray) -> np.ndarray:
+        if len(rating) == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        rating_min = rating.min()
+        rating_span = rating.max() - rating_min
+        returned_max = returned.max()
+
+        scores = (rating - rating_min) * (self.rating_weight / rating_span if rating_span else 0.0)
+        scores -= returned * (self.returned_weight / returned_max if returned_max else 0.0)
+
+        return scores
+
+def top_scores(scores: np.ndarray, k=None) -> np.ndarray:
+    """
+    returns the positions in <scores> ordered from highest score to lowest,
+    ties kept in their current order. If <k> is given only the first <k>
+    are put in order, the rest follow in no particular order.
+    """
+
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+
+    if k <= 0:
+        return np.arange(len(scores))
+
+    partitioned = np.argpartition(-scores, k - 1)
+    top = partitioned[:k]
+    top = top[np.lexsort((top, -scores[top]))]
+
+    return np.concatenate((top, partitioned[k:]))
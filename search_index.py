@@ -0,0 +1,193 @@
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+
+NGRAM = 3
+# columns with at most this many distinct values get exact-match dictionaries
+# instead of a trigram index
+LOW_CARDINALITY = 512
+
+def ngrams(value: str, n=NGRAM) -> set:
+    """returns the set of substrings of length <n> in <value>"""
+
+    return {value[start:start + n] for start in range(len(value) - n + 1)}
+
+class StringIndex:
+    """
+    Case insensitive substring search index over one string column.
+
+    The column is dictionary encoded once: every row holds the code of its lowercased
+    value in <vocabulary>, so a search only has to find the matching distinct values
+    and then look up every row's code, instead of scanning every row's string.
+
+    Matching values are found through
+      - an exact-match dictionary for low-cardinality columns like country and
+        language, mapping each value to every value that contains it,
+      - a trigram index for the other columns, mapping every 3 letter substring
+        to the sorted codes of the values containing it, whose candidates are
+        then checked, or
+      - a scan of the distinct values when neither applies.
+    """
+
+    def __init__(self, codes: np.ndarray, vocabulary: List[str],
+                 trigrams: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Indexes the <vocabulary> of a column of <codes>. The <trigrams> of an index over
+        the start of the same vocabulary can be given to only index the values after it.
+        """
+
+        self.codes = codes
+        self.vocabulary = vocabulary
+        self.size = len(codes)
+        # number of rows holding each value, used to count matches without touching rows
+        self.value_counts = np.bincount(codes, minlength=len(vocabulary))
+        self.exact: Dict[str, np.ndarray] = {}
+        self.trigrams: Dict[str, np.ndarray] = {}
+
+        if len(vocabulary) <= LOW_CARDINALITY:
+            self.exact = {value: np.array([code for code, other in enumerate(vocabulary)
+                                           if value in other], dtype=np.int64)
+                          for value in vocabulary}
+        else:
+            trigrams = trigrams or {}
+            # values after the last one found in any posting list have no trigrams
+            # or were not indexed yet, so indexing carries on from there
+            indexed = max((int(codes[-1]) + 1 for codes in trigrams.values()), default=0)
+            postings: Dict[str, list] = {}
+            for code in range(indexed, len(vocabulary)):
+                for trigram in ngrams(vocabulary[code]):
+                    postings.setdefault(trigram, []).append(code)
+
+            self.trigrams = dict(trigrams)
+            for trigram, added in postings.items():
+                self.trigrams[trigram] = np.concatenate(
+                    (trigrams.get(trigram, np.zeros(0, dtype=np.int64)),
+                     np.array(added, dtype=np.int64)))
+
+    @classmethod
+    def from_postings(cls, codes: np.ndarray, vocabulary: List[str], value_counts: np.ndarray,
+                      exact: Dict[str, np.ndarray], trigrams: Dict[str, np.ndarray]):
+        """
+        Returns an index of a column of <codes> from the <value_counts>, <exact> and
+        <trigrams> postings of an index built before, as a snapshot holds them,
+        without indexing the <vocabulary> again
+        """
+
+        index = cls.__new__(cls)
+        index.codes = codes
+        index.vocabulary = vocabulary
+        index.size = len(codes)
+        index.value_counts = value_counts
+        index.exact = exact
+        index.trigrams = trigrams
+        return index
+
+    def __repr__(self):
+        kind = "exact" if self.exact else "trigram"
+        return f"<StringIndex ({kind}) with {len(self.vocabulary)} values over {self.size} rows>"
+
+    @classmethod
+    def from_column(cls, column: Iterable[str]):
+        """Takes in a column of strings and returns an index of their lowercased values"""
+
+        # missing values are searched as empty strings
+        lowered = pd.Series(column, dtype=object).fillna("").astype(str).str.lower()
+        codes, vocabulary = pd.factorize(lowered)
+
+        # the smallest integer type that holds every code
+        return cls(codes.astype(np.min_scalar_type(len(vocabulary))), list(vocabulary))
+
+    @classmethod
+    def from_categorical(cls, column: pd.Categorical, previous=None):
+        """
+        Takes in a Categorical column and returns an index sharing its codes,
+        with its categories lowercased as the vocabulary. If the vocabulary starts
+        with the vocabulary of a <previous> index, only the values after it are indexed.
+        """
+
+        vocabulary = [str(category).lower() for category in column.categories]
+        codes = column.codes
+
+        # missing values are searched as empty strings
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(vocabulary), codes)
+            vocabulary.append("")
+
+        trigrams = None
+        if previous is not None and previous.vocabulary == vocabulary[:len(previous.vocabulary)]:
+            trigrams = previous.trigrams
+
+        return cls(codes, vocabulary, trigrams)
+
+    def append(self, column: Iterable[str]):
+        """
+        Returns a new index of these rows followed by the rows of the string <column>,
+        only adding the values not seen before to the vocabulary and trigram index
+        """
+
+        lowered = pd.Series(column, dtype=object).fillna("").astype(str).str.lower()
+        codes = {value: code for code, value in enumerate(self.vocabulary)}
+        vocabulary = list(self.vocabulary)
+        for value in lowered.unique():
+            if value not in codes:
+                codes[value] = len(vocabulary)
+                vocabulary.append(value)
+
+        added = lowered.map(codes).to_numpy()
+        dtype = np.promote_types(self.codes.dtype, np.min_scalar_type(len(vocabulary)))
+        all_codes = np.concatenate((self.codes, added)).astype(dtype)
+
+        return StringIndex(all_codes, vocabulary, self.trigrams)
+
+    def _scan(self, value: str, codes: Iterable[int]) -> np.ndarray:
+        """Internal method to check which of the values at <codes> contain <value>"""
+
+        return np.array([code for code in codes if value in self.vocabulary[code]],
+                        dtype=np.int64)
+
+    def matching_codes(self, value: str) -> np.ndarray:
+        """Returns the codes of the distinct values that contain <value>, ignoring case"""
+
+        value = value.lower()
+
+        if value in self.exact:
+            return self.exact[value]
+
+        if self.trigrams and len(value) >= NGRAM:
+            postings = sorted((self.trigrams.get(trigram) for trigram in ngrams(value)),
+                              key=lambda codes: -1 if codes is None else len(codes))
+            if postings[0] is None:
+                return np.zeros(0, dtype=np.int64)
+
+            candidates = postings[0]
+            for codes in postings[1:]:
+                candidates = np.intersect1d(candidates, codes, assume_unique=True)
+
+            # sharing every trigram does not mean the trigrams are in the right order
+            return self._scan(value, candidates)
+
+        return self._scan(value, range(len(self.vocabulary)))
+
+    def access(self, value: str) -> str:
+        """Returns how matching_codes() finds the values containing <value>, for explaining queries"""
+
+        value = value.lower()
+
+        if value in self.exact:
+            return "exact index"
+        if self.trigrams and len(value) >= NGRAM:
+            return "trigram index"
+        return "vocabulary scan"
+
+    def count(self, value: str) -> int:
+        """Returns how many rows contain <value>, without looking at any row"""
+
+        return int(self.value_counts[self.matching_codes(value)].sum())
+
+    def mask(self, value: str, rows: np.ndarray) -> np.ndarray:
+        """Returns a mask over the positions in <rows> of the rows that contain <value>"""
+
+        matches = np.zeros(len(self.vocabulary), dtype=bool)
+        matches[self.matching_codes(value)] = True
+
+        return matches[self.codes[rows]]
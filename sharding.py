@@ -0,0 +1,185 @@
+"""
+Sharded evaluation of queries for provider sets too large to filter quickly in one process.
+
+The providers are split into contiguous ranges, each saved as its own snapshot
+directory, and a process per shard maps its snapshot into memory, so the columns
+and skill indexes of every shard live once in the page cache however often the shards
+are started. A query is sent to every shard at once, every shard filters and ranks
+its own providers and sends back only its best ranked <limit>, and those are merged
+into the best <limit> overall. Each shard counts the providers it returned in its own
+counter, which is all ranking needs as every provider belongs to one shard.
+
+Build the shards from the root of the project with
+
+    python sharding.py providers.json providers.shards 8
+"""
+
+import heapq
+import math
+import multiprocessing
+import os
+import sys
+from itertools import islice
+from typing import List, Optional, Tuple
+import numpy as np
+from providers import ProviderList
+from providers_types import Filter_Options, Provider
+from ranking import Ranker
+from snapshot import save_snapshot
+from constants import PAGE_SIZE
+
+DEFAULT_SHARDS = os.cpu_count() or 1
+
+def write_shards(providers: ProviderList, path: str, shards=DEFAULT_SHARDS) -> List[str]:
+    """
+    Splits the providers of <providers> into <shards> contiguous ranges of about the same
+    size and saves each as a snapshot directory in <path>, returns their paths in order
+    """
+
+    os.makedirs(path, exist_ok=True)
+    paths = []
+
+    for shard, rows in enumerate(np.array_split(providers.store.all_rows, shards)):
+        store = providers.store.subset(rows)
+        shard_path = os.path.join(path, f"shard-{shard}")
+        save_snapshot(shard_path, store, Ranker(store.column("rating")).rating_rank)
+        paths.append(shard_path)
+
+    return paths
+
+def _rank_key(provider: Provider) -> Tuple[int, float]:
+    """
+    Internal function ordering providers from different shards the way Ranker does,
+    returned ascending and then rating descending with missing ratings last
+    """
+
+    rating = provider["rating"]
+    return (provider["returned"], -rating if rating == rating else math.inf)
+
+def _serve_shard(path: str, counter_path: Optional[str], connection):
+    """
+    Internal function run by every shard process. Maps the snapshot at <path> and answers
+    the batches of queries sent over <connection> until it is sent None
+    """
+
+    providers = ProviderList.load_snapshot(path, counter_path=counter_path)
+    connection.send(len(providers))
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        (queries, limit) = message
+        try:
+            views = providers.filter_many(queries, limit)
+            connection.send([(len(view), view.list(with_returned=True, limit=limit))
+                             for view in views])
+        except Exception as error:
+            connection.send(error)
+
+    if hasattr(providers.counter, "close"):
+        providers.counter.close()
+    connection.close()
+
+class ShardedProviderList:
+    """
+    Queries the providers split into the shard snapshots in <path> with a process per shard.
+    If <counter_path> is given every shard keeps its returned counts in its own file
+    next to it, so they last between runs.
+    """
+
+    def __init__(self, path: str, counter_path: Optional[str] = None):
+        self.paths = sorted((os.path.join(path, name) for name in os.listdir(path)
+                             if name.startswith("shard-")),
+                            key=lambda shard_path: int(shard_path.rsplit("-", 1)[1]))
+        # spawned instead of forked, so no thread or lock of this process is copied into them
+        context = multiprocessing.get_context("spawn")
+        self._connections = []
+        self._processes = []
+
+        for shard, shard_path in enumerate(self.paths):
+            shard_counter = None if counter_path is None else f"{counter_path}.shard{shard}"
+            (connection, child) = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(shard_path, shard_counter, child),
+                                      name=f"provider-shard-{shard}", daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        self.sizes = [connection.recv() for connection in self._connections]
+
+    @classmethod
+    def build(cls, providers: ProviderList, path: str, shards=DEFAULT_SHARDS,
+              counter_path: Optional[str] = None):
+        """Splits <providers> into <shards> snapshots in <path> and starts a process for each"""
+
+        write_shards(providers, path, shards)
+        return cls(path, counter_path)
+
+    def __repr__(self):
+        return f"<ShardedProviderList of {len(self)} providers in {len(self.paths)} shards>"
+
+    def __len__(self):
+        return sum(self.sizes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def filter_many(self, queries: List[Filter_Options],
+                    limit=PAGE_SIZE) -> List[Tuple[int, List[Provider]]]:
+        """
+        Filters every shard by every Filter_Options in <queries> at once and returns,
+        for each query in order, how many providers it kept along with the best ranked
+        <limit> of them, in the same order as ProviderList.filter_many() over the
+        unsharded providers would rank them.
+        """
+
+        for connection in self._connections:
+            connection.send((queries, limit))
+
+        replies = [connection.recv() for connection in self._connections]
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+
+        results = []
+        for query in range(len(queries)):
+            shard_results = [reply[query] for reply in replies]
+            total = sum(kept for (kept, _) in shard_results)
+            # ties go to the lower shard, the same as to the lower position unsharded
+            merged = heapq.merge(*(page for (_, page) in shard_results), key=_rank_key)
+            results.append((total, list(islice(merged, limit))))
+
+        return results
+
+    def filter(self, traits: Filter_Options, limit=PAGE_SIZE) -> Tuple[int, List[Provider]]:
+        """
+        Filters every shard by <traits> and returns how many providers were kept
+        along with the best ranked <limit> of them
+        """
+
+        return self.filter_many([traits], limit)[0]
+
+    def close(self):
+        """Stops every shard process"""
+
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+
+        for process in self._processes:
+            process.join()
+
+        self._connections = []
+        self._processes = []
+
+if __name__ == "__main__":
+    write_shards(ProviderList(sys.argv[1]), sys.argv[2],
+                 int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_SHARDS)
@@ -0,0 +1,198 @@
+"""
+Skill similarity search: finds the providers whose skills are most like a set of skills,
+or like the skills of another provider, even where no skill string matches exactly,
+so "Unix" finds providers with "Linux / Unix" and "Data Structures" those with "Data Mining".
+
+Skills are split into lowercase word tokens and every provider becomes a TF-IDF weighted
+vector of the tokens of its skills, secondary skills counting <SECONDARY_WEIGHT> as much
+as primary ones, scaled to length 1. The vectors are held as a sparse provider by token
+matrix in CSC form, the providers with each token and their weights grouped by token,
+so the cosine similarity of every provider to a query, also scaled to length 1,
+only reads the postings of the tokens in the query.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+from skill_index import SkillIndex
+from scoring import top_scores
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+# weight of the tokens of a secondary skill, against 1 for those of a primary skill
+SECONDARY_WEIGHT = 0.5
+# most results of queries over every provider kept by a SkillSimilarity
+DEFAULT_CACHE_ENTRIES = 256
+
+def skill_tokens(skill: str) -> List[str]:
+    """Returns the distinct lowercase word tokens of <skill>, e.g. ["linux", "unix"] for "Linux / Unix" """
+
+    return list(dict.fromkeys(TOKEN_PATTERN.findall(skill.lower())))
+
+def _postings(index: SkillIndex, token_codes: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Internal function returning the row and token code of every time a provider
+    has a token through one of its skills in <index>, adding new tokens to <token_codes>
+    """
+
+    skill_codes = []
+    tokens = []
+    for (code, skill) in enumerate(index.vocabulary):
+        for token in skill_tokens(skill):
+            skill_codes.append(code)
+            tokens.append(token_codes.setdefault(token, len(token_codes)))
+
+    skill_codes = np.array(skill_codes, dtype=np.int64)
+    counts = np.diff(index.indptr)[skill_codes]
+    # positions in index.indices of the postings of every (skill, token) pair, one after another
+    starts = np.repeat(index.indptr[skill_codes] - (np.cumsum(counts) - counts), counts)
+    rows = index.indices[starts + np.arange(counts.sum())]
+
+    return (rows.astype(np.int64), np.repeat(np.array(tokens, dtype=np.int64), counts))
+
+class SkillSimilarity:
+    """
+    TF-IDF weighted provider by token matrix over <size> positions, with the token
+    codes of <vocabulary>, the <idf> of every token and, in CSC form, the <rows> with
+    each token and their weight in <values>, grouped by token with <indptr> marking
+    where each token's postings start and end. Every row is scaled to length 1.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, indptr: np.ndarray,
+                 rows: np.ndarray, values: np.ndarray, size: int,
+                 max_entries=DEFAULT_CACHE_ENTRIES):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.indptr = indptr
+        self.rows = rows
+        self.values = values
+        self.size = size
+        self.max_entries = max_entries
+        # top results of queries over every provider, the matrix never changes
+        self._cache: "OrderedDict[Hashable, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return (f"<SkillSimilarity of {len(self.vocabulary)} tokens over {self.size} rows, "
+                f"{len(self.rows)} postings>")
+
+    @classmethod
+    def from_indexes(cls, primary_skills: SkillIndex, secondary_skills: SkillIndex):
+        """Builds the matrix from the skill indexes of a store"""
+
+        size = primary_skills.size
+        vocabulary: Dict[str, int] = {}
+        (primary_rows, primary_tokens) = _postings(primary_skills, vocabulary)
+        (secondary_rows, secondary_tokens) = _postings(secondary_skills, vocabulary)
+
+        # adds up the weights of every (token, row) pair, which come out grouped by token
+        keys = np.concatenate((primary_tokens * size + primary_rows,
+                               secondary_tokens * size + secondary_rows))
+        weights = np.concatenate((np.ones(len(primary_rows)),
+                                  np.full(len(secondary_rows), SECONDARY_WEIGHT)))
+        (keys, pairs) = np.unique(keys, return_inverse=True)
+        frequency = np.bincount(pairs, weights=weights)
+        (tokens, rows) = np.divmod(keys, max(size, 1))
+
+        with_token = np.bincount(tokens, minlength=len(vocabulary))
+        idf = np.log((1 + size) / (1 + with_token)) + 1
+
+        values = frequency * idf[tokens]
+        lengths = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=size))
+        values /= lengths[rows]
+
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(with_token, out=indptr[1:])
+
+        return cls(vocabulary, idf, indptr, rows.astype(np.int32), values.astype(np.float32), size)
+
+    def query(self, primary_skills: Iterable[str],
+              secondary_skills: Iterable[str] = ()) -> Tuple[Dict[int, float], List[str]]:
+        """
+        Returns the TF-IDF vector of <primary_skills> and <secondary_skills> scaled to
+        length 1, as the weight of every token code in it, along with the tokens
+        no provider has, which are left out
+        """
+
+        weights: Dict[str, float] = {}
+        for (skills, weight) in ((primary_skills, 1.0), (secondary_skills, SECONDARY_WEIGHT)):
+            for skill in skills:
+                for token in skill_tokens(skill):
+                    weights[token] = weights.get(token, 0.0) + weight
+
+        unknown = [token for token in weights if token not in self.vocabulary]
+        vector = {self.vocabulary[token]: weight * self.idf[self.vocabulary[token]]
+                  for (token, weight) in weights.items() if token in self.vocabulary}
+
+        length = np.sqrt(sum(weight ** 2 for weight in vector.values()))
+        return ({token: weight / length for (token, weight) in vector.items()}, unknown)
+
+    def scores(self, vector: Dict[int, float]) -> np.ndarray:
+        """Returns the cosine similarity of every position to the <vector> from query()"""
+
+        postings = [slice(self.indptr[token], self.indptr[token + 1]) for token in vector]
+        if not postings:
+            return np.zeros(self.size)
+
+        rows = np.concatenate([self.rows[posting] for posting in postings])
+        weights = np.concatenate([self.values[posting] * weight
+                                  for (posting, weight) in zip(postings, vector.values())])
+        return np.bincount(rows, weights=weights, minlength=self.size)
+
+    def top(self, vector: Dict[int, float], rows: Optional[np.ndarray], k: Optional[int],
+            exclude: Optional[int] = None,
+            live: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the positions among <rows> most similar to <vector>, at most <k> of them
+        from most to least similar, along with their similarities. Positions sharing
+        no token with it and the position <exclude> are left out. If <rows> is None
+        every position is searched except where the <live> mask, if given, is false
+        """
+
+        similarity = self.scores(vector)
+
+        if rows is None:
+            # only the positions with a token of the query are read
+            rows = np.flatnonzero(similarity)
+            if live is not None:
+                rows = rows[live[rows]]
+            similarity = similarity[rows]
+        else:
+            similarity = similarity[rows]
+            kept = similarity > 0
+            (rows, similarity) = (rows[kept], similarity[kept])
+
+        if exclude is not None:
+            kept = rows != exclude
+            (rows, similarity) = (rows[kept], similarity[kept])
+
+        order = top_scores(similarity, k)[:k]
+        return (rows[order], similarity[order])
+
+    def cached(self, key: Hashable) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Returns the result cached for <key>, None if there is none"""
+
+        with self._lock:
+            result = self._cache.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def cache(self, key: Hashable, result: Tuple[np.ndarray, np.ndarray]):
+        """Caches <result> for <key>, dropping the least recently used past <max_entries>"""
+
+        for array in result:
+            array.flags.writeable = False
+
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
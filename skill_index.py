@@ -0,0 +1,152 @@
+from typing import Iterable, Iterator, List
+import numpy as np
+import pandas as pd
+
+class SkillIndex:
+    """
+    Compact inverted index from a lowercased skill to the sorted row positions
+    of the providers that have it.
+
+    Postings are stored in CSC form: one flat <indices> array of row positions
+    grouped by skill, with <indptr> marking where each skill's positions start
+    and end. Queries are answered as boolean masks the length of the dataset
+    so they can be combined with other filters through bitwise operations.
+    """
+
+    def __init__(self, vocabulary: List[str], indptr: np.ndarray,
+                 indices: np.ndarray, size: int):
+        self.vocabulary = vocabulary
+        self.codes = {skill: code for code, skill in enumerate(vocabulary)}
+        self.indptr = indptr
+        self.indices = indices
+        self.size = size
+
+    def __repr__(self):
+        return f"<SkillIndex with {len(self.vocabulary)} skills over {self.size} rows>"
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.vocabulary)
+
+    def __contains__(self, skill: str):
+        return skill in self.codes
+
+    def __getitem__(self, skill: str) -> np.ndarray:
+        code = self.codes[skill]
+        return self.indices[self.indptr[code]:self.indptr[code + 1]]
+
+    def get(self, skill: str, default=None):
+        if skill not in self.codes:
+            return default
+
+        return self[skill]
+
+    def keys(self):
+        return self.codes.keys()
+
+    @classmethod
+    def from_column(cls, column: Iterable[List[str]]):
+        """
+        Takes in a column where every row is a list of skills and returns
+        an index of the lowercased skills. A skill listed more than once
+        for the same row is only indexed once.
+        """
+
+        skill_lists = list(column)
+        size = len(skill_lists)
+        lengths = np.fromiter((len(skills) for skills in skill_lists),
+                              dtype=np.int64,
+                              count=size)
+        flat_skills = [skill.lower() for skills in skill_lists for skill in skills]
+
+        if not flat_skills:
+            return cls([], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), size)
+
+        rows = np.repeat(np.arange(size, dtype=np.int32), lengths)
+        codes, vocabulary = pd.factorize(np.array(flat_skills, dtype=object))
+
+        # group row positions by skill with rows ascending inside each skill,
+        # then drop repeated (skill, row) pairs
+        order = np.lexsort((rows, codes))
+        codes = codes[order]
+        rows = rows[order]
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+        codes = codes[keep]
+        rows = rows[keep]
+
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(vocabulary)), out=indptr[1:])
+
+        return cls(list(vocabulary), indptr, rows, size)
+
+    def append(self, column: Iterable[List[str]]):
+        """
+        Returns a new index of these rows followed by the rows in <column>,
+        only indexing the new rows and merging their postings into these.
+        """
+
+        added = SkillIndex.from_column(column)
+        vocabulary = list(self.vocabulary)
+        codes = dict(self.codes)
+        for skill in added.vocabulary:
+            if skill not in codes:
+                codes[skill] = len(vocabulary)
+                vocabulary.append(skill)
+
+        # code in the merged vocabulary of every skill of the added rows
+        added_codes = np.array([codes[skill] for skill in added.vocabulary], dtype=np.int64)
+        old_counts = np.zeros(len(vocabulary), dtype=np.int64)
+        old_counts[:len(self.vocabulary)] = np.diff(self.indptr)
+        added_counts = np.zeros(len(vocabulary), dtype=np.int64)
+        added_counts[added_codes] = np.diff(added.indptr)
+
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(old_counts + added_counts, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+
+        # the postings of each skill keep their old rows first, then the added rows
+        # which all come after them, so every skill's rows stay sorted
+        old_skill = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.indptr))
+        old_offset = np.arange(len(self.indices)) - self.indptr[old_skill]
+        indices[indptr[old_skill] + old_offset] = self.indices
+
+        added_skill = np.repeat(np.arange(len(added.vocabulary)), np.diff(added.indptr))
+        added_offset = np.arange(len(added.indices)) - added.indptr[added_skill]
+        merged_skill = added_codes[added_skill]
+        indices[indptr[merged_skill] + old_counts[merged_skill] + added_offset] = (
+            added.indices + self.size)
+
+        return SkillIndex(vocabulary, indptr, indices, self.size + added.size)
+
+    def postings(self, skills: Iterable[str]) -> List[np.ndarray]:
+        """
+        Returns the row positions for each skill in <skills> that is in the index.
+        Skills are lowercased before lookup.
+        """
+
+        return [self[skill.lower()] for skill in skills if skill.lower() in self.codes]
+
+    def mask(self, skills: Iterable[str], match_all=False) -> np.ndarray:
+        """
+        Returns a boolean mask the length of the dataset which is true for rows
+        that have any of the <skills>, or all of them if <match_all> is true.
+        """
+
+        wanted = {skill.lower() for skill in skills}
+        found = self.postings(wanted)
+        mask = np.zeros(self.size, dtype=bool)
+
+        if not found or (match_all and len(found) < len(wanted)):
+            return mask
+
+        positions = np.concatenate(found)
+
+        if match_all:
+            counts = np.bincount(positions, minlength=self.size)
+            return counts == len(found)
+
+        mask[positions] = True
+        return mask
@@ -0,0 +1,370 @@
+"""
+Binary columnar snapshots of a ProviderStore.
+
+A snapshot is a directory holding one .npy file per array along with a
+metadata.json describing how the arrays make up the store. Loading maps every
+.npy file into memory read-only instead of reading it, so startup does not grow
+with the number of providers and every worker process loading the same snapshot
+shares the same pages of the page cache.
+
+String and skill list columns are kept dictionary encoded: integer codes in
+.npy files and the distinct values in metadata.json. They are only turned back
+into python values for the rows that are asked for.
+
+The skill and string search indexes are saved along with the columns, the postings
+of every string index as one .npy file of codes with the bounds of each value's or
+trigram's postings, so loading a snapshot indexes nothing again. So is the skill
+similarity matrix, which workers would otherwise each build on their first search.
+
+Build one from the root of the project with
+
+    python snapshot.py providers.json providers.snapshot
+"""
+
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from provider_store import ProviderStore
+from skill_index import SkillIndex
+from search_index import StringIndex
+from similarity import SkillSimilarity
+
+SNAPSHOT_VERSION = 3
+METADATA_FILE = "metadata.json"
+
+def _merge_values(values: np.ndarray, added: np.ndarray) -> Tuple[list, np.ndarray]:
+    """
+    Internal function returning <values> followed by the <added> values not already in
+    them, and the code of every added value in the merged values
+    """
+
+    merged = values.tolist()
+    codes = {value: code for code, value in enumerate(merged)}
+    for value in added.tolist():
+        if value not in codes:
+            codes[value] = len(merged)
+            merged.append(value)
+
+    return (merged, np.array([codes[value] for value in added.tolist()], dtype=np.int64))
+
+class DictionaryColumn:
+    """
+    Read-only column of python values stored as integer <codes> into the
+    distinct <values>. Indexing it builds an object array of only those rows.
+    """
+
+    dtype = np.dtype(object)
+
+    def __init__(self, codes: np.ndarray, values: list):
+        self.codes = codes
+        self.values = np.array(values, dtype=object)
+
+    def __repr__(self):
+        return f"<DictionaryColumn with {len(self.values)} values over {len(self)} rows>"
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return self.values[self.codes[rows]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + int(pd.Series(self.values).memory_usage(deep=True, index=False))
+
+    def append(self, column) -> "DictionaryColumn":
+        """Returns a new column of these rows followed by the values in <column>"""
+
+        added = DictionaryColumn.encode(column)
+        (values, recode) = _merge_values(self.values, added.values)
+        added_codes = recode[added.codes]
+        dtype = np.min_scalar_type(len(values))
+
+        return DictionaryColumn(np.concatenate((self.codes, added_codes)).astype(dtype), values)
+
+    @classmethod
+    def encode(cls, column):
+        """Takes in a column of hashable values, None included, and dictionary encodes it"""
+
+        if isinstance(column, cls):
+            return column
+
+        codes, values = pd.factorize(pd.Series(column, dtype=object))
+        values = list(values)
+
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(values), codes)
+            values.append(None)
+
+        return cls(codes.astype(np.min_scalar_type(len(values))), values)
+
+class ListColumn:
+    """
+    Read-only column where every row is a list of strings, stored CSR style as
+    <indptr> marking where each row's <codes> into the distinct <values> start and end.
+    Indexing it builds an object array of lists for only those rows.
+    """
+
+    dtype = np.dtype(object)
+
+    def __init__(self, indptr: np.ndarray, codes: np.ndarray, values: List[str]):
+        self.indptr = indptr
+        self.codes = codes
+        self.values = np.array(values, dtype=object)
+
+    def __repr__(self):
+        return f"<ListColumn with {len(self.values)} values over {len(self)} rows>"
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, rows) -> np.ndarray:
+        if isinstance(rows, slice):
+            rows = np.arange(*rows.indices(len(self)))
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+
+        # positions in <codes> of every value of every row, row after row
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - ends + lengths,
+                                                                        lengths)
+        flat = self.values[self.codes[positions]].tolist()
+
+        lists = np.empty(len(rows), dtype=object)
+        start = 0
+        for row, end in enumerate(ends.tolist()):
+            lists[row] = flat[start:end]
+            start = end
+
+        return lists
+
+    @property
+    def nbytes(self) -> int:
+        return (self.indptr.nbytes + self.codes.nbytes
+                + int(pd.Series(self.values).memory_usage(deep=True, index=False)))
+
+    def append(self, column) -> "ListColumn":
+        """Returns a new column of these rows followed by the lists in <column>"""
+
+        added = ListColumn.encode(column)
+        (values, recode) = _merge_values(self.values, added.values)
+        added_codes = recode[added.codes]
+        indptr = np.concatenate((self.indptr, self.indptr[-1] + added.indptr[1:]))
+        dtype = np.min_scalar_type(len(values))
+
+        return ListColumn(indptr, np.concatenate((self.codes, added_codes)).astype(dtype), values)
+
+    @classmethod
+    def encode(cls, column):
+        """Takes in a column where every row is a list of strings and encodes it"""
+
+        if isinstance(column, cls):
+            return column
+
+        indptr = np.zeros(len(column) + 1, dtype=np.int64)
+        np.cumsum([len(values) for values in column], out=indptr[1:])
+        codes, values = pd.factorize(np.array([value for values in column for value in values],
+                                              dtype=object))
+
+        return cls(indptr, codes.astype(np.min_scalar_type(len(values))), list(values))
+
+def _is_list_column(column) -> bool:
+    return isinstance(column, ListColumn) or (len(column) > 0 and isinstance(column[0], list))
+
+def _save_array(path: str, name: str, array: np.ndarray) -> str:
+    """Internal function saving <array> as <name>.npy in the snapshot at <path>, returns <name>"""
+
+    np.save(os.path.join(path, f"{name}.npy"), np.asarray(array), allow_pickle=False)
+    return name
+
+def _load_array(path: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+
+def _save_skill_index(path: str, name: str, index: SkillIndex) -> dict:
+    return {"vocabulary": index.vocabulary,
+            "indptr": _save_array(path, f"{name}.indptr", index.indptr),
+            "indices": _save_array(path, f"{name}.indices", index.indices)}
+
+def _load_skill_index(path: str, spec: dict, size: int) -> SkillIndex:
+    return SkillIndex(spec["vocabulary"], _load_array(path, spec["indptr"]),
+                      _load_array(path, spec["indices"]), size)
+
+def _save_postings(path: str, name: str, postings: Dict[str, np.ndarray]) -> dict:
+    """
+    Internal function saving the codes of every key's <postings> one after another
+    with <indptr> marking where each key's codes start and end, CSR style
+    """
+
+    indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([len(codes) for codes in postings.values()], out=indptr[1:])
+    codes = (np.concatenate(list(postings.values())) if postings
+             else np.zeros(0, dtype=np.int64))
+
+    return {"keys": list(postings),
+            "indptr": _save_array(path, f"{name}.indptr", indptr),
+            "codes": _save_array(path, name, codes)}
+
+def _load_postings(path: str, spec: dict) -> Dict[str, np.ndarray]:
+    """Internal function returning the postings of every key as slices of the mapped codes"""
+
+    indptr = _load_array(path, spec["indptr"]).tolist()
+    codes = _load_array(path, spec["codes"])
+    return {key: codes[indptr[key_index]:indptr[key_index + 1]]
+            for key_index, key in enumerate(spec["keys"])}
+
+def _save_string_index(path: str, name: str, index: StringIndex) -> dict:
+    return {"codes": _save_array(path, name, index.codes),
+            "vocabulary": index.vocabulary,
+            "value_counts": _save_array(path, f"{name}.counts", index.value_counts),
+            "exact": _save_postings(path, f"{name}.exact", index.exact),
+            "trigrams": _save_postings(path, f"{name}.trigrams", index.trigrams)}
+
+def _load_string_index(path: str, spec: dict) -> StringIndex:
+    return StringIndex.from_postings(_load_array(path, spec["codes"]), spec["vocabulary"],
+                                     _load_array(path, spec["value_counts"]),
+                                     _load_postings(path, spec["exact"]),
+                                     _load_postings(path, spec["trigrams"]))
+
+def _save_similarity(path: str, similarity: SkillSimilarity) -> dict:
+    # tokens in code order
+    return {"tokens": sorted(similarity.vocabulary, key=similarity.vocabulary.get),
+            "idf": _save_array(path, "similarity.idf", similarity.idf),
+            "indptr": _save_array(path, "similarity.indptr", similarity.indptr),
+            "rows": _save_array(path, "similarity.rows", similarity.rows),
+            "values": _save_array(path, "similarity.values", similarity.values)}
+
+def _load_similarity(path: str, spec: dict, size: int) -> SkillSimilarity:
+    return SkillSimilarity({token: code for code, token in enumerate(spec["tokens"])},
+                           _load_array(path, spec["idf"]), _load_array(path, spec["indptr"]),
+                           _load_array(path, spec["rows"]), _load_array(path, spec["values"]), size)
+
+def _write(path: str, store: ProviderStore, rating_rank: np.ndarray):
+    """Internal function writing every array of <store> and its metadata into <path>"""
+
+    columns = []
+
+    for name, column in store.columns.items():
+        if isinstance(column, pd.Categorical):
+            columns.append({"name": name, "kind": "categorical",
+                            "codes": _save_array(path, name, column.codes),
+                            "categories": column.categories.tolist()})
+        elif _is_list_column(column):
+            column = ListColumn.encode(column)
+            columns.append({"name": name, "kind": "lists",
+                            "indptr": _save_array(path, f"{name}.indptr", column.indptr),
+                            "codes": _save_array(path, name, column.codes),
+                            "values": column.values.tolist()})
+        elif column.dtype == object:
+            column = DictionaryColumn.encode(column)
+            columns.append({"name": name, "kind": "dictionary",
+                            "codes": _save_array(path, name, column.codes),
+                            "values": column.values.tolist()})
+        else:
+            columns.append({"name": name, "kind": "array", "array": _save_array(path, name, column)})
+
+    birth_dates = DictionaryColumn.encode(store.birth_dates)
+    string_indexes = {trait: _save_string_index(path, f"{trait}.search", index)
+                      for trait, index in store.string_indexes.items()}
+
+    metadata = {
+        "version": SNAPSHOT_VERSION,
+        "size": store.size,
+        "columns": columns,
+        "birth_dates": {"codes": _save_array(path, "birth_dates", birth_dates.codes),
+                        "values": birth_dates.values.tolist()},
+        "primary_skills": _save_skill_index(path, "primary_skills.index", store.primary_skills),
+        "secondary_skills": _save_skill_index(path, "secondary_skills.index", store.secondary_skills),
+        "string_indexes": string_indexes,
+        "skill_similarity": _save_similarity(path, store.skill_similarity()),
+        "rating_rank": _save_array(path, "rating_rank", rating_rank),
+        "live": None if store.live is None else _save_array(path, "live", store.live),
+    }
+
+    with open(os.path.join(path, METADATA_FILE), "w") as metadata_file:
+        json.dump(metadata, metadata_file)
+
+def save_snapshot(path: str, store: ProviderStore, rating_rank: np.ndarray):
+    """
+    Saves <store>, along with the <rating_rank> of its ranker, as a snapshot directory at <path>.
+    The snapshot is written next to <path> and then moved into place, so processes
+    which have the old snapshot mapped keep reading it unchanged.
+    """
+
+    path = os.path.abspath(path)
+    staging = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    try:
+        _write(staging, store, rating_rank)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if os.path.exists(path):
+        # mapped files stay readable after they are removed
+        replaced = f"{path}.{os.getpid()}.old"
+        os.rename(path, replaced)
+        os.rename(staging, path)
+        shutil.rmtree(replaced)
+    else:
+        os.rename(staging, path)
+
+def load_snapshot(path: str) -> Tuple[ProviderStore, np.ndarray]:
+    """
+    Maps the snapshot directory at <path> into memory and returns the store
+    it holds along with the rating_rank of its ranker. Columns and the postings
+    of every index are read from the mapped files, not built again
+    """
+
+    with open(os.path.join(path, METADATA_FILE)) as metadata_file:
+        metadata = json.load(metadata_file)
+
+    if metadata.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is a snapshot version {metadata.get('version')}, "
+                         f"expected version {SNAPSHOT_VERSION}")
+
+    size = metadata["size"]
+    columns: Dict[str, object] = {}
+
+    for spec in metadata["columns"]:
+        kind = spec["kind"]
+        if kind == "categorical":
+            # the codes were written from a Categorical, so they are wrapped as they are
+            # without being checked or copied out of the mapped file
+            columns[spec["name"]] = pd.Categorical(_load_array(path, spec["codes"]),
+                                                   dtype=pd.CategoricalDtype(spec["categories"]),
+                                                   fastpath=True)
+        elif kind == "lists":
+            columns[spec["name"]] = ListColumn(_load_array(path, spec["indptr"]),
+                                               _load_array(path, spec["codes"]),
+                                               spec["values"])
+        elif kind == "dictionary":
+            columns[spec["name"]] = DictionaryColumn(_load_array(path, spec["codes"]),
+                                                     spec["values"])
+        else:
+            columns[spec["name"]] = _load_array(path, spec["array"])
+
+    birth_dates = DictionaryColumn(_load_array(path, metadata["birth_dates"]["codes"]),
+                                   metadata["birth_dates"]["values"])
+    string_indexes = {trait: _load_string_index(path, spec)
+                      for trait, spec in metadata["string_indexes"].items()}
+    # snapshots of stores without tombstones have no live mask
+    live = metadata.get("live")
+    store = ProviderStore(columns,
+                          _load_skill_index(path, metadata["primary_skills"], size),
+                          _load_skill_index(path, metadata["secondary_skills"], size),
+                          birth_dates,
+                          string_indexes,
+                          None if live is None else _load_array(path, live),
+                          _load_similarity(path, metadata["skill_similarity"], size))
+
+    return (store, _load_array(path, metadata["rating_rank"]))
+
+if __name__ == "__main__":
+    from providers import ProviderList
+    ProviderList(sys.argv[1]).save_snapshot(sys.argv[2])
@@ -0,0 +1,15 @@
+from app import app
+from unittest import TestCase
+
+class FilterFormTest(TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_both_skill_inputs_with_facets(self):
+        page = self.client.get("/filter").get_data(as_text=True)
+
+        for trait in ("primary_skills", "secondary_skills"):
+            assert f'name="{trait}"' in page
+            assert f'<datalist id="{trait}Facets">' in page
+        assert '<option value="' in page.split('<datalist id="secondary_skillsFacets">')[1]
@@ -0,0 +1,208 @@
+from asgi import MatchingService
+from api import ApiError, PageRequest, RankingCache, providers_page
+from providers import ProviderList
+from constants import TEST_JSON, PROVIDER_JSON
+from unittest import TestCase
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+def call(app, method, path, query_string=b"", body=b""):
+    """Sends one request to the ASGI <app> and returns its status, headers and body"""
+
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def request():
+        await app({"type": "http", "method": method, "path": path,
+                   "query_string": query_string, "headers": []}, receive, send)
+
+    asyncio.run(request())
+    (start, response) = messages
+    return (start["status"], dict(start["headers"]), response["body"])
+
+class MatchingServiceTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.app = MatchingService(self.providers, workers=2)
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+
+    def test_get_same_page_as_flask_api(self):
+        (status, headers, body) = call(self.app, "GET", "/api/providers", b"rating=gt:5&limit=1")
+        page = json.loads(body)
+
+        expected = ProviderList(TEST_JSON)
+        (_, expected_body) = providers_page(expected, PageRequest({"rating": ("gt", 5.0)}, 1, 0, True),
+                                            self.app.cursors, RankingCache())
+
+        assert status == 200
+        assert headers[b"content-type"] == b"application/json"
+        # the cursors only differ by the token of their ranking
+        expected_page = json.loads(expected_body)
+        assert page["providers"] == expected_page["providers"]
+        assert (self.app.cursors.loads(page["next_cursor"])[:3] ==
+                self.app.cursors.loads(expected_page["next_cursor"])[:3])
+        assert page["total"] == 2
+        assert list(self.providers.returned) == [0, 1, 1]
+
+    def test_post_and_cursor(self):
+        body = json.dumps({"filters": {"rating": ["gt", 5]}, "limit": 1}).encode()
+        (_, _, first) = call(self.app, "POST", "/api/providers", body=body)
+        cursor = json.loads(first)["next_cursor"]
+        (_, _, second) = call(self.app, "GET", "/api/providers", f"cursor={cursor}".encode())
+
+        ids = [json.loads(page)["providers"][0]["id"] for page in (first, second)]
+        assert sorted(ids) == [2, 3]
+        assert json.loads(second)["next_cursor"] is None
+
+    def test_explain(self):
+        (_, _, body) = call(self.app, "GET", "/api/providers", b"rating=gt:5&explain=true")
+        explanation = json.loads(body)["explain"]
+
+        assert [stage["trait"] for stage in explanation["stages"]] == ["rating"]
+        assert explanation["rows_out"] == 2
+        # clients cannot turn on tracing allocations for the whole process
+        assert explanation["stages"][0]["allocated"] is None
+        assert "explain" not in json.loads(call(self.app, "GET", "/api/providers", b"rating=gt:5")[2])
+
+    def test_metrics(self):
+        call(self.app, "GET", "/api/providers", b"rating=gt:5")
+        (status, headers, body) = call(self.app, "GET", "/metrics")
+
+        assert status == 200
+        assert headers[b"content-type"].startswith(b"text/plain")
+        assert b'matching_request_duration_seconds_count{route="/api/providers",method="GET",status="200"}' in body
+
+    def test_match_and_cursor(self):
+        (_, _, first) = call(self.app, "GET", "/api/providers",
+                             b"primary_skills=html,Secure Coding Practices,Embedded Systems&match=true&limit=1")
+        page = json.loads(first)
+        (_, _, second) = call(self.app, "GET", "/api/providers",
+                              f"cursor={page['next_cursor']}".encode())
+
+        assert page["total"] == 2
+        assert page["providers"][0]["id"] == 3
+        assert [p["id"] for p in json.loads(second)["providers"]] == [1]
+
+    def test_pages_keep_their_order(self):
+        app = MatchingService(ProviderList(PROVIDER_JSON), workers=2)
+        ids = []
+        query = b"rating=gt:5&limit=7"
+
+        while query:
+            (_, _, body) = call(app, "GET", "/api/providers", query)
+            page = json.loads(body)
+            ids += [provider["id"] for provider in page["providers"]]
+            # other queries change the returned counts the ranking is worked out from
+            call(app, "GET", "/api/providers", b"rating=gt:6&limit=7")
+            query = page["next_cursor"] and f"cursor={page['next_cursor']}".encode()
+
+        app.executor.shutdown()
+        assert len(ids) == len(set(ids)) == page["total"]
+
+    def test_cursor_ranked_again_after_store_changes(self):
+        (_, _, first) = call(self.app, "GET", "/api/providers", b"rating=gt:5&limit=1")
+        self.providers.update_provider(1, {"rating": 9.0})
+        (_, _, second) = call(self.app, "GET", "/api/providers",
+                              f"cursor={json.loads(first)['next_cursor']}".encode())
+
+        assert json.loads(second)["total"] == 3
+
+    def test_bad_filter_message(self):
+        body = json.dumps({"filters": {"id": ["eq", 4.7]}}).encode()
+        (status, _, response) = call(self.app, "POST", "/api/providers", body=body)
+
+        assert status == 400
+        assert json.loads(response) == {"error": "id should be compared to a whole number"}
+
+    def test_bad_requests(self):
+        assert call(self.app, "GET", "/api/providers", b"rating=about:5")[0] == 400
+        assert call(self.app, "POST", "/api/providers", body=b"not json")[0] == 400
+        assert call(self.app, "GET", "/elsewhere")[0] == 404
+        assert call(self.app, "DELETE", "/api/providers")[0] == 405
+
+    def test_method_not_allowed(self):
+        (status, headers, _) = call(self.app, "POST", "/metrics")
+        assert status == 405
+        assert headers[b"allow"] == b"GET"
+        assert call(self.app, "PUT", "/api/providers")[1][b"allow"] == b"GET, POST"
+
+    def test_unexpected_error_answered(self):
+        with patch("asgi.providers_page", side_effect=RuntimeError("broken")), \
+                self.assertLogs("asgi", level="ERROR"):
+            (status, headers, body) = call(self.app, "GET", "/api/providers")
+
+        assert status == 500
+        assert headers[b"content-type"] == b"application/json"
+        assert json.loads(body) == {"error": "internal server error"}
+
+    def test_identical_requests_coalesced(self):
+        release = threading.Event()
+
+        # hold the first computation in the worker pool until every request has arrived
+        def blocked_page(*args):
+            release.wait()
+            return providers_page(*args)
+
+        async def requests():
+            page = PageRequest({"rating": ("gt", 5.0)}, 10, 0, True)
+            pages = [asyncio.ensure_future(self.app.page(page)) for _ in range(3)]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*pages)
+
+        with patch("asgi.providers_page", side_effect=blocked_page):
+            bodies = asyncio.run(requests())
+
+        assert len(set(bodies)) == 1
+        assert (self.app.computed, self.app.coalesced) == (1, 2)
+        # every request that was sent the providers counts them as returned
+        assert list(self.providers.returned) == [0, 3, 3]
+
+    def test_filters_without_canonical_form_not_coalesced(self):
+        release = threading.Event()
+
+        def blocked_page(providers, page, cursors, rankings):
+            release.wait()
+            return (None, json.dumps(page.filters).encode())
+
+        async def requests():
+            pages = [asyncio.ensure_future(self.app.page(
+                PageRequest({"birth_date": ("between", bounds)}, 10, 0, False)))
+                for bounds in ((1, 2), (3, 4))]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*pages)
+
+        with patch("asgi.providers_page", side_effect=blocked_page):
+            bodies = asyncio.run(requests())
+
+        assert bodies[0] != bodies[1]
+        assert (self.app.computed, self.app.coalesced) == (2, 0)
+
+    def test_turned_away_when_full(self):
+        self.app.max_pending = 1
+
+        async def requests():
+            # the first page stays in flight until the loop gets back to it
+            first = asyncio.ensure_future(self.app.page(PageRequest({}, 10, 0, True)))
+            await asyncio.sleep(0)
+
+            with self.assertRaises(ApiError) as raised:
+                await self.app.page(PageRequest({"rating": ("gt", 5.0)}, 10, 0, True))
+
+            await first
+            return raised.exception
+
+        error = asyncio.run(requests())
+        assert error.status == 503
+        assert self.app.rejected == 1
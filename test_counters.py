@@ -0,0 +1,208 @@
+from counters import ReturnedCounter, PersistentReturnedCounter
+from unittest import TestCase
+from threading import Thread
+from multiprocessing import Process
+import os
+import tempfile
+import numpy as np
+
+class ReturnedCounterTest(TestCase):
+
+    def setUp(self):
+        self.counter = ReturnedCounter(10, stripes=3)
+
+    def test_starts_at_zero(self):
+        assert len(self.counter) == 10
+        assert (self.counter.snapshot() == 0).all()
+
+    def test_increment_subset(self):
+        self.counter.increment(np.array([9, 0, 4]))
+
+        assert list(self.counter.snapshot()) == [1, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+
+    def test_increment_by_amounts(self):
+        self.counter.increment(np.array([9, 0, 4]), np.array([3, 1, 2]))
+
+        assert list(self.counter[[0, 4, 9]]) == [1, 2, 3]
+
+    def test_increment_nothing(self):
+        self.counter.increment(np.array([], dtype=np.int64))
+
+        assert (self.counter.snapshot() == 0).all()
+
+    def test_snapshot_is_a_copy(self):
+        snapshot = self.counter.snapshot()
+        snapshot[:] = 5
+
+        assert (self.counter.snapshot() == 0).all()
+
+    def test_reset(self):
+        self.counter.increment(np.arange(10))
+        self.counter.reset()
+
+        assert (self.counter.snapshot() == 0).all()
+
+    def test_decayed_without_half_life_is_counts(self):
+        self.counter.increment(np.array([2]), 3)
+
+        assert self.counter.decayed()[2] == 3.0
+
+    def test_decayed_counts_halve_every_half_life(self):
+        counter = ReturnedCounter(4, half_life=10)
+        counter.increment(np.array([1]), 8)
+        counter._decay_start -= 10
+
+        assert counter[1] == 8
+        assert abs(counter.decayed([1])[0] - 4) < 0.01
+
+        counter.increment(np.array([1]), 4)
+
+        assert abs(counter.decayed([1])[0] - 8) < 0.01
+
+    def test_decayed_counts_rescale(self):
+        counter = ReturnedCounter(4, half_life=1)
+        counter.increment(np.array([0]), 2)
+        counter._decay_start -= 1000
+        counter.increment(np.array([0]))
+
+        assert np.isfinite(counter.weighted).all()
+        assert abs(counter.decayed([0])[0] - 1) < 0.01
+
+    def test_grow_keeps_counts(self):
+        self.counter.increment(np.array([4]))
+        self.counter.grow(12)
+        self.counter.increment(np.array([4, 11]))
+
+        assert list(self.counter.snapshot()) == [0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 1]
+
+    def test_move(self):
+        self.counter.increment(np.array([1, 2]), np.array([3, 1]))
+        self.counter.grow(11)
+        self.counter.move(np.array([1]), np.array([10]))
+
+        assert list(self.counter.snapshot()) == [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 3]
+
+    def test_compacted(self):
+        self.counter.increment(np.arange(5), np.arange(5))
+        compacted = self.counter.compacted(np.array([1, 3, 4]))
+
+        assert list(compacted.snapshot()) == [1, 3, 4]
+
+    def test_concurrent_increments_are_exact(self):
+        counter = ReturnedCounter(1000)
+        rows = np.arange(1000)
+
+        def work():
+            for _ in range(200):
+                counter.increment(rows)
+                counter.increment(rows[::7])
+
+        threads = [Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = np.full(1000, 1600)
+        expected[::7] += 1600
+        assert (counter.snapshot() == expected).all()
+
+
+def increment_in_other_process(path):
+    counter = PersistentReturnedCounter(10, path, flush_interval=0)
+    for _ in range(50):
+        counter.increment(np.arange(10))
+    counter.close()
+
+class PersistentReturnedCounterTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "returned_counts.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_increments_wait_for_flush(self):
+        counter = PersistentReturnedCounter(10, self.path, flush_interval=60)
+        counter.increment(np.array([1, 2]))
+
+        assert list(counter[[1, 2]]) == [1, 1]
+        assert (counter.shared == 0).all()
+
+        counter.flush()
+
+        assert list(counter.shared[[1, 2]]) == [1, 1]
+        assert list(counter[[1, 2]]) == [1, 1]
+        counter.close()
+
+    def test_counts_survive_reopen(self):
+        counter = PersistentReturnedCounter(10, self.path, flush_interval=60)
+        counter.increment(np.array([3]), 4)
+        counter.close()
+
+        reopened = PersistentReturnedCounter(10, self.path)
+
+        assert reopened.snapshot()[3] == 4
+        reopened.close()
+
+    def test_file_grows_with_more_providers(self):
+        PersistentReturnedCounter(10, self.path).increment(np.array([9])).close()
+        counter = PersistentReturnedCounter(20, self.path)
+
+        assert counter.snapshot()[9] == 1
+        assert counter.snapshot()[19] == 0
+        counter.close()
+
+    def test_grow_and_move_in_file(self):
+        counter = PersistentReturnedCounter(4, self.path, flush_interval=0)
+        other = PersistentReturnedCounter(4, self.path, flush_interval=0)
+        counter.increment(np.array([1]), 5)
+
+        # every process makes the same change, the counts only move once
+        for process_counter in (counter, other):
+            process_counter.grow(6)
+            process_counter.move(np.array([1]), np.array([5]))
+
+        assert list(counter.snapshot()) == [0, 0, 0, 0, 0, 5]
+        assert list(other.snapshot()) == [0, 0, 0, 0, 0, 5]
+        counter.close()
+        other.close()
+
+    def test_compacted_into_next_generation(self):
+        counter = PersistentReturnedCounter(4, self.path, flush_interval=0)
+        other = PersistentReturnedCounter(4, self.path, flush_interval=60)
+        counter.increment(np.arange(4), np.array([1, 2, 3, 4]))
+        other.increment(np.array([3]))
+
+        compacted = counter.compacted(np.array([0, 3]))
+        other_compacted = other.compacted(np.array([0, 3]))
+
+        assert compacted.path == f"{self.path}.1"
+        assert list(compacted.snapshot()) == [1, 4]
+        # unflushed increments of a process are carried over
+        assert list(other_compacted.snapshot()) == [1, 5]
+        compacted.close()
+        other_compacted.close()
+
+    def test_reset_clears_file(self):
+        counter = PersistentReturnedCounter(10, self.path, flush_interval=0)
+        counter.increment(np.arange(10))
+        counter.reset()
+
+        assert (counter.snapshot() == 0).all()
+        assert (PersistentReturnedCounter(10, self.path).snapshot() == 0).all()
+
+    def test_shared_between_processes(self):
+        counter = PersistentReturnedCounter(10, self.path, flush_interval=0)
+        workers = [Process(target=increment_in_other_process, args=(self.path,))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        counter.increment(np.arange(10))
+
+        assert (counter.snapshot() == 201).all()
+        counter.close()
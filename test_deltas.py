@@ -0,0 +1,82 @@
+from deltas import DeltaFeed, DeltaWatcher
+from providers import ProviderList
+from constants import TEST_JSON
+from unittest import TestCase
+import json
+import os
+import tempfile
+
+class DeltaFeedTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "providers.deltas.ndjson")
+        self.feed = DeltaFeed(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text: str, mode="a"):
+        with open(self.path, mode) as delta_file:
+            delta_file.write(text)
+
+    def test_missing_file(self):
+        assert self.feed.read() == []
+
+    def test_reads_each_line_as_a_batch(self):
+        self.write(json.dumps({"op": "deactivate", "id": 1}) + "\n")
+        self.write(json.dumps([{"op": "deactivate", "id": 2}, {"op": "deactivate", "id": 3}]) + "\n")
+
+        assert self.feed.read() == [[{"op": "deactivate", "id": 1}],
+                                    [{"op": "deactivate", "id": 2}, {"op": "deactivate", "id": 3}]]
+        assert self.feed.read() == []
+
+    def test_partial_line_waits(self):
+        self.write('{"op": "deactivate",')
+        assert self.feed.read() == []
+
+        self.write(' "id": 1}\n')
+        assert self.feed.read() == [[{"op": "deactivate", "id": 1}]]
+
+    def test_bad_line_skipped(self):
+        self.write("not json\n" + json.dumps({"op": "deactivate", "id": 1}) + "\n")
+
+        with self.assertLogs("deltas", level="WARNING"):
+            assert self.feed.read() == [[{"op": "deactivate", "id": 1}]]
+
+    def test_replaced_file_read_from_start(self):
+        self.write(json.dumps({"op": "deactivate", "id": 1}) * 2 + "\n")
+        self.feed.read()
+        self.write(json.dumps({"op": "deactivate", "id": 2}) + "\n", mode="w")
+
+        assert self.feed.read() == [[{"op": "deactivate", "id": 2}]]
+
+class DeltaWatcherTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "providers.deltas.ndjson")
+        self.providers = ProviderList(TEST_JSON)
+        self.watcher = DeltaWatcher(self.providers, self.path, interval=60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_poll_applies_new_deltas(self):
+        with open(self.path, "w") as delta_file:
+            delta_file.write(json.dumps({"op": "update", "id": 2, "changes": {"rating": 7.5}}) + "\n")
+            delta_file.write(json.dumps({"op": "update", "id": 99, "changes": {}}) + "\n")
+
+        with self.assertLogs("deltas", level="WARNING") as logs:
+            assert self.watcher.poll() == 2
+        assert "skipped a batch of deltas" in logs.output[0]
+        assert [p["rating"] for p in self.providers.providers if p["id"] == 2] == [7.5]
+        assert self.watcher.poll() == 0
+
+    def test_start_and_stop(self):
+        with open(self.path, "w") as delta_file:
+            delta_file.write(json.dumps({"op": "deactivate", "id": 1}) + "\n")
+
+        self.watcher.start().stop()
+
+        assert len(self.providers.view().filter_active()) == 0
@@ -0,0 +1,90 @@
+from helpers import (build_filter_option_from_args, build_filter_option_from_json,
+                     build_filter_option_from_form)
+from unittest import TestCase
+from werkzeug.datastructures import MultiDict
+
+class FilterOptionFromArgsTest(TestCase):
+
+    def test_operators_and_values(self):
+        args = MultiDict([("id", "eq:3"),
+                          ("rating", "gt:4.5"),
+                          ("birth_date", "before:1990-01-01"),
+                          ("country", "peru")])
+
+        assert build_filter_option_from_args(args) == {"id": ("eq", 3),
+                                                       "rating": ("gt", 4.5),
+                                                       "birth_date": ("before", "1990-01-01"),
+                                                       "country": "peru"}
+
+    def test_between_ranges(self):
+        args = MultiDict([("rating", "between:3,7"), ("birth_date", "between:1980-01-01,1990-01-01")])
+
+        assert build_filter_option_from_args(args) == {
+            "rating": ("between", (3.0, 7.0)),
+            "birth_date": ("between", ("1980-01-01", "1990-01-01"))}
+
+    def test_skills_comma_separated_or_repeated(self):
+        args = MultiDict([("primary_skills", "Java, SQL"), ("primary_skills", "Go")])
+
+        assert build_filter_option_from_args(args) == {"primary_skills": ["Java", "SQL", "Go"]}
+
+    def test_active_and_other_params(self):
+        args = MultiDict([("active", "False"), ("limit", "10"), ("sex", "")])
+
+        assert build_filter_option_from_args(args) == {"active": False}
+
+    def test_bad_values(self):
+        for args in ({"rating": "about:4"}, {"id": "eq:one"}, {"active": "yes"},
+                     {"birth_date": "before:someday"}, {"rating": "between:3"}):
+            with self.assertRaises(ValueError):
+                build_filter_option_from_args(MultiDict(args))
+
+class FilterOptionFromFormTest(TestCase):
+
+    def test_between_ranges(self):
+        form = MultiDict([("id_option", "between"), ("id_val", "3,7"),
+                          ("date_option", "between"), ("date_val", "1980-01-01, 1990-01-01"),
+                          ("rating_option", "gt"), ("rating_val", "4.5"), ("sex", "")])
+
+        assert build_filter_option_from_form(form) == {
+            "id": ("between", (3, 7)),
+            "birth_date": ("between", ("1980-01-01", "1990-01-01")),
+            "rating": ("gt", 4.5)}
+
+    def test_bad_values(self):
+        for form in ({"id_option": "between", "id_val": "3"},
+                     {"rating_option": "between", "rating_val": "1,2,3"},
+                     {"date_option": "between", "date_val": "1980-01-01"},
+                     {"date_option": "before", "date_val": "someday"},
+                     {"rating_option": "about", "rating_val": "4"}):
+            with self.assertRaises(ValueError):
+                build_filter_option_from_form(MultiDict(form))
+
+class FilterOptionFromJsonTest(TestCase):
+
+    def test_operators_and_values(self):
+        body = {"rating": ["lt", 3], "sex": "Male", "secondary_skills": ["Go"], "active": True}
+
+        assert build_filter_option_from_json(body) == {"rating": ("lt", 3.0),
+                                                       "sex": "Male",
+                                                       "secondary_skills": ["Go"],
+                                                       "active": True}
+
+    def test_bad_filters(self):
+        for body in ({"salary": 10}, {"rating": 5}, {"rating": ["gt"]}, {"active": "true"},
+                     {"primary_skills": "Java"}, {"country": 3}, ["rating"], {"id": ["eq", 4.7]}):
+            with self.assertRaises(ValueError):
+                build_filter_option_from_json(body)
+
+    def test_whole_number_ids(self):
+        assert build_filter_option_from_json({"id": ["between", [2.0, 5]]}) == {"id": ("between", (2, 5))}
+
+    def test_messages_say_what_is_wrong(self):
+        for (body, message) in (({"id": ["eq", 4.7]}, "id should be compared to a whole number"),
+                                ({"rating": ["gt"]}, "rating should be given an operator and a value"),
+                                ({"rating": ["gt", "high"]}, "rating should be compared to a number"),
+                                ({"birth_date": ["at", "someday"]},
+                                 "birth_date should be compared to a YYYY-MM-DD date, not 'someday'")):
+            with self.assertRaises(ValueError) as raised:
+                build_filter_option_from_json(body)
+            assert str(raised.exception) == message
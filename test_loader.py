@@ -0,0 +1,86 @@
+from loader import ColumnBuilder, LoadReport, iter_chunks, iter_json_array, load_providers
+from providers import ProviderList
+from constants import TEST_JSON
+from unittest import TestCase
+import io
+import json
+import os
+import tempfile
+import pandas as pd
+
+class IterJsonArrayTest(TestCase):
+
+    def setUp(self):
+        with open(TEST_JSON) as json_file:
+            self.source = json.load(json_file)
+
+    def test_same_providers_as_json_load(self):
+        with open(TEST_JSON) as json_file:
+            assert list(iter_json_array(json_file)) == self.source
+
+    def test_providers_cut_across_reads(self):
+        # reads far smaller than one provider make every provider span several reads
+        json_file = io.StringIO(json.dumps(self.source, indent=2))
+        assert list(iter_json_array(json_file, read_size=7)) == self.source
+
+    def test_empty_array(self):
+        assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"id": 1}')))
+
+class LoadProvidersTest(TestCase):
+
+    def setUp(self):
+        (self.source, expected) = ProviderList.get_providers(TEST_JSON)
+        self.expected = expected.drop(columns="returned")
+
+        handle, self.ndjson = tempfile.mkstemp(suffix=".ndjson")
+        with os.fdopen(handle, "w") as ndjson_file:
+            for provider in self.source:
+                ndjson_file.write(json.dumps(provider) + "\n")
+
+    def tearDown(self):
+        os.remove(self.ndjson)
+
+    def test_json_array_same_as_get_providers(self):
+        (df, _) = load_providers(TEST_JSON)
+        pd.testing.assert_frame_equal(df, self.expected)
+
+    def test_ndjson_same_as_get_providers(self):
+        (df, _) = load_providers(self.ndjson)
+        pd.testing.assert_frame_equal(df, self.expected)
+
+    def test_chunks_same_as_one_chunk(self):
+        (df, report) = load_providers(TEST_JSON, chunk_size=1)
+        pd.testing.assert_frame_equal(df, self.expected)
+        assert report.chunks == len(self.source)
+
+    def test_iter_chunks_sizes(self):
+        sizes = [len(chunk) for chunk in iter_chunks(self.ndjson, chunk_size=2)]
+        assert sizes == [2, 1]
+
+    def test_load_report(self):
+        (_, report) = load_providers(TEST_JSON)
+        assert isinstance(report, LoadReport)
+        assert report.rows == len(self.source)
+        assert report.chunks == 1
+        assert report.seconds >= 0
+        assert report.peak_rss > 0
+
+    def test_provider_list_keeps_load_report(self):
+        providers = ProviderList(self.ndjson)
+        assert providers.load_report.rows == len(providers)
+        assert providers.providers == self.source
+
+class ColumnBuilderTest(TestCase):
+
+    def test_categories_sorted_across_chunks(self):
+        builder = ColumnBuilder()
+        builder.add([{"country": "Peru"}, {"country": None}])
+        builder.add([{"country": "Chile"}, {"country": "Peru"}])
+        country = builder.frame()["country"]
+
+        assert list(country.cat.categories) == ["Chile", "Peru"]
+        assert list(country.cat.codes) == [1, -1, 0, 1]
@@ -0,0 +1,88 @@
+from metrics import Registry, REGISTRY, CACHE_LOOKUPS, FILTER_SECONDS, PREDICATE_SECONDS
+from providers import ProviderList
+from constants import TEST_JSON
+from unittest import TestCase
+import threading
+
+class RegistryTest(TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_summed_across_threads(self):
+        counter = self.registry.counter("test_total", "A test counter", ("kind",))
+
+        def record():
+            for _ in range(1000):
+                counter.inc(labels=("a",))
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(2, ("b",))
+
+        assert counter.value(("a",)) == 4000
+        assert self.registry.render().decode().splitlines() == [
+            "# HELP test_total A test counter",
+            "# TYPE test_total counter",
+            'test_total{kind="a"} 4000',
+            'test_total{kind="b"} 2',
+        ]
+
+    def test_finished_threads_folded(self):
+        counter = self.registry.counter("test_total", "A test counter")
+        histogram = self.registry.histogram("test_seconds", "A test histogram", buckets=(1,))
+
+        def record():
+            counter.inc()
+            histogram.observe(0.5)
+
+        for _ in range(200):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        record()
+
+        assert counter.value() == 201
+        assert histogram.count() == 201
+        # only the values of this thread are left apart from the finished total
+        assert len(counter._shards) == len(histogram._shards) == 1
+        assert 'test_seconds_bucket{le="1"} 201' in self.registry.render().decode()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("test_seconds", "A test histogram", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        assert histogram.count() == 4
+        assert self.registry.render().decode().splitlines()[2:] == [
+            'test_seconds_bucket{le="0.1"} 2',
+            'test_seconds_bucket{le="1"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            "test_seconds_sum 3.65",
+            "test_seconds_count 4",
+        ]
+
+    def test_label_values_escaped(self):
+        gauge = self.registry.gauge("test_value", "A test gauge", ("name",))
+        gauge.set(1.5, ('say "hi"\n',))
+
+        assert self.registry.render().decode().splitlines()[2] == 'test_value{name="say \\"hi\\"\\n"} 1.5'
+
+class ProviderMetricsTest(TestCase):
+
+    def test_filters_recorded(self):
+        providers = ProviderList(TEST_JSON)
+        filters = FILTER_SECONDS.count(("filter",))
+        ratings = PREDICATE_SECONDS.count(("rating", "scan"))
+        hits = CACHE_LOOKUPS.value(("hit",))
+
+        providers.view().filter({"rating": ("gt", 5)})
+        providers.view().filter({"rating": ("gt", 5)})
+
+        assert FILTER_SECONDS.count(("filter",)) == filters + 2
+        assert PREDICATE_SECONDS.count(("rating", "scan")) == ratings + 1
+        assert CACHE_LOOKUPS.value(("hit",)) == hits + 1
+        assert b"matching_returned_providers_total" in REGISTRY.render()
@@ -1,9 +1,14 @@
+import json
+import os
+import tempfile
 from providers import ProviderList
-from constants import TEST_JSON, TRAITS, DEFAULT_COLUMNS, DEFAULT_ORDER
+from skill_index import SkillIndex
+from constants import TEST_JSON, TRAITS, DEFAULT_COLUMNS, DEFAULT_ORDER, CATEGORY_TRAITS
 from unittest import TestCase
 from pandas.api.types import is_datetime64_any_dtype as is_datetime
+import numpy as np
 import pandas as pd
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 class GetProvidersStaticTest(TestCase):
 
@@ -25,11 +30,17 @@ class GetProvidersStaticTest(TestCase):
     def test_source_list_has_no_return_column(self):
         assert "returned" not in self.providers[0].keys()
 
+    def test_low_cardinality_columns_are_encoded(self):
+        for trait in CATEGORY_TRAITS:
+            assert self.df[trait].dtype == "category"
+
+        assert list(self.df["sex"]) == ["Male", "Female", "Female"]
+
 class GetskillsStaticTest(TestCase):
 
     def setUp(self):
         self.providers, self.df = ProviderList.get_providers(TEST_JSON)
-        self.primary_skills, self.secondary_skills = ProviderList.get_skills_dict(self.df)
+        self.primary_skills, self.secondary_skills = ProviderList.get_skills_index(self.df)
 
     def test_skills_in_dict_are_lowered(self):
         assert "testlowercase" in self.primary_skills
@@ -47,6 +58,33 @@ class GetskillsStaticTest(TestCase):
         assert 0 in test_primary_users
         assert 0 in test_secondary_users
 
+    def test_skill_positions_are_sorted_and_unique(self):
+        web_users = self.secondary_skills["web development"]
+
+        assert list(web_users) == sorted(set(web_users))
+
+    def test_skill_mask_any_and_all(self):
+        skills = ["test secondary skill", "Web Development"]
+
+        assert list(self.secondary_skills.mask(skills)) == [True, False, True]
+        assert list(self.secondary_skills.mask(skills, match_all=True)) == [True, False, False]
+
+    def test_skill_mask_unknown_skill(self):
+        assert not self.primary_skills.mask(["not a skill"]).any()
+        assert not self.primary_skills.mask(["test primary skill", "not a skill"],
+                                            match_all=True).any()
+
+    def test_skill_index_append(self):
+        added = [["Web Development", "new skill"], []]
+        (_, df) = ProviderList.get_providers(TEST_JSON)
+        whole = SkillIndex.from_column(list(df["secondary_skill"]) + added)
+        appended = self.secondary_skills.append(added)
+
+        assert appended.size == 5
+        assert sorted(appended) == sorted(whole)
+        for skill in whole:
+            assert list(appended[skill]) == list(whole[skill])
+
 class InitTest(TestCase):
     
     def test_init(self):
@@ -104,6 +142,30 @@ class ListMethodTest(TestCase):
         self.providers.df = self.providers.df.loc[self.providers.df['active']]
         assert len(self.providers.list()) == 1
 
+    def test_list_keeps_column_order(self):
+        provider = self.providers.list(with_returned=True)[0]
+
+        assert list(provider) == [*self.providers.providers[0], "returned"]
+
+    def test_list_formats_birth_date(self):
+        self.providers.sort_rating()
+
+        assert [provider["birth_date"] for provider in self.providers.list()] == \
+            ["1986-06-13", "1951-03-16", "1934-12-07"]
+
+    def test_list_page(self):
+        self.providers.sort(["id"], [True])
+
+        assert [provider["id"] for provider in self.providers.list(limit=2)] == [1, 2]
+        assert [provider["id"] for provider in self.providers.list(limit=2, offset=2)] == [3]
+        assert self.providers.list(limit=2, offset=3) == []
+
+    def test_to_json(self):
+        encoded = self.providers.to_json(limit=1, offset=1)
+
+        assert type(encoded) == bytes
+        assert json.loads(encoded) == self.providers.providers[1:2]
+
 class sortRatingTest(TestCase):
 
     def setUp(self):
@@ -140,6 +202,78 @@ class SortColTest(TestCase):
 
         assert test_id_list == list(self.providers.df["id"])
 
+class PersistentCounterTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "returned_counts.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_returned_survives_restart(self):
+        providers = ProviderList(TEST_JSON, counter_path=self.path)
+        providers.filter_active()
+        providers.counter.close()
+
+        restarted = ProviderList(TEST_JSON, counter_path=self.path)
+
+        assert list(restarted.returned) == [1, 0, 0]
+        restarted.counter.close()
+
+class RankTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+
+    def test_rank_same_as_default_sort(self):
+        self.providers.view().filter_by_sex("Female")
+        sorted_ids = list(self.providers.view().sort(DEFAULT_COLUMNS, DEFAULT_ORDER).df["id"])
+
+        assert list(self.providers.view().rank().df["id"]) == sorted_ids == [1, 3, 2]
+
+    def test_rank_filtered_view(self):
+        self.providers.view().filter_by_num("id", "eq", 3)
+        self.providers.filter_by_sex("Female").rank()
+
+        assert list(self.providers.df["id"]) == [2, 3]
+
+    def test_rank_limit_keeps_every_row(self):
+        self.providers.filter_by_num("id", "gt", 0).rank(limit=1)
+
+        assert len(self.providers) == 3
+        assert self.providers.df["id"].values[0] == 3
+
+class RankByScoreTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+
+    def test_default_scorer_without_returns_is_by_rating(self):
+        self.providers.rank_by_score()
+
+        assert list(self.providers.df["id"]) == [3, 2, 1]
+
+    def test_returned_moves_providers_down(self):
+        self.providers.view().filter_by_num("id", "eq", 3)
+        self.providers.rank_by_score()
+
+        assert list(self.providers.df["id"]) == [2, 1, 3]
+
+    def test_custom_scorer(self):
+        self.providers.rank_by_score(lambda rating, returned: -rating)
+
+        assert list(self.providers.df["id"]) == [1, 2, 3]
+
+    def test_decayed_returned_is_used(self):
+        providers = ProviderList(TEST_JSON, half_life=60)
+        providers.view().filter_by_num("id", "eq", 3)
+        providers.counter._decay_start -= 60 * 50
+        providers.scorer = lambda rating, returned: -returned
+
+        assert providers.counter.decayed()[2] < 1e-9
+        assert list(providers.rank_by_score().df["id"]) == [1, 2, 3]
+
 class ResetTest(TestCase):
 
     def setUp(self):
@@ -173,6 +307,56 @@ class ResetTest(TestCase):
         assert all(self.providers.returned == 0)
         assert all(self.providers.df["returned"] == 0)
 
+class ViewTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+
+    def test_view_does_not_change_source(self):
+        view = self.providers.view().filter_active().sort_rating()
+
+        assert len(view) == 1
+        assert len(self.providers) == 3
+        assert list(self.providers.df["id"]) == [1, 2, 3]
+
+    def test_view_starts_from_current_rows(self):
+        self.providers.filter_by_sex("Female")
+        view = self.providers.view().reset()
+
+        assert len(self.providers.view()) == 2
+        assert len(view) == 3
+
+    def test_views_share_returned_counter(self):
+        self.providers.view().filter_active()
+        self.providers.view().filter_by_sex("Male")
+
+        assert list(self.providers.returned) == [2, 0, 0]
+        assert list(self.providers.df["returned"]) == [2, 0, 0]
+
+    def test_store_is_read_only(self):
+        ratings = self.providers.store.column("rating")
+
+        self.assertRaises(ValueError, ratings.__setitem__, 0, 10.0)
+
+    def test_store_memory_usage(self):
+        usage = self.providers.store.memory_usage()
+
+        assert set(usage) == set(TRAITS)
+        assert all(size > 0 for size in usage.values())
+
+    def test_sort_encoded_column(self):
+        self.providers.sort(["company", "id"], [False, True])
+
+        assert list(self.providers.df["company"]) == \
+            ["Treutel and Sons", "Test_Company", "Stanton-Williamson"]
+
+    def test_reset_does_not_rebuild_store(self):
+        store = self.providers.store
+        self.providers.filter_active().reset()
+
+        assert self.providers.store is store
+        assert self.providers._rows is store.all_rows
+
 class FilterStrTest(TestCase):
     
     def setUp(self):
@@ -196,6 +380,16 @@ class FilterStrTest(TestCase):
         assert len(self.providers.df) == 2
         assert "test_first_name" not in self.providers.df["first_name"].values
 
+    def test_str_filter_ignores_case(self):
+        self.providers.filter_by_str("country","CHINA")
+
+        assert list(self.providers.df["id"]) == [2, 3]
+
+    def test_str_filter_is_not_a_regex(self):
+        self.providers.filter_by_str("last_name","Sol.eme")
+
+        assert len(self.providers.df) == 0
+
     def test_str_filter_increment_return(self):
         self.providers.filter_by_str("first_name","test_first_name")
         test_series = pd.Series([1, 0, 0])
@@ -217,6 +411,17 @@ class FilterSexTest(TestCase):
 
         assert "Female" not in self.providers.df["sex"]
 
+    def test_sex_filter_compares_codes(self):
+        sex = self.providers.store.column("sex")
+        female = self.providers.store.code_of("sex", "Female")
+
+        assert list(self.providers._sex_mask("Female")) == list(sex.codes == female)
+
+    def test_sex_filter_unknown_sex(self):
+        self.providers.filter_by_sex("Unknown")
+
+        assert len(self.providers.df) == 0
+
     def test_sex_filter_increment_return(self):
         self.providers.filter_by_sex("Male")
         test_series = pd.Series([1, 0, 0])
@@ -251,6 +456,19 @@ class FilterDateTest(TestCase):
 
         assert len(self.providers.df) == 2
 
+    def test_date_filter_between(self):
+        self.providers.filter_by_date("between", ("1934-12-07", "1951-03-16"))
+
+        assert list(self.providers.df["first_name"]) == ["test_first_name", "Alethea"]
+
+    def test_date_filter_from_sorted_index(self):
+        expected = self.providers.view().filter_by_date("after", "1940").list()
+
+        with patch("providers.INDEX_FRACTION", 1.0):
+            from_index = self.providers.view().filter_by_date("after", "1940").list()
+
+        assert from_index == expected
+
     def test_date_filter_number_input_raises_err(self):
         self.assertRaises(TypeError, self.providers.filter_by_date, "before", 1960)
 
@@ -283,6 +501,21 @@ class FilterNumTest(TestCase):
         assert len(self.providers.df) == 1
         assert "test_first_name" in self.providers.df["first_name"].values
 
+    def test_num_filter_between(self):
+        self.providers.filter_by_num("rating", "between", (3.6, 7.9))
+
+        assert list(self.providers.df["first_name"]) == ["test_first_name", "Alethea"]
+
+    def test_num_filter_from_sorted_index(self):
+        sorted_view = self.providers.view().sort(["rating"], [False])
+
+        with patch("providers.INDEX_FRACTION", 1.0):
+            sorted_view.filter_by_num("id", "gt", 1)
+            self.providers.filter_by_num("id", "between", (2, 3))
+
+        assert list(sorted_view.df["id"]) == [3, 2]
+        assert list(self.providers.df["id"]) == [2, 3]
+
     def test_num_filter_increment_return(self):
         self.providers.filter_by_num("id", "eq", 1)
         test_series = pd.Series([1, 0, 0])
@@ -328,7 +561,18 @@ class FilterSkillsTest(TestCase):
         assert len(self.providers.df) == 2
         assert "test_first_name" in self.providers.df["first_name"].values
         assert "Hettie" in self.providers.df["first_name"].values
-        
+
+    def test_skill_filter_match_all(self):
+        skills = ["test secondary skill", "web development"]
+        self.providers.filter_by_skills(skills, primary=False, match_all=True)
+
+        assert list(self.providers.df["id"]) == [1]
+
+    def test_skill_filter_keeps_current_order(self):
+        self.providers.sort_rating()
+        self.providers.filter_by_skills(["test secondary skill"], primary=False)
+
+        assert list(self.providers.df["id"]) == [3, 1]
 
     def test_skill_filter_increment_return(self):
         self.providers.filter_by_skills(["test primary skill"], primary=True)
@@ -351,14 +595,15 @@ class FilterCombinationTest(TestCase):
         assert "Hettie" in self.providers.df["first_name"].values
 
     def test_multi_filter_calls_other_methods(self):
-        self.providers.filter_by_sex = MagicMock(return_value = self)
-        self.providers.filter_by_skills = MagicMock(return_value = self)
-        self.providers.filter_active = MagicMock(return_value = self)
+        all_rows = np.ones(3, dtype=bool)
+        self.providers._sex_mask = MagicMock(return_value = all_rows.copy())
+        self.providers._skills_mask = MagicMock(return_value = all_rows.copy())
+        self.providers._active_mask = MagicMock(return_value = all_rows.copy())
         self.providers.filter(self.options)
 
-        self.providers.filter_by_sex.assert_called()
-        self.providers.filter_by_skills.assert_called()
-        self.providers.filter_active.assert_not_called()
+        self.providers._sex_mask.assert_called()
+        self.providers._skills_mask.assert_called()
+        self.providers._active_mask.assert_not_called()
 
     def test_multi_filter_nonexistant_trait(self):
         nonexistant_trait = { "test": "value"}
@@ -374,6 +619,427 @@ class FilterCombinationTest(TestCase):
             "primary_skills": ["test primary skill"]
         }
         self.providers.filter(options)
-        test_series = pd.Series([3, 0, 0])
+        test_series = pd.Series([1, 0, 0])
+
+        assert all(self.providers.returned == test_series)
+
+    def test_multi_filter_without_counting_returned(self):
+        options = {"id": ("eq", 1), "first_name": "test_first_name"}
+        self.providers.view().filter(options, count_returned=False)
+        self.providers.view().filter(options)
+        self.providers.view().filter(options, count_returned=False)
+
+        assert list(self.providers.returned) == [1, 0, 0]
+
+    def test_multi_filter_same_as_chained_filters(self):
+        options = {
+            "rating": ("gt", 5),
+            "last_name": "Solleme",
+            "birth_date": ("before", "1990-01-01"),
+            "secondary_skills": ["Continuous Integration", "Linux / Unix"]
+        }
+        chained = ProviderList(TEST_JSON)
+        chained.filter_by_num("rating", "gt", 5) \
+            .filter_by_str("last_name", "Solleme") \
+            .filter_by_date("before", "1990-01-01") \
+            .filter_by_skills(["Continuous Integration", "Linux / Unix"], primary=False)
+        self.providers.filter(options)
+
+        assert list(self.providers.df["id"]) == list(chained.df["id"]) == [2, 3]
+
+    def test_multi_filter_stops_when_empty(self):
+        options = {
+            "birth_date": ("at", "2000-01-01"),
+            "sex": "Female"
+        }
+        self.providers._sex_mask = MagicMock(return_value = np.ones(3, dtype=bool))
+        self.providers.filter(options)
+
+        self.providers._sex_mask.assert_not_called()
+        assert len(self.providers.df) == 0
+
+class QueryPlanTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+
+    def test_plan_orders_by_selectivity(self):
+        options = {
+            "rating": ("gt", 5),
+            "first_name": "test",
+            "birth_date": ("at", "1950-01-01")
+        }
+        plan = self.providers.plan(options)
+
+        assert [predicate.trait for predicate in plan] == ["birth_date", "first_name", "rating"]
+
+    def test_plan_counts_range_matches(self):
+        plan = self.providers.plan({"rating": ("between", (3.6, 7.9))})
+
+        assert abs(plan.predicates[0].selectivity - 2 / 3) < 1e-9
+
+    def test_plan_counts_string_matches(self):
+        plan = self.providers.plan({"last_name": "solleme"})
+
+        assert abs(plan.predicates[0].selectivity - 2 / 3) < 1e-9
+
+    def test_plan_skips_unused_traits_and_operators(self):
+        options = {
+            "test": "value",
+            "rating": ("about", 5),
+            "birth_date": ("around", "1990-01-01")
+        }
+
+        assert len(self.providers.plan(options)) == 0
+
+class ExplainTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.options = {"rating": ("gt", 5), "sex": "Female", "primary_skills": ["no such skill"]}
+
+    def test_stages_in_plan_order(self):
+        view = self.providers.view()
+        explanation = view.explain({"rating": ("gt", 5), "first_name": "test"}, trace_allocations=True)
+        stages = explanation.stages
+
+        assert [stage.trait for stage in stages] == ["first_name", "rating"]
+        assert [stage.access for stage in stages] == ["vocabulary scan", "scan"]
+        assert [(stage.rows_in, stage.matched, stage.rows_out) for stage in stages] == [(3, 1, 1), (1, 2, 0)]
+        assert explanation.rows_in == 3 and explanation.rows_out == len(view) == 0
+        assert all(stage.allocated is not None for stage in stages)
+
+    def test_same_rows_and_counts_as_filter(self):
+        view = self.providers.view()
+        explanation = view.explain({"rating": ("gt", 5)})
+
+        assert list(view._rows) == list(ProviderList(TEST_JSON).filter({"rating": ("gt", 5)})._rows)
+        assert list(self.providers.returned) == [0, 1, 1]
+        # allocations are only traced when asked for
+        assert all(stage.allocated is None for stage in explanation.stages)
+
+    def test_sorted_index_chosen_for_narrow_ranges(self):
+        with patch("providers.INDEX_FRACTION", 1.0):
+            explanation = self.providers.view().explain({"id": ("eq", 2)})
+
+        assert explanation.stages[0].access == "sorted index"
+
+    def test_warnings_collected(self):
+        explanation = self.providers.view().explain(self.options)
+
+        assert explanation.warnings == ["no such skill is not in list of primary skills"]
+        # warnings of one explanation do not leak into later filters
+        assert self.providers._warnings is None
+
+    def test_cache_hits_reported(self):
+        self.providers.view().filter(self.options)
+        explanation = self.providers.view().explain(self.options)
+
+        assert explanation.cached
+        assert explanation.stages == []
+        assert explanation.to_dict()["rows_out"] == 0
+
+class MatchTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.skills = ["html", "Secure Coding Practices", "embedded systems"]
+
+    def test_partial_matches_most_relevant_first(self):
+        assert len(self.providers.view().filter({"primary_skills": self.skills,
+                                                 "rating": ("gt", 8.5)})) == 0
+
+        view = self.providers.view().match({"primary_skills": self.skills, "rating": ("gt", 8.5)})
+
+        assert [p["id"] for p in view.list()] == [3, 2, 1]
+
+    def test_providers_matching_nothing_left_out(self):
+        view = self.providers.view().match({"primary_skills": self.skills})
+
+        assert [p["id"] for p in view.list()] == [3, 1]
+        assert list(self.providers.returned) == [1, 0, 1]
+
+    def test_other_traits_still_met(self):
+        view = self.providers.view().match({"primary_skills": self.skills, "sex": "Female"},
+                                           count_returned=False)
+
+        assert [p["id"] for p in view.list()] == [3]
+        assert list(self.providers.returned) == [0, 0, 0]
+
+    def test_ranking_orders_equal_relevance(self):
+        self.providers.counter.increment(np.array([2]), 5)
+        view = self.providers.view().match({"primary_skills": ["html", "Secure Coding Practices"]},
+                                           limit=1)
+
+        # both have one of the skills, the one returned less often comes first
+        assert view.list(limit=1)[0]["id"] == 1
+
+class SimilarTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+
+    def test_similar_to_skills(self):
+        view = self.providers.view().similar_to_skills(["Unix"])
+
+        # provider 2 has "Linux / Unix" as a secondary skill and no skill is exactly "unix"
+        assert len(self.providers.view().filter_by_skills(["Unix"], primary=False)) == 0
+        assert [p["id"] for p in view.list()] == [2]
+        assert list(self.providers.returned) == [0, 1, 0]
+
+    def test_similar_to_provider(self):
+        view = self.providers.view().similar_to_provider(1, count_returned=False)
+
+        assert [p["id"] for p in view.list()] == [3, 2]
+        with self.assertRaises(KeyError):
+            self.providers.view().similar_to_provider(99)
+
+    def test_narrowed_views_and_cache(self):
+        view = self.providers.view().filter_active(False).similar_to_skills(["test skill"], k=1)
+        similarity = self.providers.store.skill_similarity()
+
+        assert [p["id"] for p in view.list()] == [3]
+        assert len(similarity._cache) == 0
+
+        first = self.providers.view().similar_to_skills(["test skill"], k=1)
+        second = self.providers.view().similar_to_skills(["Skill TEST"], k=1)
+        assert [p["id"] for p in first.list()] == [p["id"] for p in second.list()] == [1]
+        assert similarity.hits == 1
+
+    def test_unknown_words_warned(self):
+        with self.assertLogs("providers") as logs:
+            view = self.providers.view().similar_to_skills(["cobol"])
+
+        assert len(view) == 0
+        assert logs.output == ["WARNING:providers:no provider has a skill with the word cobol"]
+
+class FacetsTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+
+    def test_counts_of_every_provider(self):
+        facets = self.providers.facets()
+
+        assert facets["sex"] == {"Female": 2, "Male": 1}
+        assert list(facets["country"].items()) == [("China", 2), ("Test_country", 1)]
+        assert facets["secondary_skills"]["test secondary skill"] == 2
+        assert len(facets["primary_skills"]) == 7
+
+    def test_counts_of_filtered_view(self):
+        view = self.providers.view().filter({"rating": ("gt", 5)}, count_returned=False)
+        facets = view.facets()
+
+        assert facets["sex"] == {"Female": 2}
+        assert facets["country"] == {"China": 2}
+        assert facets["primary_skills"] == {"computational logic": 1, "html": 1, "embedded systems": 1}
+        assert "test primary skill" not in facets["primary_skills"]
+
+    def test_same_counts_as_filtering_by_each_value(self):
+        view = self.providers.view().filter({"active": False}, count_returned=False)
+        facets = view.facets()
+
+        for (skill, count) in facets["secondary_skills"].items():
+            assert len(view.view().filter_by_skills([skill], primary=False)) == count
+        for (sex, count) in facets["sex"].items():
+            assert len(view.view().filter_by_sex(sex)) == count
+
+    def test_limit_and_tombstoned_providers(self):
+        self.providers.deactivate_provider(1)
+        self.providers.update_provider(2, {"country": "Peru"})
+        facets = self.providers.facets(limit=1)
+
+        assert facets["country"] == {"China": 1}
+        assert len(facets["primary_skills"]) == 1
+
+class FilterManyTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.queries = [
+            {"rating": ("gt", 3), "last_name": "solleme"},
+            {"rating": ("gt", 5), "last_name": "SOLLEME"},
+            {"birth_date": ("before", "1960-01-01"), "active": True},
+            {"birth_date": ("after", "1940-01-01")},
+            {"id": ("eq", 2)},
+            {},
+        ]
+
+    def test_same_as_filter_one_at_a_time(self):
+        expected = [[p["id"] for p in ProviderList(TEST_JSON).filter(traits).list()]
+                    for traits in self.queries]
+        results = self.providers.filter_many(self.queries)
+
+        assert [sorted(p["id"] for p in view.list()) for view in results] == \
+            [sorted(ids) for ids in expected]
+
+    def test_counts_returned_once_per_query(self):
+        single = ProviderList(TEST_JSON)
+        for traits in self.queries:
+            single.view().filter(traits)
+        self.providers.filter_many(self.queries)
+
+        assert list(self.providers.returned) == list(single.returned)
+
+    def test_results_ranked_by_counts_after_the_batch(self):
+        results = self.providers.filter_many(self.queries, limit=2)
+
+        # provider 1 came back from 1 query, 3 from 3 and 2 from 4
+        assert [p["id"] for p in results[5].list()] == [1, 3, 2]
+        assert [p["id"] for p in results[0].list()] == [3, 2]
+
+    def test_shared_predicates_evaluated_once(self):
+        self.providers._str_mask = MagicMock(return_value=np.ones(3, dtype=bool))
+        self.providers.filter_many(self.queries)
+
+        self.providers._str_mask.assert_called_once()
+
+    def test_served_from_and_added_to_cache(self):
+        self.providers.view().filter(self.queries[0])
+        self.providers.filter_many(self.queries)
+
+        assert self.providers.query_cache.hits == 1
+        assert len(self.providers.query_cache) == 5
+
+    def test_unused_operators_left_out(self):
+        results = self.providers.filter_many([{"rating": ("about", 5)}, {"test": "value"}])
+
+        assert [len(view) for view in results] == [3, 3]
+        assert list(self.providers.returned) == [0, 0, 0]
+
+class ChangeProvidersTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.new_provider = {**self.providers.providers[0],
+                             "id": 4,
+                             "first_name": "Zelda",
+                             "primary_skills": ["Rust"],
+                             "company": "New Company"}
+
+    def test_add_providers(self):
+        self.providers.add_providers([self.new_provider])
+
+        assert len(self.providers) == 4
+        assert self.providers.providers[-1] == self.new_provider
+        assert len(self.providers.counter) == 4
+
+    def test_added_providers_are_indexed(self):
+        self.providers.add_providers([self.new_provider])
+
+        assert [p["id"] for p in self.providers.view().filter_by_skills(["rust"]).list()] == [4]
+        assert [p["id"] for p in self.providers.view().filter_by_str("first_name", "zel").list()] == [4]
+        assert [p["id"] for p in self.providers.view().filter_by_str("company", "new co").list()] == [4]
+
+    def test_add_taken_id(self):
+        with self.assertRaises(ValueError):
+            self.providers.add_providers([{**self.new_provider, "id": 1}])
+
+    def test_add_missing_trait(self):
+        provider = dict(self.new_provider)
+        del provider["rating"]
+
+        with self.assertRaises(ValueError):
+            self.providers.add_providers([provider])
+
+    def test_update_provider_keeps_returned(self):
+        self.providers.view().filter_by_num("id", "eq", 2)
+        self.providers.update_provider(2, {"rating": 9.5})
+
+        assert self.providers.store.tombstones == 1
+        updated = [p for p in self.providers.list(with_returned=True) if p["id"] == 2]
+        assert len(updated) == 1
+        assert updated[0]["rating"] == 9.5
+        assert updated[0]["returned"] == 1
+        assert len(self.providers) == 3
+
+    def test_update_unknown_provider(self):
+        with self.assertRaises(KeyError):
+            self.providers.update_provider(99, {"rating": 1.0})
+
+    def test_deactivate_provider(self):
+        self.providers.deactivate_provider(1)
+
+        assert len(self.providers.view().filter_active()) == 0
+
+    def test_views_taken_before_a_change_are_unchanged(self):
+        view = self.providers.view()
+        self.providers.add_providers([self.new_provider])
+
+        assert len(view) == 3
+        assert len(view.view().reset()) == 3
+
+    def test_compacts_when_enough_is_tombstoned(self):
+        self.providers.view().filter_by_num("id", "eq", 3)
+        self.providers.update_provider(2, {"rating": 1.0})
+        self.providers.update_provider(3, {"rating": 2.0})
+
+        assert self.providers.store.tombstones == 0
+        assert self.providers.store.size == 3
+        assert [p["id"] for p in self.providers.providers] == [1, 2, 3]
+        assert list(self.providers.returned) == [0, 0, 1]
+
+    def test_apply_deltas_batch(self):
+        self.providers.apply_deltas([
+            {"op": "upsert", "provider": self.new_provider},
+            {"op": "update", "id": 4, "changes": {"rating": 8.0}},
+            {"op": "deactivate", "id": 4},
+        ])
+
+        assert self.providers.store.tombstones == 0
+        added = self.providers.providers[-1]
+        assert (added["id"], added["rating"], added["active"]) == (4, 8.0, False)
+
+    def test_apply_unknown_delta(self):
+        with self.assertRaises(ValueError):
+            self.providers.apply_deltas([{"op": "delete", "id": 1}])
+
+    def test_snapshot_of_changed_providers(self):
+        self.providers.update_provider(2, {"rating": 9.5})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "providers.snapshot")
+            self.providers.save_snapshot(path)
+            loaded = ProviderList.load_snapshot(path)
+            loaded.add_providers([self.new_provider])
+
+            assert loaded.providers == self.providers.add_providers([self.new_provider]).providers
+
+class FilterCacheTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.options = {"first_name": "test", "rating": ("gt", 1)}
+
+    def test_repeated_filter_hits_cache(self):
+        first = self.providers.view().filter(self.options)
+        second = self.providers.view().filter({"rating": ("gt", 1.0), "first_name": "TEST"})
+
+        assert self.providers.query_cache.hits == 1
+        assert list(first._rows) == list(second._rows)
+        assert list(self.providers.returned) == [2, 0, 0]
+
+    def test_cached_results_ranked_again(self):
+        options = {"rating": ("gt", 0)}
+        first = self.providers.view().filter(options).rank().list()
+        second = self.providers.view().filter(options).rank().list()
+
+        assert self.providers.query_cache.hits == 1
+        # every provider came back once, so they are ranked by rating alone both times
+        assert [p["id"] for p in second] == [p["id"] for p in first]
+
+        self.providers.counter.increment(np.array([0, 1]))
+        third = self.providers.view().filter(options).rank().list()
+        assert third[0]["id"] == 3
+
+    def test_narrowed_views_are_not_cached(self):
+        self.providers.view().filter_active().filter(self.options)
+
+        assert len(self.providers.query_cache) == 0
+
+    def test_changed_providers_are_not_served_from_cache(self):
+        self.providers.view().filter(self.options)
+        self.providers.add_providers([{**self.providers.providers[0], "id": 4}])
 
-        assert all(self.providers.returned == test_series)
\ No newline at end of file
+        assert len(self.providers.view().filter(self.options)) == 2
+        assert self.providers.query_cache.hits == 0
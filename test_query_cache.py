@@ -0,0 +1,80 @@
+from query_cache import QueryCache, canonical_filter
+from unittest import TestCase
+import numpy as np
+
+class CanonicalFilterTest(TestCase):
+
+    def test_same_filter_same_key(self):
+        first = canonical_filter({
+            "primary_skills": ["Java", "sql", "java"],
+            "country": "Peru",
+            "birth_date": ("before", "1990-1-5"),
+            "rating": ("gt", 5),
+        })
+        second = canonical_filter({
+            "rating": ["gt", 5.0],
+            "birth_date": ["before", "1990-01-05"],
+            "country": "peru",
+            "primary_skills": ["SQL", "Java"],
+        })
+
+        assert first is not None
+        assert first == second
+
+    def test_between_ranges(self):
+        assert canonical_filter({"rating": ("between", (3, 7))}) == \
+            canonical_filter({"rating": ["between", [3.0, 7.0]]})
+        assert canonical_filter({"birth_date": ("between", ("1990", "1991-1-1"))}) == \
+            (("birth_date", ("between", ("1990-01-01", "1991-01-01"))),)
+        assert canonical_filter({"rating": ("between", (3,))}) is None
+
+    def test_different_filters_different_keys(self):
+        assert canonical_filter({"sex": "Male"}) != canonical_filter({"sex": "male"})
+        assert canonical_filter({"rating": ("gt", 5)}) != canonical_filter({"rating": ("lt", 5)})
+
+    def test_unusable_values_have_no_key(self):
+        assert canonical_filter({"birth_date": ("at", 1990)}) is None
+        assert canonical_filter({"birth_date": ("at", "not a date")}) is None
+        assert canonical_filter({"rating": ("gt", "high")}) is None
+
+class QueryCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = QueryCache(max_entries=2, max_rows=10)
+
+    def test_get_what_was_put(self):
+        self.cache.put("a", 1, np.array([1, 2]))
+
+        assert list(self.cache.get("a", 1)) == [1, 2]
+        assert self.cache.get("b", 1) is None
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_cached_rows_are_read_only(self):
+        self.cache.put("a", 1, np.array([1, 2]))
+
+        assert not self.cache.get("a", 1).flags.writeable
+
+    def test_other_version_is_dropped(self):
+        self.cache.put("a", 1, np.array([1, 2]))
+
+        assert self.cache.get("a", 2) is None
+        assert len(self.cache) == 0
+
+    def test_least_recently_used_evicted(self):
+        self.cache.put("a", 1, np.array([1]))
+        self.cache.put("b", 1, np.array([2]))
+        self.cache.get("a", 1)
+        self.cache.put("c", 1, np.array([3]))
+
+        assert self.cache.get("b", 1) is None
+        assert self.cache.get("a", 1) is not None
+
+    def test_evicted_past_max_rows(self):
+        self.cache.put("a", 1, np.arange(6))
+        self.cache.put("b", 1, np.arange(6))
+
+        assert self.cache.get("a", 1) is None
+        assert len(self.cache) == 1
+
+        self.cache.put("c", 1, np.arange(11))
+        assert self.cache.get("c", 1) is None
@@ -0,0 +1,34 @@
+from range_index import SortedIndex
+from unittest import TestCase
+import numpy as np
+
+class SortedIndexTest(TestCase):
+
+    def setUp(self):
+        self.ratings = SortedIndex(np.array([3.5, np.nan, 7.0, 3.5, 9.1]))
+        self.dates = SortedIndex(np.array(["1990-05-01", "NaT", "1985-01-31", "1990-05-01"],
+                                          dtype="datetime64[ns]"))
+
+    def test_missing_values_left_out(self):
+        assert list(self.ratings.order) == [0, 3, 2, 4]
+        assert list(self.dates.order) == [2, 0, 3]
+
+    def test_numeric_operators(self):
+        assert list(self.ratings.positions("eq", 3.5)) == [0, 3]
+        assert list(self.ratings.positions("gt", 3.5)) == [2, 4]
+        assert list(self.ratings.positions("lt", 7.0)) == [0, 3]
+        assert list(self.ratings.positions("between", (3.5, 7.0))) == [0, 3, 2]
+        assert self.ratings.count("gt", 10) == 0
+
+    def test_date_operators_parse_strings(self):
+        assert list(self.dates.positions("at", "1990-05-01")) == [0, 3]
+        assert list(self.dates.positions("before", "1990")) == [2]
+        assert list(self.dates.positions("after", "1985-01-31")) == [0, 3]
+        assert list(self.dates.positions("between", ("1985", "1990-05-01"))) == [2, 0, 3]
+
+    def test_mask(self):
+        assert list(self.ratings.mask("gt", 5)) == [False, False, True, False, True]
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            self.ratings.bounds("about", 5)
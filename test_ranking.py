@@ -0,0 +1,61 @@
+from ranking import Ranker
+from counters import ReturnedCounter
+from unittest import TestCase
+import numpy as np
+
+class RankerTest(TestCase):
+
+    def setUp(self):
+        generator = np.random.default_rng(7)
+        self.rating = np.round(generator.uniform(0, 10, 500), 1)
+        self.returned = generator.integers(0, 4, 500)
+        self.rows = np.arange(500)
+        self.ranker = Ranker(self.rating)
+
+    def full_sort(self, rows):
+        return rows[np.lexsort((-self.rating[rows], self.returned[rows]))]
+
+    def test_full_ranking_is_stable_sort(self):
+        ranked = self.ranker.top_k(self.rows, self.returned)
+
+        assert (ranked == self.full_sort(self.rows)).all()
+
+    def test_top_k_matches_full_sort(self):
+        ranked = self.ranker.top_k(self.rows, self.returned, 25)
+
+        assert len(ranked) == 500
+        assert set(ranked) == set(self.rows)
+        assert (ranked[:25] == self.full_sort(self.rows)[:25]).all()
+
+    def test_top_k_of_subset(self):
+        rows = self.rows[self.rating > 5]
+        ranked = self.ranker.top_k(rows, self.returned[rows], 10)
+
+        assert (ranked[:10] == self.full_sort(rows)[:10]).all()
+
+    def test_ranked_all_is_cached_until_counter_changes(self):
+        counter = ReturnedCounter(500)
+        counter.increment(self.rows, self.returned)
+        ranked = self.ranker.ranked_all(counter)
+
+        assert (ranked == self.full_sort(self.rows)).all()
+        assert self.ranker.ranked_all(counter) is ranked
+
+        counter.increment(self.rows[::3])
+        self.returned[::3] += 1
+        reranked = self.ranker.ranked_all(counter)
+
+        assert reranked is not ranked
+        assert (reranked == self.full_sort(self.rows)).all()
+
+    def test_append_matches_ranker_of_all_ratings(self):
+        appended = Ranker(self.rating[:300]).append(self.rating)
+
+        assert (appended.rating_rank == self.ranker.rating_rank).all()
+
+    def test_ranked_all_leaves_out_dead_positions(self):
+        live = self.rating > 2
+        ranked = Ranker(self.rating, live=live).ranked_all(ReturnedCounter(500))
+
+        rows = self.rows[live]
+        assert (ranked == rows[np.lexsort((rows, -self.rating[rows]))]).all()
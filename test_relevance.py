@@ -0,0 +1,53 @@
+from relevance import SoftMatcher
+from providers import ProviderList
+from constants import TEST_JSON
+from unittest import TestCase
+import numpy as np
+
+class SoftMatcherTest(TestCase):
+
+    def setUp(self):
+        self.providers = ProviderList(TEST_JSON)
+        self.matcher = SoftMatcher()
+
+    def relevance(self, traits):
+        (scores, scored) = self.matcher.relevance(self.providers.view(), traits)
+        assert scored
+        return list(np.round(scores, 4))
+
+    def test_share_of_skills_matched(self):
+        traits = {"primary_skills": ["HTML", "Secure Coding Practices", "no such skill"]}
+
+        assert self.relevance(traits) == [0.3333, 0.0, 0.3333]
+
+    def test_secondary_skills(self):
+        # a primary skill asked for that is only a secondary skill gets part of its weight
+        assert self.relevance({"primary_skills": ["web development"]}) == [0.5, 0.0, 0.0]
+        # a secondary skill asked for counts in full and weighs half as much as a primary skill
+        traits = {"primary_skills": ["html"], "secondary_skills": ["test secondary skill"]}
+        assert self.relevance(traits) == [0.3333, 0.0, 1.0]
+
+    def test_rating_closeness(self):
+        assert self.relevance({"rating": ("gt", 8)}) == [0.0, 0.95, 1.0]
+        assert self.relevance({"rating": ("between", (3, 4))}) == [1.0, 0.0, 0.0]
+
+    def test_birth_date_closeness(self):
+        scores = self.relevance({"birth_date": ("before", "1950-01-01")})
+
+        assert scores[0] == 1.0
+        assert 0.7 < scores[1] < 0.8
+        assert scores[2] == 0.0
+
+    def test_weights_blended(self):
+        traits = {"primary_skills": ["html"], "rating": ("gt", 8)}
+
+        assert self.relevance(traits) == [0.0, 0.475, 1.0]
+        self.matcher.rating_weight = 0
+        assert self.relevance(traits) == [0.0, 0.0, 1.0]
+
+    def test_without_soft_traits(self):
+        (scores, scored) = self.matcher.relevance(self.providers.view(), {"sex": "Female"})
+
+        assert not scored
+        assert list(scores) == [0, 0, 0]
+        assert self.matcher.hard_traits({"sex": "Female", "rating": ("gt", 1)}) == {"sex": "Female"}
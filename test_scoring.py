@@ -0,0 +1,42 @@
+from scoring import BlendedScorer, top_scores
+from unittest import TestCase
+import numpy as np
+
+class BlendedScorerTest(TestCase):
+
+    def setUp(self):
+        self.rating = np.array([2.0, 8.0, 8.0, 5.0])
+        self.returned = np.array([0.0, 4.0, 0.0, 2.0])
+
+    def test_rating_only(self):
+        scores = BlendedScorer(returned_weight=0)(self.rating, self.returned)
+
+        assert list(scores) == [0.0, 1.0, 1.0, 0.5]
+
+    def test_returned_lowers_score(self):
+        scores = BlendedScorer()(self.rating, self.returned)
+
+        assert list(scores) == [0.0, 0.0, 1.0, 0.0]
+
+    def test_same_values_score_zero(self):
+        scores = BlendedScorer()(np.full(3, 5.0), np.zeros(3))
+
+        assert (scores == 0).all()
+
+    def test_no_candidates(self):
+        assert len(BlendedScorer()(np.zeros(0), np.zeros(0))) == 0
+
+class TopScoresTest(TestCase):
+
+    def test_orders_highest_first_keeping_ties(self):
+        scores = np.array([0.5, 1.0, 0.5, 0.2])
+
+        assert list(top_scores(scores)) == [1, 0, 2, 3]
+
+    def test_top_k(self):
+        generator = np.random.default_rng(3)
+        scores = np.round(generator.uniform(size=300), 2)
+        ordered = top_scores(scores, 20)
+
+        assert sorted(ordered) == list(range(300))
+        assert list(ordered[:20]) == list(np.argsort(-scores, kind="stable")[:20])
@@ -0,0 +1,86 @@
+from search_index import StringIndex, ngrams
+from unittest import TestCase
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+COLUMN = ["China", "Chile", "china", "Indonesia", "Chinatown", None]
+
+class NgramsTest(TestCase):
+
+    def test_ngrams(self):
+        assert ngrams("china") == {"chi", "hin", "ina"}
+        assert ngrams("ab") == set()
+
+class StringIndexTest(TestCase):
+
+    def setUp(self):
+        self.index = StringIndex.from_column(COLUMN)
+
+    def test_values_are_lowercased_and_shared(self):
+        assert self.index.vocabulary == ["china", "chile", "indonesia", "chinatown", ""]
+        assert list(self.index.codes) == [0, 1, 0, 2, 3, 4]
+
+    def test_low_cardinality_uses_exact_dictionary(self):
+        assert self.index.exact
+        assert not self.index.trigrams
+        assert sorted(self.index.exact["china"]) == [0, 3]
+
+    def test_mask_exact_value(self):
+        mask = self.index.mask("China", np.arange(6))
+
+        assert list(mask) == [True, False, True, False, True, False]
+
+    def test_mask_substring(self):
+        mask = self.index.mask("ne", np.array([5, 3, 0]))
+
+        assert list(mask) == [False, True, False]
+
+    def test_count(self):
+        assert self.index.count("CHI") == 4
+        assert self.index.count("peru") == 0
+
+class TrigramIndexTest(TestCase):
+
+    def setUp(self):
+        with patch("search_index.LOW_CARDINALITY", 2):
+            self.index = StringIndex.from_column(COLUMN)
+
+    def test_high_cardinality_uses_trigrams(self):
+        assert not self.index.exact
+        assert list(self.index.trigrams["hin"]) == [0, 3]
+
+    def test_trigram_search(self):
+        assert list(self.index.matching_codes("Chin")) == [0, 3]
+        assert list(self.index.matching_codes("town")) == [3]
+
+    def test_trigrams_out_of_order_do_not_match(self):
+        assert len(self.index.matching_codes("inachi")) == 0
+
+    def test_unknown_trigram(self):
+        assert len(self.index.matching_codes("xyz")) == 0
+
+    def test_short_values_scan(self):
+        assert list(self.index.matching_codes("le")) == [1]
+
+    def test_append_matches_index_of_whole_column(self):
+        added = ["Peru", "china", "Lima"]
+        with patch("search_index.LOW_CARDINALITY", 2):
+            appended = self.index.append(added)
+            whole = StringIndex.from_column(COLUMN + added)
+
+        assert appended.vocabulary == whole.vocabulary
+        assert list(appended.codes) == list(whole.codes)
+        for value in ("chi", "eru", "lim", "ina"):
+            assert list(appended.matching_codes(value)) == list(whole.matching_codes(value))
+
+    def test_categorical_reuses_previous_trigrams(self):
+        column = pd.Categorical(["China", "Chile", "Chinatown"])
+        with patch("search_index.LOW_CARDINALITY", 2):
+            previous = StringIndex.from_categorical(column)
+            extended = pd.Categorical(["Chad", "China"],
+                                      categories=["Chile", "China", "Chinatown", "Chad"])
+            index = StringIndex.from_categorical(extended, previous)
+
+        assert list(index.matching_codes("chi")) == [0, 1, 2]
+        assert list(index.matching_codes("had")) == [3]
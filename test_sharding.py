@@ -0,0 +1,49 @@
+from sharding import ShardedProviderList, write_shards
+from providers import ProviderList
+from constants import TEST_JSON
+from unittest import TestCase
+import os
+import tempfile
+
+class WriteShardsTest(TestCase):
+
+    def test_contiguous_shards(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_shards(ProviderList(TEST_JSON), directory, 2)
+            shards = [ProviderList.load_snapshot(path) for path in paths]
+
+        assert [[p["id"] for p in shard.providers] for shard in shards] == [[1, 2], [3]]
+
+class ShardedProviderListTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.counter_path = os.path.join(cls.directory.name, "returned_counts.bin")
+        cls.sharded = ShardedProviderList.build(ProviderList(TEST_JSON),
+                                                os.path.join(cls.directory.name, "shards"),
+                                                shards=2, counter_path=cls.counter_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sharded.close()
+        cls.directory.cleanup()
+
+    # the only test counting providers as returned, so both start from no counts
+    def test_same_results_as_unsharded(self):
+        providers = ProviderList(TEST_JSON)
+        queries = [{"rating": ("gt", 3)}, {"sex": "Female"}, {}, {"rating": ("gt", 3)},
+                   {"birth_date": ("after", "1940-01-01"), "active": False}]
+        expected = [(len(view), view.list(with_returned=True, limit=2))
+                    for view in providers.filter_many(queries, limit=2)]
+
+        assert len(self.sharded) == 3
+        assert self.sharded.filter_many(queries, limit=2) == expected
+
+    def test_counters_per_shard(self):
+        assert os.path.exists(f"{self.counter_path}.shard0")
+        assert os.path.exists(f"{self.counter_path}.shard1")
+
+    def test_shard_errors_raised(self):
+        with self.assertRaises(TypeError):
+            self.sharded.filter({"birth_date": ("at", 1990)})
@@ -0,0 +1,71 @@
+from similarity import SkillSimilarity, skill_tokens, SECONDARY_WEIGHT
+from skill_index import SkillIndex
+from unittest import TestCase
+import numpy as np
+
+class SkillTokensTest(TestCase):
+
+    def test_words_lowercased_once(self):
+        assert skill_tokens("Linux / Unix") == ["linux", "unix"]
+        assert skill_tokens("C++ and C# and c++") == ["c++", "and", "c#"]
+
+class SkillSimilarityTest(TestCase):
+
+    def setUp(self):
+        self.primary = [["Linux / Unix"], ["Java", "Unix"], ["Data Mining"], []]
+        self.secondary = [[], ["Linux"], ["Java"], ["Data Structures"]]
+        self.similarity = SkillSimilarity.from_indexes(SkillIndex.from_column(self.primary),
+                                                       SkillIndex.from_column(self.secondary))
+
+    def dense(self) -> np.ndarray:
+        """the same TF-IDF vectors as dense rows, worked out the long way"""
+
+        vocabulary = self.similarity.vocabulary
+        matrix = np.zeros((len(self.primary), len(vocabulary)))
+        for row in range(len(self.primary)):
+            for (skills, weight) in ((self.primary[row], 1.0), (self.secondary[row], SECONDARY_WEIGHT)):
+                for skill in skills:
+                    for token in skill_tokens(skill):
+                        matrix[row, vocabulary[token]] += weight
+
+        matrix *= np.log((1 + len(self.primary)) / (1 + (matrix > 0).sum(axis=0))) + 1
+        return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def test_cosine_same_as_dense(self):
+        (vector, unknown) = self.similarity.query(["Unix"], ["Data"])
+        query = np.zeros(len(self.similarity.vocabulary))
+        for (token, weight) in vector.items():
+            query[token] = weight
+
+        assert unknown == []
+        assert np.allclose(self.similarity.scores(vector), self.dense() @ query)
+
+    def test_top_most_similar_first(self):
+        (vector, _) = self.similarity.query(["Unix"])
+        (rows, scores) = self.similarity.top(vector, None, k=None)
+
+        # row 0 has nothing but linux and unix, row 1 has java as well
+        assert list(rows) == [0, 1]
+        assert scores[0] > scores[1] > 0
+
+    def test_top_within_rows_and_live(self):
+        (vector, _) = self.similarity.query(["Data", "Java"])
+        live = np.array([True, False, True, True])
+
+        assert list(self.similarity.top(vector, None, k=2, live=live)[0]) == [2, 3]
+        assert list(self.similarity.top(vector, np.array([1, 3]), k=None)[0]) == [1, 3]
+        assert list(self.similarity.top(vector, None, k=None, exclude=2)[0]) == [1, 3]
+
+    def test_unknown_tokens_left_out(self):
+        (vector, unknown) = self.similarity.query(["Cobol", "Java"])
+
+        assert unknown == ["cobol"]
+        assert list(vector.values()) == [1.0]
+
+    def test_cache(self):
+        result = (np.array([1]), np.array([0.5]))
+        self.similarity.cache("key", result)
+
+        assert self.similarity.cached("key") is result
+        assert self.similarity.cached("other") is None
+        assert (self.similarity.hits, self.similarity.misses) == (1, 1)
@@ -0,0 +1,132 @@
+from snapshot import DictionaryColumn, ListColumn, METADATA_FILE
+from providers import ProviderList
+from constants import TEST_JSON
+from unittest import TestCase, mock
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+class DictionaryColumnTest(TestCase):
+
+    def test_encode_round_trip(self):
+        column = DictionaryColumn.encode(np.array(["Ann", "Bo", None, "Ann"], dtype=object))
+        assert list(column.values) == ["Ann", "Bo", None]
+        assert list(column[np.arange(4)]) == ["Ann", "Bo", None, "Ann"]
+        assert list(column[np.array([3, 1])]) == ["Ann", "Bo"]
+
+class ListColumnTest(TestCase):
+
+    def setUp(self):
+        lists = np.empty(4, dtype=object)
+        for row, values in enumerate([["Java", "SQL"], [], ["SQL"], ["Go", "Java", "Rust"]]):
+            lists[row] = values
+        self.lists = lists
+        self.column = ListColumn.encode(lists)
+
+    def test_encode_round_trip(self):
+        assert len(self.column) == 4
+        assert list(self.column.indptr) == [0, 2, 2, 3, 6]
+        assert self.column[np.arange(4)].tolist() == self.lists.tolist()
+
+    def test_only_rows_asked_for(self):
+        assert self.column[np.array([3, 0])].tolist() == [["Go", "Java", "Rust"], ["Java", "SQL"]]
+        assert self.column[1:3].tolist() == [[], ["SQL"]]
+        assert self.column[np.zeros(0, dtype=np.int64)].tolist() == []
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "providers.snapshot")
+        self.providers = ProviderList(TEST_JSON).save_snapshot(self.path)
+        self.loaded = ProviderList.load_snapshot(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_same_providers(self):
+        assert self.loaded.providers == self.providers.providers
+        pd.testing.assert_frame_equal(self.loaded.df, self.providers.df)
+
+    def test_columns_are_memory_mapped(self):
+        assert isinstance(self.loaded.store.column("rating"), np.memmap)
+        assert isinstance(self.loaded.primary_skills.indices, np.memmap)
+        assert not self.loaded.store.column("rating").flags.writeable
+
+    def test_same_indexes(self):
+        for skills in ("primary_skills", "secondary_skills"):
+            saved = getattr(self.providers, skills)
+            loaded = getattr(self.loaded, skills)
+            assert loaded.vocabulary == saved.vocabulary
+            assert list(loaded.indptr) == list(saved.indptr)
+            assert list(loaded.indices) == list(saved.indices)
+
+        for trait, index in self.providers.store.string_indexes.items():
+            loaded = self.loaded.store.string_indexes[trait]
+            assert loaded.vocabulary == index.vocabulary
+            assert isinstance(loaded.value_counts, np.memmap)
+            assert list(loaded.value_counts) == list(index.value_counts)
+            assert {value: list(codes) for value, codes in loaded.exact.items()} == \
+                   {value: list(codes) for value, codes in index.exact.items()}
+        assert list(self.loaded.ranker.rating_rank) == list(self.providers.ranker.rating_rank)
+
+    def test_similarity_matrix_mapped(self):
+        similarity = self.loaded.store._skill_similarity
+        assert isinstance(similarity.rows, np.memmap)
+        assert similarity.vocabulary == self.providers.store.skill_similarity().vocabulary
+
+        skills = ["Secure Coding", "Unix"]
+        expected = self.providers.view().similar_to_skills(skills, count_returned=False).list()
+        assert self.loaded.view().similar_to_skills(skills, count_returned=False).list() == expected
+
+    def test_categoricals_share_mapped_codes(self):
+        country = self.loaded.store.column("country")
+        assert isinstance(country, pd.Categorical)
+        assert not country.codes.flags.writeable
+
+    def test_trigram_postings_loaded(self):
+        with mock.patch("search_index.LOW_CARDINALITY", 0):
+            providers = ProviderList(TEST_JSON).save_snapshot(self.path)
+        loaded = ProviderList.load_snapshot(self.path)
+
+        for trait, index in providers.store.string_indexes.items():
+            assert index.trigrams
+            postings = loaded.store.string_indexes[trait].trigrams
+            assert {trigram: list(codes) for trigram, codes in postings.items()} == \
+                   {trigram: list(codes) for trigram, codes in index.trigrams.items()}
+
+        for traits in ({"company": "sons"}, {"last_name": "test"}):
+            assert len(loaded.view().filter(traits)) == 1
+            assert loaded.view().filter(traits).list() == providers.view().filter(traits).list()
+
+    def test_same_filter_and_rank(self):
+        traits = {"primary_skills": ["Secure Coding Practices"], "country": "test", "active": True}
+        expected = self.providers.view().filter(traits).rank().list(with_returned=True)
+        assert self.loaded.view().filter(traits).rank().list(with_returned=True) == expected
+
+    def test_same_sort(self):
+        columns = ["first_name", "primary_skills"]
+        expected = self.providers.view().sort(columns, [True, False]).list()
+        assert self.loaded.view().sort(columns, [True, False]).list() == expected
+
+    def test_load_report(self):
+        assert self.loaded.load_report.rows == len(self.providers)
+        assert self.loaded.load_report.chunks == 0
+
+    def test_save_replaces_snapshot(self):
+        self.loaded.save_snapshot(self.path)
+        assert ProviderList.load_snapshot(self.path).providers == self.providers.providers
+        assert sorted(os.listdir(self.directory.name)) == ["providers.snapshot"]
+
+    def test_version_checked(self):
+        metadata_path = os.path.join(self.path, METADATA_FILE)
+        with open(metadata_path) as metadata_file:
+            metadata = json.load(metadata_file)
+        metadata["version"] = 0
+        with open(metadata_path, "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+
+        with self.assertRaises(ValueError):
+            ProviderList.load_snapshot(self.path)